@@ -0,0 +1,79 @@
+#ifndef CounterRNG_h
+#define CounterRNG_h
+
+#include <cstdint>
+#include <cmath>
+#include <cstring>
+#include <array>
+using namespace std;
+
+// Counter-based random numbers (Philox4x32-10)
+// J. K. Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC11 (2011)
+// A random number is a pure function of a key and a counter, there is no state to seed or to share between threads.
+// Keys and counters are built from (run, lumi, event, object index, purpose),
+// so the same object gets the same random numbers in every systematic rerun and in any event order.
+namespace CounterRNG {
+    typedef array<uint32_t, 4> Counter;
+    typedef array<uint32_t, 2> Key;
+
+    inline void mulhilo(uint32_t a, uint32_t b, uint32_t &hi, uint32_t &lo) {
+        const uint64_t product = uint64_t(a) * uint64_t(b);
+        hi = uint32_t(product >> 32);
+        lo = uint32_t(product);
+    }
+
+    inline Counter Philox(Counter ctr, Key key) {
+        constexpr uint32_t M0 = 0xD2511F53, M1 = 0xCD9E8D57;
+        constexpr uint32_t W0 = 0x9E3779B9, W1 = 0xBB67AE85;
+        for (int round = 0; round < 10; round++) {
+            uint32_t hi0, lo0, hi1, lo1;
+            mulhilo(M0, ctr[0], hi0, lo0);
+            mulhilo(M1, ctr[2], hi1, lo1);
+            ctr = {hi1 ^ ctr[1] ^ key[0], lo1, hi0 ^ ctr[3] ^ key[1], lo0};
+            key[0] += W0;
+            key[1] += W1;
+        }
+        return ctr;
+    }
+
+    // uniform in the open interval (0, 1) from 53 random bits
+    inline double toUniform(uint32_t hi, uint32_t lo) {
+        const uint64_t bits = (uint64_t(hi) << 32 | lo) >> 11;
+        return (double(bits) + 0.5) * 0x1p-53;
+    }
+
+    // 64 bit stream identifier of one object in one event, used as the key of all its draws
+    inline uint64_t Stream(uint32_t run, uint32_t lumi, uint64_t event, uint32_t index, uint32_t purpose) {
+        const Counter out = Philox({uint32_t(event), uint32_t(event >> 32), index, purpose}, {run, lumi});
+        return uint64_t(out[0]) << 32 | out[1];
+    }
+
+    // stream identifier from the kinematics of an object, for the calls that do not know the event
+    inline uint64_t Stream(float pt, float eta, float phi, uint32_t purpose) {
+        uint32_t bits[3];
+        static_assert(sizeof(float) == sizeof(uint32_t), "float is not 32 bit");
+        const float values[3] = {pt, eta, phi};
+        for (int i = 0; i < 3; i++) memcpy(&bits[i], &values[i], sizeof(float));
+        const Counter out = Philox({bits[0], bits[1], bits[2], purpose}, {0x5EED, 0});
+        return uint64_t(out[0]) << 32 | out[1];
+    }
+
+    inline Counter Draw(uint64_t stream, uint32_t draw) {
+        return Philox({draw, 0, 0, 0}, {uint32_t(stream), uint32_t(stream >> 32)});
+    }
+
+    inline double Uniform(uint64_t stream, uint32_t draw = 0) {
+        const Counter out = Draw(stream, draw);
+        return toUniform(out[0], out[1]);
+    }
+
+    // Box-Muller with both uniforms from the same counter
+    inline double Gaus(uint64_t stream, double mean = 0., double sigma = 1., uint32_t draw = 0) {
+        const Counter out = Draw(stream, draw);
+        const double u1 = toUniform(out[0], out[1]);
+        const double u2 = toUniform(out[2], out[3]);
+        return mean + sigma * sqrt(-2. * log(u1)) * cos(2. * M_PI * u2);
+    }
+}
+
+#endif
@@ -7,6 +7,8 @@
 #include <memory>
 #include <unordered_map>
 #include <variant>
+#include <functional>
+#include <cstdint>
 // Forward declaration of the implementation class
 class MLHelperImpl;
 
@@ -27,8 +29,13 @@ public:
         TORCHSCRIPT
     };
 
+    // Outputs of one row in batched inference
+    using BatchOutputs = std::unordered_map<std::string, FloatArray>;
+    using BatchCallback = std::function<void(const BatchOutputs &)>;
+
     // Constructor and Destructor
-    MLHelper(const std::string &modelPath, ModelType modelType);
+    // numThreads is the number of intra-op threads of the ONNX session
+    MLHelper(const std::string &modelPath, ModelType modelType, int numThreads = 1);
     ~MLHelper();
 
     // Delete copy constructor and copy assignment operator
@@ -46,6 +53,19 @@ public:
     std::unordered_map<std::string, FloatArray> Run_ONNX_Model(const std::unordered_map<std::string, VariousArray> &inputDataMap, const std::unordered_map<std::string, IntArray> &inputDataShapeMap);
     // FloatArrays Run_TorchScript_Model(const FloatArray &inputData);
 
+    // Batched inference
+    // PushBatch copies one row (the inputs of one sample without the batch dimension) into preallocated buffers.
+    // The model runs once per batchSize rows, or at FlushBatch, through Ort IO binding with reused output buffers.
+    // The outputs of a row are handed to its callback, or kept for GetBatchResult(ticket), for the last memoSize rows.
+    // A row with the same inputs as a row still in the memo, e.g. the same event in a systematic variation
+    // that does not change the inputs, is not evaluated again and gets the ticket of that row.
+    void SetBatchSize(size_t batchSize, size_t memoSize = 0);
+    size_t PushBatch(const std::unordered_map<std::string, VariousArray> &rowData, BatchCallback callback = nullptr);
+    void FlushBatch();
+    bool HasBatchResult(size_t ticket) const;
+    const BatchOutputs &GetBatchResult(size_t ticket) const;
+    void ClearBatchMemo();
+
     // Getter for the model type
     ModelType GetModelType() const;
 
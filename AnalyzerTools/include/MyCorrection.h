@@ -7,10 +7,14 @@
 #include <string>
 #include <unordered_set>
 #include <variant>
+#include <mutex>
+#include <atomic>
+#include <array>
+#include <functional>
 using namespace std;
 
 #include "TString.h"
-#include "TRandom3.h"
+#include "CounterRNG.h"
 #include "TMath.h"
 #include "correction.h"
 #include "RoccoR.h"
@@ -45,8 +49,20 @@ public:
     MyCorrection(const TString &era, const TString &period, const TString &sample, bool IsData,const string &btagging_eff_file = "btaggingEff.json", const string &ctagging_eff_file = "ctaggingEff.json", const string &btagging_R_file = "btaggingR.json", const string &ctagging_R_file = "ctaggingR.json");
     ~MyCorrection();
 
+    // Payloads are loaded on first access. Preload forces loading at startup,
+    // e.g. Preload({"muon", "jerc", "roccor"}) or Preload({"all"})
+    void Preload(const vector<string> &payloads);
+
+    // Event-scoped cache of correction results (GetJER, GetJERSF, GetMuonIDSF),
+    // keyed on the correction, variation and exact inputs. AnalyzerCore clears it at every new entry.
+    // The cache is shared between threads, lookups and inserts hold eventCacheMutex, the evaluation itself does not.
+    inline void SetEventCache(bool use) { lock_guard<mutex> lock(eventCacheMutex); useEventCache = use; eventCache.clear(); }
+    inline void ClearEventCache() { lock_guard<mutex> lock(eventCacheMutex); eventCache.clear(); }
+    void PrintEventCacheStats() const;
+
     // Muon
-    float GetMuonScaleSF(const Muon &muon, const variation syst = variation::nom, const float matched_pt=0) const;
+    // seed is a CounterRNG stream, e.g. AnalyzerCore::GetRandomStream, 0 derives it from the muon kinematics
+    float GetMuonScaleSF(const Muon &muon, const variation syst = variation::nom, const float matched_pt=0, const uint64_t seed=0) const;
     float GetMuonRECOSF(const Muon &muon, const variation syst = variation::nom) const;
     float GetMuonRECOSF(const RVec<Muon> &muons, const variation syst = variation::nom) const;
     inline float GetMuonISOSF(const TString &Muon_ISO_SF_Key, const Muon &muon, const variation syst = variation::nom, const TString &source = "") { return GetMuonIDSF(Muon_ISO_SF_Key, muon, syst); }
@@ -57,7 +73,8 @@ public:
 
     // electron
     float GetElectronScaleUnc(const float scEta, const unsigned char seedGain, const unsigned int runNumber, const float r9, const float pt, const variation syst = variation::nom) const;
-    float GetElectronSmearUnc(const Electron &electron, const variation syst = variation::nom, const unsigned int seed=999) const;
+    // seed is a CounterRNG stream, the same seed gives the same smearing for all variations
+    float GetElectronSmearUnc(const Electron &electron, const variation syst = variation::nom, const uint64_t seed=999) const;
     float GetElectronRECOSF(const float abseta, const float pt, const float phi, const variation syst = variation::nom) const;
     float GetElectronRECOSF(const RVec<Electron> &electrons, const variation syst = variation::nom) const;
     float GetElectronIDSF(const TString &Electron_ID_SF_Key, const float abseta, const float pt, const float phi, const variation syst = variation::nom) const;
@@ -100,6 +117,13 @@ public:
     float GetBTaggingSF(const RVec<Jet> &jets, const JetTagging::JetFlavTagger tagger, const JetTagging::JetFlavTaggerWP wp, const JetTagging::JetTaggingSFMethod method = JetTagging::JetTaggingSFMethod::mujets, const variation syst = variation::nom, const TString &source = "total");
     float GetBTaggingR(const RVec<Jet> &jets, const JetTagging::JetFlavTagger tagger, std::string &processName, const variation syst = variation::nom, const TString &source = "total") const;
     inline float GetBTaggingSF(const RVec<Jet> &jets, const JetTagging::JetTaggingSFMethod method = JetTagging::JetTaggingSFMethod::mujets, const variation syst = variation::nom, const TString &source = "total") { return GetBTaggingSF(jets, global_tagger, global_wp, method, syst, source); }
+    // fixedWP (comb/mujets) event weights for all variations in one pass over the jets.
+    // Keys are "central", the combined variations ("up", "down", "up_correlated", ..., as in GetBTaggingSF with source)
+    // and the same variations applied to heavy or light jets only ("heavy_up", "light_down_uncorrelated", ...).
+    // Efficiencies are tabulated on the JetTagging::GetTaggingEff*Bins binning of MeasureJetTaggingEff,
+    // the table is checked against the efficiency correction when it is built.
+    unordered_map<string, float> GetBTaggingSFVariations(const RVec<Jet> &jets, const JetTagging::JetFlavTagger tagger, const JetTagging::JetFlavTaggerWP wp, const JetTagging::JetTaggingSFMethod method = JetTagging::JetTaggingSFMethod::mujets);
+    inline unordered_map<string, float> GetBTaggingSFVariations(const RVec<Jet> &jets, const JetTagging::JetTaggingSFMethod method = JetTagging::JetTaggingSFMethod::mujets) { return GetBTaggingSFVariations(jets, global_tagger, global_wp, method); }
     inline float GetBTaggingR(const RVec<Jet> &jets, std::string &processName, const variation syst = variation::nom, const TString &source = "total") const { return GetBTaggingR(jets, global_tagger, processName, syst, source); }
 
     // ctagging
@@ -116,8 +140,13 @@ public:
     // JERC
     float GetJER(const float eta, const float pt, const float rho) const;
     float GetJERSF(const float eta, const float pt, const variation syst = variation::nom, const TString &source = "total") const;
+    // For data the JES GT of the period containing runNumber is used, so one instance covers all periods of an era
     float GetJESSF(const float area, const float eta, const float pt, const float phi, const float rho, const unsigned int runNumber) const;
+    // Data period of a run number, the constructor period if the run is not in a known period
+    TString GetPeriodFromRun(const unsigned int runNumber) const;
     float GetJESUncertainty(const float eta, const float pt, const variation syst = variation::nom, const TString &source = "total") const;
+    // Unsigned JES uncertainties for all jets and sources in one call, indexed as [jet][source]
+    RVec<RVec<float>> GetJESUncertaintyMatrix(const RVec<float> &etas, const RVec<float> &pts, const RVec<TString> &sources) const;
     // jerc_fatjet
     
     // jetvetomap
@@ -226,10 +255,10 @@ private:
     inline void SetSample(TString sample) { Sample = sample; }
     inline void setIsData(bool isData) { IsDATA = isData; }
 
-    inline bool loadCorrectionSet(const string &name,
-                                  const string &file,
-                                  unique_ptr<CorrectionSet> &cset,
-                                  bool optional = false) {
+    static inline bool loadCorrectionSet(const string &name,
+                                         const string &file,
+                                         unique_ptr<CorrectionSet> &cset,
+                                         bool optional = false) {
         cout << "[MyCorrection::loadCorrectionSet] " << name << ": " << file << endl;
         try {
             cset = CorrectionSet::from_file(file);
@@ -245,7 +274,7 @@ private:
         }
     }
 
-    inline bool loadRoccoR(const string &file, bool optional=false) {
+    inline bool loadRoccoR(const string &file, bool optional=false) const {
         cout << "[MyCorrection::loadRoccoR] " << file << endl;
         try {
             rc.init(file);
@@ -261,6 +290,129 @@ private:
         }
     }
 
+    // RoccoR is only initialized when a muon scale correction is first requested
+    inline const RoccoR &getRoccoR() const {
+        call_once(rc_once, [this]() { loadRoccoR(txt_roccor, true); });
+        return rc;
+    }
+
+    // Correction set which is read from disk on first access.
+    // call_once makes the first access thread-safe, later accesses only pay for the flag check.
+    class LazyCorrectionSet {
+    public:
+        LazyCorrectionSet() : isOptional(true) {}
+        inline void Configure(const string &name_, const string &file_, bool optional_) {
+            name = name_;
+            file = file_;
+            isOptional = optional_;
+        }
+        inline const CorrectionSet *get() const {
+            call_once(once, [this]() { loadCorrectionSet(name, file, cset, isOptional); });
+            return cset.get();
+        }
+        inline const CorrectionSet *operator->() const {
+            const CorrectionSet *ptr = get();
+            if (!ptr) {
+                throw runtime_error("[MyCorrection::LazyCorrectionSet] " + name + " is not available (" + file + ")");
+            }
+            return ptr;
+        }
+        explicit inline operator bool() const { return get() != nullptr; }
+        inline const string &GetName() const { return name; }
+
+    private:
+        string name;
+        string file;
+        bool isOptional;
+        mutable once_flag once; //!
+        mutable unique_ptr<CorrectionSet> cset; //!
+    };
+
+    // fixedWP b-tagging engine: WP cut, SF handles and a dense efficiency table per tagger/WP/method
+    struct BTaggingFixedWPTable {
+        float cut;
+        string wpStr;
+        correction::Correction::Ref cset_heavy;
+        correction::Correction::Ref cset_light;
+        correction::Correction::Ref cset_eff;
+        vector<float> etabins;
+        vector<float> ptbins;
+        // efficiency per flavour (0: light, 1: c, 2: b), indexed as ieta*(ptbins.size()-1)+ipt
+        array<vector<float>, 3> eff;
+        // false if the efficiency file has another binning for the flavour, evaluated per jet on cset_eff instead
+        array<bool, 3> tabulated;
+    };
+    const BTaggingFixedWPTable &getBTaggingFixedWPTable(const JetTagging::JetFlavTagger tagger, const JetTagging::JetFlavTaggerWP wp, const JetTagging::JetTaggingSFMethod method);
+    // efficiency from the table, jets outside of the table range are evaluated on the correction
+    float getBTaggingFixedWPEff(const BTaggingFixedWPTable &table, const int flav, const float abseta, const float pt);
+    unordered_map<string, BTaggingFixedWPTable> btagFixedWPTables; //!
+    const vector<string> btagFixedWPSysts = {"up", "down", "up_correlated", "down_correlated", "up_uncorrelated", "down_uncorrelated"};
+
+    // Run-range index of the data periods with their own corrections, sorted by the first run
+    struct RunRange {
+        unsigned int first;
+        unsigned int last;
+        TString period;
+        string JES_GT;
+    };
+    vector<RunRange> dataRunRanges; //!
+    void setDataRunRanges();
+    const RunRange *findRunRange(const unsigned int runNumber) const;
+    string getJESDataGT(const TString &era, const TString &period) const;
+
+    // Event cache
+    enum EventCacheSlot { kCacheJER, kCacheJERSF, kCacheMuonIDSF, kNCacheSlots };
+    struct EventCacheKey {
+        int slot;
+        int syst;
+        size_t tag;
+        float x0, x1, x2;
+        inline bool operator==(const EventCacheKey &other) const {
+            return slot == other.slot && syst == other.syst && tag == other.tag &&
+                   x0 == other.x0 && x1 == other.x1 && x2 == other.x2;
+        }
+    };
+    struct EventCacheKeyHash {
+        inline size_t operator()(const EventCacheKey &key) const {
+            size_t h = key.tag ^ (size_t(key.slot) << 8) ^ size_t(key.syst);
+            for (const float x : {key.x0, key.x1, key.x2}) {
+                h ^= hash<float>()(x) + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2);
+            }
+            return h;
+        }
+    };
+    // guard against unbounded growth when nobody clears the cache
+    static constexpr size_t kMaxEventCacheSize = 1 << 16;
+    bool useEventCache = true;
+    mutable unordered_map<EventCacheKey, float, EventCacheKeyHash> eventCache; //!
+    mutable mutex eventCacheMutex; //!
+    mutable array<atomic<unsigned long>, kNCacheSlots> eventCacheHits = {}; //!
+    mutable array<atomic<unsigned long>, kNCacheSlots> eventCacheMisses = {}; //!
+
+    template <typename Func>
+    inline float cachedEvaluate(EventCacheSlot slot, size_t tag, variation syst, float x0, float x1, float x2, Func &&evaluate) const {
+        if (!useEventCache) return evaluate();
+        const EventCacheKey key = {slot, static_cast<int>(syst), tag, x0, x1, x2};
+        {
+            lock_guard<mutex> lock(eventCacheMutex);
+            auto it = eventCache.find(key);
+            if (it != eventCache.end()) {
+                eventCacheHits[slot].fetch_add(1, memory_order_relaxed);
+                return it->second;
+            }
+        }
+        eventCacheMisses[slot].fetch_add(1, memory_order_relaxed);
+        // two threads missing the same key both evaluate it, the result is the same
+        const float result = evaluate();
+        lock_guard<mutex> lock(eventCacheMutex);
+        if (eventCache.size() >= kMaxEventCacheSize) eventCache.clear();
+        eventCache.emplace(key, result);
+        return result;
+    }
+
+    // JES uncertainty corrections are resolved once per source and reused afterwards
+    const correction::Correction::Ref &getJESUncertaintyHandle(const TString &source) const;
+
     inline bool isInputInCorrection(const string &key, const correction::Correction::Ref &cset) const {
         vector<string> inputs;
         for (const auto &input : cset->inputs()) {
@@ -279,34 +431,34 @@ private:
     TString Sample;
     bool IsDATA;
 
-    unique_ptr<CorrectionSet> cset_muon;
-    unique_ptr<CorrectionSet> cset_muon_trig_eff;
-    unique_ptr<CorrectionSet> cset_puWeights;
-    unique_ptr<CorrectionSet> cset_btagging;
-    unique_ptr<CorrectionSet> cset_ctagging;
-    unique_ptr<CorrectionSet> cset_btagging_eff;
-    unique_ptr<CorrectionSet> cset_ctagging_eff;
-    unique_ptr<CorrectionSet> cset_btagging_R;
-    unique_ptr<CorrectionSet> cset_ctagging_R;
-    unique_ptr<CorrectionSet> cset_electron;
-    unique_ptr<CorrectionSet> cset_electron_hlt;
-    unique_ptr<CorrectionSet> cset_electron_variation;
-    unique_ptr<CorrectionSet> cset_photon;
-    unique_ptr<CorrectionSet> cset_jerc;
-    unique_ptr<CorrectionSet> cset_jerc_fatjet;
-    unique_ptr<CorrectionSet> cset_jetvetomap;
-    unique_ptr<CorrectionSet> cset_jmar;
-    unique_ptr<CorrectionSet> cset_met;
+    LazyCorrectionSet cset_muon; //!
+    LazyCorrectionSet cset_muon_trig_eff; //!
+    LazyCorrectionSet cset_puWeights; //!
+    LazyCorrectionSet cset_btagging; //!
+    LazyCorrectionSet cset_ctagging; //!
+    LazyCorrectionSet cset_btagging_eff; //!
+    LazyCorrectionSet cset_ctagging_eff; //!
+    LazyCorrectionSet cset_btagging_R; //!
+    LazyCorrectionSet cset_ctagging_R; //!
+    LazyCorrectionSet cset_electron; //!
+    LazyCorrectionSet cset_electron_hlt; //!
+    LazyCorrectionSet cset_electron_variation; //!
+    LazyCorrectionSet cset_photon; //!
+    LazyCorrectionSet cset_jerc; //!
+    LazyCorrectionSet cset_jerc_fatjet; //!
+    LazyCorrectionSet cset_jetvetomap; //!
+    LazyCorrectionSet cset_jmar; //!
+    LazyCorrectionSet cset_met; //!
 
     // custom
-    unique_ptr<CorrectionSet> cset_muon_TopHNT_idsf;
-    unique_ptr<CorrectionSet> cset_muon_TopHNT_dblmu_leg1_eff;
-    unique_ptr<CorrectionSet> cset_muon_TopHNT_dblmu_leg2_eff;
-    unique_ptr<CorrectionSet> cset_muon_TopHNT_emu_leg1_eff;
-    unique_ptr<CorrectionSet> cset_muon_TopHNT_emu_leg2_eff;
-    unique_ptr<CorrectionSet> cset_electron_TopHNT_idsf;
-    unique_ptr<CorrectionSet> cset_electron_TopHNT_emu_leg1_eff;
-    unique_ptr<CorrectionSet> cset_electron_TopHNT_emu_leg2_eff;
+    LazyCorrectionSet cset_muon_TopHNT_idsf; //!
+    LazyCorrectionSet cset_muon_TopHNT_dblmu_leg1_eff; //!
+    LazyCorrectionSet cset_muon_TopHNT_dblmu_leg2_eff; //!
+    LazyCorrectionSet cset_muon_TopHNT_emu_leg1_eff; //!
+    LazyCorrectionSet cset_muon_TopHNT_emu_leg2_eff; //!
+    LazyCorrectionSet cset_electron_TopHNT_idsf; //!
+    LazyCorrectionSet cset_electron_TopHNT_emu_leg1_eff; //!
+    LazyCorrectionSet cset_electron_TopHNT_emu_leg2_eff; //!
 
     unordered_map<string, string> MUO_keys;
     unordered_map<string, string> LUM_keys;
@@ -317,8 +469,14 @@ private:
     unordered_map<string, string> JME_vetomap_keys;
     unordered_map<string, string> JME_PILEUP_keys;
     unordered_map<string, string> JME_MET_keys;
+    mutable unordered_map<string, correction::Correction::Ref> JME_JES_unc_handles; //!
+    mutable mutex JME_JES_unc_handles_mutex; //!
     
-    RoccoR rc;
+    string txt_roccor;
+    mutable RoccoR rc; //!
+    mutable once_flag rc_once; //!
+    // payload name -> lazily loaded correction set, used by Preload
+    unordered_map<string, LazyCorrectionSet*> csetRegistry; //!
 
     // All POG choose different string for the systematics, so we need to convert the enum to the string....
     // Here I implement every single function instead of a general one, because heavy use of switch-case might be slow.
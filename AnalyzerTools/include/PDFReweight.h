@@ -54,6 +54,50 @@ public:
         NewPDFAlphaSDown = newPDFAlphaSDown;
         NewPDFAlphaSUp = newPDFAlphaSUp;
     }
+
+    // Vectorized reweighting
+    // All members of the error set are evaluated in one call, the production PDF and the central
+    // new PDF are evaluated once per event and the weights are returned in an array reused between events.
+    // Calls with the same event kinematics return the cached result.
+    float GetCentralReweight(int id1, int id2, float x1, float x2, float scalePDF);
+    const RVec<float>& GetErrorSetReweights(int id1, int id2, float x1, float x2, float scalePDF, const RVec<float> &lheWeights = {});
+
+    // Cross-check against LHEPdfWeight (w_i/w_0 of the generator PDF set)
+    // Over the first nCheckEvents events, member i of the error set is compared to lheWeights[firstMember+i]/lheWeights[0].
+    // If all agree within tolerance, the error set weights are taken from lheWeights for the rest of the job,
+    // scaled by the central reweight, so LHAPDF is only called for the central members.
+    inline void SetLHECrossCheck(bool enable, int firstMember = 1, float tolerance = 0.01, int nCheckEvents = 100) {
+        lheCheck = enable;
+        lheFirstMember = firstMember;
+        lheTolerance = tolerance;
+        lheCheckEvents = nCheckEvents;
+        lheCheckedEvents = 0;
+        lheMaxDeviation = 0.;
+        lheCompatible = false;
+    }
+    inline bool UsesLHEWeights() const { return lheCompatible; }
+
+private:
+    bool setEvent(int id1, int id2, float x1, float x2, float scalePDF);
+    void evaluateErrorSet();
+    float evaluate(LHAPDF::PDF *pdf) const;
+
+    // event cache
+    bool evt_valid = false;
+    int evt_id1 = 0, evt_id2 = 0;
+    float evt_x1 = 0., evt_x2 = 0., evt_scalePDF = 0.;
+    float evt_prod = 1.;
+    float evt_central = 1.;
+    bool evt_errorset_done = false;
+    RVec<float> errorset_weights;
+
+    bool lheCheck = false;
+    int lheFirstMember = 1;
+    float lheTolerance = 0.01;
+    int lheCheckEvents = 100;
+    int lheCheckedEvents = 0;
+    float lheMaxDeviation = 0.;
+    bool lheCompatible = false;
 };
 
 #endif
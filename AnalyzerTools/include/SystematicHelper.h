@@ -123,7 +123,12 @@ public:
     std::vector<std::string> get_targets_from_name(const std::string &syst_name);
     std::vector<std::string> get_sources_from_name(const std::string &syst_name);
     MyCorrection::variation get_variation_from_name(const std::string &syst_name);
+    // String keyed view of calculateWeightVector
     std::unordered_map<std::string, float> calculateWeight(bool dry_run = false);
+    // Fills a preallocated vector with the weights of the current iteration, the names are given by getWeightNames.
+    // The YAML configuration is compiled to integer indexed programs in the constructor, no map is touched per event.
+    const std::vector<float>& calculateWeightVector(bool dry_run = false);
+    inline const std::vector<std::string>& getWeightNames() const { return *current_weight_names; }
     inline float safe_divide(float numerator, float denominator)
     {
         if (abs(denominator) < 1e-8)
@@ -134,31 +139,61 @@ public:
     }
 
 private:
+    // one entry per systematic, evaluated in configuration order
+    struct COMPILED_SYST
+    {
+        int kind; // 0: no weight function (dedicated sample or evtLoopAgain), 1: one-sided, 2: two-sided
+        int target_slot;
+        int syst_slot;
+        TString source;
+        std::function<float(MyCorrection::variation, TString)> weight_function;
+        std::function<float()> weight_function_onesided;
+    };
+    // nominal weight with the nominal of each target replaced by the variation of the slot: (target slot, variation slot)
+    struct WEIGHT_PRODUCT
+    {
+        std::string name_up;
+        std::string name_down;
+        std::vector<std::pair<int, int>> factors;
+    };
+
     std::string central_name = "Central";
     void checkBadSystematics();
     void make_Iter_obj_EvtLoopAgain();
     void make_map_dedicatedSample();
     bool IsDedicatedSample();
     
-    std::unordered_map<std::string, float> calculateWeight_central_case();
-    std::unordered_map<std::string, float> calculateWeight_non_central_case();
+    void compileWeights();
+    int getWeightSlot(const std::string &name);
+    void calculateWeight_central_case();
+    void calculateWeight_non_central_case();
 
     std::vector<SYST> systematics;
     std::unordered_map<std::string, CORRELATION> correlations;
-    std::unordered_map<std::string, std::function<float(MyCorrection::variation, TString)>> weight_functions;
-    std::unordered_map<std::string, std::function<float()>> weight_functions_onesided;
 
     std::vector<Iter_obj> systematics_evtLoopAgain;
     std::vector<std::string> systematics_weightOnly;
     unordered_map<std::string, std::string> map_dedicatesamplekey_systname;
     
-    std::unordered_map<std::string, float> weight_map_nominal;
-    std::unordered_map<std::string, float> weight_map_up;
-    std::unordered_map<std::string, float> weight_map_down;
+    // weights by slot, a slot is a target or systematic name, values are kept between events
+    // compiled in the constructor, not streamed
+    std::unordered_map<std::string, int> weight_slots; //!
+    std::vector<float> weight_values_nominal; //!
+    std::vector<float> weight_values_up; //!
+    std::vector<float> weight_values_down; //!
+    std::vector<COMPILED_SYST> compiled_systs; //!
+    std::vector<int> nominal_target_slots; //!
+    std::vector<WEIGHT_PRODUCT> central_products; //!
+    std::unordered_map<std::string, WEIGHT_PRODUCT> non_central_products; //!
+    std::string dedicated_weight_name; //!
+    std::vector<std::string> central_weight_names; //!
+    std::vector<std::string> non_central_weight_names; //!
+    const std::vector<std::string> *current_weight_names = &central_weight_names; //!
+    std::vector<float> weight_values; //!
     std::unordered_map<MyCorrection::variation, std::string> variation_prefix; 
 
     bool isDedicatedSample;
-    bool weight_functions_assigned;
+    bool weight_functions_assigned = false;
     std::string sample;
     std::string Era;
     Internal_Iter_obj current_Iter_obj;
@@ -6,14 +6,17 @@
 #include <unordered_map>
 #include <stdexcept>
 #include <iostream>
+#include <deque>
+#include <string_view>
+#include <cstring>
 
 // Implementation class definition
 class MLHelperImpl
 {
 public:
     // Constructor
-    MLHelperImpl(const std::string &modelPath, MLHelper::ModelType modelType)
-        : modelPath_(modelPath), modelType_(modelType), env_(ORT_LOGGING_LEVEL_WARNING, "MLHelper")
+    MLHelperImpl(const std::string &modelPath, MLHelper::ModelType modelType, int numThreads)
+        : modelPath_(modelPath), modelType_(modelType), numThreads_(numThreads), env_(ORT_LOGGING_LEVEL_WARNING, "MLHelper")
     {
         if (modelType_ == MLHelper::ModelType::ONNX)
         {
@@ -46,7 +49,7 @@ public:
         try
         {
             Ort::SessionOptions sessionOptions;
-            sessionOptions.SetIntraOpNumThreads(1);
+            sessionOptions.SetIntraOpNumThreads(numThreads_);
             sessionOptions.SetGraphOptimizationLevel(GraphOptimizationLevel::ORT_ENABLE_ALL);
             session_ = std::make_unique<Ort::Session>(env_, modelPath.c_str(), sessionOptions);
 
@@ -68,6 +71,7 @@ public:
                 Ort::TypeInfo typeInfo = session_->GetInputTypeInfo(i);
                 auto tensorInfo = typeInfo.GetTensorTypeAndShapeInfo();
                 inputShapes_[inputNodeNames_.back()] = tensorInfo.GetShape();
+                inputTypes_[inputNodeNames_.back()] = tensorInfo.GetElementType();
             }
 
             // Get output node names and shapes
@@ -267,6 +271,264 @@ public:
         
     }
 
+    // Batched inference
+    void SetBatchSize(size_t batchSize, size_t memoSize)
+    {
+        if (!onnxModelLoaded_ || !session_)
+        {
+            throw std::runtime_error("[MLHelperImpl::SetBatchSize] ONNX model is not loaded.");
+        }
+        if (batchSize == 0)
+        {
+            throw std::runtime_error("[MLHelperImpl::SetBatchSize] Batch size should be positive.");
+        }
+        if (!batchPending_.empty())
+        {
+            throw std::runtime_error("[MLHelperImpl::SetBatchSize] " + std::to_string(batchPending_.size()) + " rows are not flushed yet.");
+        }
+
+        // a model with a fixed batch dimension always runs with that many rows, the rest is zero padded
+        const int64_t fixedBatch = inputShapes_.at(inputNodeNames_.front()).front();
+        if (fixedBatch > 0 && static_cast<size_t>(fixedBatch) < batchSize)
+        {
+            throw std::runtime_error("[MLHelperImpl::SetBatchSize] The model has a fixed batch dimension of " + std::to_string(fixedBatch));
+        }
+        batchSize_ = batchSize;
+        batchFixed_ = fixedBatch > 0;
+        batchRunSize_ = batchFixed_ ? static_cast<size_t>(fixedBatch) : batchSize;
+        memoSize_ = memoSize > 0 ? memoSize : batchSize;
+
+        // per row shapes and sizes, everything but the batch dimension has to be known
+        batchInputRowShapes_.clear();
+        batchInputRowBytes_.clear();
+        batchInputBuffers_.clear();
+        for (const auto &inputName : inputNodeNames_)
+        {
+            const auto &shape = inputShapes_.at(inputName);
+            std::vector<int64_t> rowShape(shape.begin() + 1, shape.end());
+            size_t rowSize = 1;
+            for (auto dim : rowShape)
+            {
+                if (dim <= 0)
+                {
+                    throw std::runtime_error("[MLHelperImpl::SetBatchSize] Input " + inputName + " has a dynamic dimension other than the batch dimension.");
+                }
+                rowSize *= static_cast<size_t>(dim);
+            }
+            batchInputRowShapes_[inputName] = rowShape;
+            batchInputRowBytes_[inputName] = rowSize * elementBytes(inputTypes_.at(inputName), inputName);
+            batchInputBuffers_[inputName].assign(batchRunSize_ * batchInputRowBytes_[inputName], 0);
+        }
+        batchOutputRowSizes_.clear();
+        batchOutputBuffers_.clear();
+        for (const auto &outputName : outputNodeNames_)
+        {
+            const auto &shape = outputShapes_.at(outputName);
+            int64_t rowSize = 1;
+            for (size_t i = 1; i < shape.size(); i++)
+            {
+                // dynamic output dimensions are resolved after the run
+                rowSize = shape[i] > 0 && rowSize > 0 ? rowSize * shape[i] : -1;
+            }
+            batchOutputRowSizes_[outputName] = rowSize;
+            if (rowSize > 0) batchOutputBuffers_[outputName].assign(batchRunSize_ * rowSize, 0.f);
+        }
+        batchBinding_ = std::make_unique<Ort::IoBinding>(*session_);
+        batchBoundRows_ = 0;
+        ClearBatchMemo();
+    }
+
+    size_t PushBatch(const std::unordered_map<std::string, VariousArray> &rowData, MLHelper::BatchCallback callback)
+    {
+        if (batchSize_ == 0)
+        {
+            throw std::runtime_error("[MLHelperImpl::PushBatch] Call SetBatchSize before pushing rows.");
+        }
+
+        // serialize the row, it is both the memo key and what is copied to the input buffers
+        batchRowBytes_.clear();
+        for (const auto &inputName : inputNodeNames_)
+        {
+            auto it = rowData.find(inputName);
+            if (it == rowData.end())
+            {
+                throw std::runtime_error("[MLHelperImpl::PushBatch] Missing input data for node: " + inputName);
+            }
+            std::visit([&](auto &&data){
+                using T = std::decay_t<decltype(data)>;
+                const size_t nbytes = data.size() * sizeof(typename T::value_type);
+                if (nbytes != batchInputRowBytes_.at(inputName) || !matchesType<T>(inputTypes_.at(inputName)))
+                {
+                    throw std::runtime_error("[MLHelperImpl::PushBatch] Input data for node '" + inputName +
+                                             "' does not match the model input type or its row size of " +
+                                             std::to_string(batchInputRowBytes_.at(inputName)) + " bytes");
+                }
+                const auto *bytes = reinterpret_cast<const uint8_t *>(data.data());
+                batchRowBytes_.insert(batchRowBytes_.end(), bytes, bytes + nbytes);
+            }, it->second);
+        }
+        const uint64_t hash = std::hash<std::string_view>()(std::string_view(reinterpret_cast<const char *>(batchRowBytes_.data()), batchRowBytes_.size()));
+
+        // memoized row, already evaluated or waiting in the current batch
+        auto range = batchMemo_.equal_range(hash);
+        for (auto it = range.first; it != range.second; ++it)
+        {
+            BatchRow &row = batchRow(it->second);
+            if (row.inputs != batchRowBytes_) continue;
+            if (callback)
+            {
+                if (row.done) callback(row.outputs);
+                else row.callbacks.push_back(std::move(callback));
+            }
+            return it->second;
+        }
+
+        // new row
+        const size_t ticket = batchFirstTicket_ + batchRows_.size();
+        const size_t slot = batchPending_.size();
+        size_t offset = 0;
+        for (const auto &inputName : inputNodeNames_)
+        {
+            const size_t nbytes = batchInputRowBytes_.at(inputName);
+            std::memcpy(batchInputBuffers_[inputName].data() + slot * nbytes, batchRowBytes_.data() + offset, nbytes);
+            offset += nbytes;
+        }
+        batchRows_.emplace_back();
+        BatchRow &row = batchRows_.back();
+        row.inputs = batchRowBytes_;
+        if (callback) row.callbacks.push_back(std::move(callback));
+        batchMemo_.emplace(hash, ticket);
+        batchPending_.push_back(ticket);
+
+        if (batchPending_.size() == batchSize_) FlushBatch();
+        return ticket;
+    }
+
+    void FlushBatch()
+    {
+        if (batchPending_.empty()) return;
+        const size_t nrows = batchPending_.size();
+        const size_t nrun = batchFixed_ ? batchRunSize_ : nrows;
+
+        try
+        {
+            // tensors are views of the preallocated buffers, they only have to be bound again when the number of rows changes
+            if (batchBoundRows_ != nrun)
+            {
+                Ort::MemoryInfo memoryInfo = Ort::MemoryInfo::CreateCpu(OrtArenaAllocator, OrtMemTypeDefault);
+                batchBinding_->ClearBoundInputs();
+                batchBinding_->ClearBoundOutputs();
+                batchTensors_.clear();
+                for (size_t i = 0; i < inputNodeNames_.size(); i++)
+                {
+                    const std::string &inputName = inputNodeNames_[i];
+                    std::vector<int64_t> shape = {static_cast<int64_t>(nrun)};
+                    shape.insert(shape.end(), batchInputRowShapes_[inputName].begin(), batchInputRowShapes_[inputName].end());
+                    batchTensors_.emplace_back(Ort::Value::CreateTensor(memoryInfo, batchInputBuffers_[inputName].data(),
+                                                                        nrun * batchInputRowBytes_[inputName],
+                                                                        shape.data(), shape.size(), inputTypes_[inputName]));
+                    batchBinding_->BindInput(inputNodeNamesChar_[i], batchTensors_.back());
+                }
+                for (size_t i = 0; i < outputNodeNames_.size(); i++)
+                {
+                    const std::string &outputName = outputNodeNames_[i];
+                    const int64_t rowSize = batchOutputRowSizes_[outputName];
+                    if (rowSize > 0)
+                    {
+                        std::vector<int64_t> shape = {static_cast<int64_t>(nrun)};
+                        const auto &modelShape = outputShapes_.at(outputName);
+                        shape.insert(shape.end(), modelShape.begin() + 1, modelShape.end());
+                        batchTensors_.emplace_back(Ort::Value::CreateTensor<float>(memoryInfo, batchOutputBuffers_[outputName].data(),
+                                                                                   nrun * rowSize, shape.data(), shape.size()));
+                        batchBinding_->BindOutput(outputNodeNamesChar_[i], batchTensors_.back());
+                    }
+                    else
+                    {
+                        batchBinding_->BindOutput(outputNodeNamesChar_[i], memoryInfo);
+                    }
+                }
+                batchBoundRows_ = nrun;
+            }
+            // zero padding for a fixed batch dimension
+            for (const auto &inputName : inputNodeNames_)
+            {
+                auto &buffer = batchInputBuffers_[inputName];
+                std::fill(buffer.begin() + nrows * batchInputRowBytes_[inputName], buffer.begin() + nrun * batchInputRowBytes_[inputName], 0);
+            }
+
+            Ort::RunOptions runOptions;
+            session_->Run(runOptions, *batchBinding_);
+
+            std::vector<Ort::Value> outputValues = batchBinding_->GetOutputValues();
+            for (size_t i = 0; i < outputNodeNames_.size(); i++)
+            {
+                const std::string &outputName = outputNodeNames_[i];
+                const float *data = outputValues[i].GetTensorData<float>();
+                const size_t rowSize = outputValues[i].GetTensorTypeAndShapeInfo().GetElementCount() / nrun;
+                for (size_t r = 0; r < nrows; r++)
+                {
+                    batchRow(batchPending_[r]).outputs[outputName].assign(data + r * rowSize, data + (r + 1) * rowSize);
+                }
+            }
+        }
+        catch (const Ort::Exception &e)
+        {
+            throw std::runtime_error("[MLHelperImpl::FlushBatch] Failed to run ONNX model: " + std::string(e.what()));
+        }
+
+        for (const size_t ticket : batchPending_)
+        {
+            BatchRow &row = batchRow(ticket);
+            row.done = true;
+            for (const auto &callback : row.callbacks) callback(row.outputs);
+            row.callbacks.clear();
+        }
+        batchPending_.clear();
+
+        // forget the oldest rows beyond the memo size
+        while (batchRows_.size() > memoSize_)
+        {
+            const BatchRow &row = batchRows_.front();
+            const uint64_t hash = std::hash<std::string_view>()(std::string_view(reinterpret_cast<const char *>(row.inputs.data()), row.inputs.size()));
+            auto range = batchMemo_.equal_range(hash);
+            for (auto it = range.first; it != range.second; ++it)
+            {
+                if (it->second == batchFirstTicket_)
+                {
+                    batchMemo_.erase(it);
+                    break;
+                }
+            }
+            batchRows_.pop_front();
+            batchFirstTicket_++;
+        }
+    }
+
+    bool HasBatchResult(size_t ticket) const
+    {
+        return ticket >= batchFirstTicket_ && ticket < batchFirstTicket_ + batchRows_.size() && batchRows_[ticket - batchFirstTicket_].done;
+    }
+
+    const MLHelper::BatchOutputs &GetBatchResult(size_t ticket) const
+    {
+        if (!HasBatchResult(ticket))
+        {
+            throw std::runtime_error("[MLHelperImpl::GetBatchResult] No result for ticket " + std::to_string(ticket) + ", it is not flushed yet or no longer in the memo.");
+        }
+        return batchRows_[ticket - batchFirstTicket_].outputs;
+    }
+
+    void ClearBatchMemo()
+    {
+        if (!batchPending_.empty())
+        {
+            throw std::runtime_error("[MLHelperImpl::ClearBatchMemo] " + std::to_string(batchPending_.size()) + " rows are not flushed yet.");
+        }
+        batchFirstTicket_ += batchRows_.size();
+        batchRows_.clear();
+        batchMemo_.clear();
+    }
+
     // Getter for model type
     MLHelper::ModelType GetModelType() const
     {
@@ -274,9 +536,46 @@ public:
     }
 
 private:
+    struct BatchRow
+    {
+        std::vector<uint8_t> inputs;
+        MLHelper::BatchOutputs outputs;
+        bool done = false;
+        std::vector<MLHelper::BatchCallback> callbacks;
+    };
+
+    BatchRow &batchRow(size_t ticket)
+    {
+        return batchRows_[ticket - batchFirstTicket_];
+    }
+
+    static size_t elementBytes(ONNXTensorElementDataType type, const std::string &inputName)
+    {
+        switch (type)
+        {
+        case ONNX_TENSOR_ELEMENT_DATA_TYPE_FLOAT:
+            return sizeof(float);
+        case ONNX_TENSOR_ELEMENT_DATA_TYPE_INT32:
+            return sizeof(int);
+        case ONNX_TENSOR_ELEMENT_DATA_TYPE_BOOL:
+            return sizeof(uint8_t);
+        default:
+            throw std::runtime_error("[MLHelperImpl::elementBytes] Unsupported input data type for node '" + inputName + "'.");
+        }
+    }
+
+    template <typename T>
+    static bool matchesType(ONNXTensorElementDataType type)
+    {
+        if constexpr (std::is_same_v<T, FloatArray>) return type == ONNX_TENSOR_ELEMENT_DATA_TYPE_FLOAT;
+        else if constexpr (std::is_same_v<T, IntArray>) return type == ONNX_TENSOR_ELEMENT_DATA_TYPE_INT32;
+        else return type == ONNX_TENSOR_ELEMENT_DATA_TYPE_BOOL;
+    }
+
     // Member variables
     std::string modelPath_;
     MLHelper::ModelType modelType_;
+    int numThreads_ = 1;
 
     // ONNX-related members
     bool onnxModelLoaded_ = false;
@@ -286,9 +585,29 @@ private:
     std::vector<std::string> outputNodeNames_;
     std::unordered_map<std::string, std::vector<int64_t>> inputShapes_;
     std::unordered_map<std::string, std::vector<int64_t>> outputShapes_;
+    std::unordered_map<std::string, ONNXTensorElementDataType> inputTypes_;
     std::vector<const char *> inputNodeNamesChar_;
     std::vector<const char *> outputNodeNamesChar_;
 
+    // Batched inference
+    size_t batchSize_ = 0;
+    size_t batchRunSize_ = 0;
+    bool batchFixed_ = false;
+    size_t memoSize_ = 0;
+    std::unordered_map<std::string, std::vector<int64_t>> batchInputRowShapes_;
+    std::unordered_map<std::string, size_t> batchInputRowBytes_;
+    std::unordered_map<std::string, std::vector<uint8_t>> batchInputBuffers_;
+    std::unordered_map<std::string, int64_t> batchOutputRowSizes_;
+    std::unordered_map<std::string, FloatArray> batchOutputBuffers_;
+    std::unique_ptr<Ort::IoBinding> batchBinding_;
+    std::vector<Ort::Value> batchTensors_;
+    size_t batchBoundRows_ = 0;
+    std::vector<uint8_t> batchRowBytes_;
+    std::deque<BatchRow> batchRows_;
+    size_t batchFirstTicket_ = 0;
+    std::unordered_multimap<uint64_t, size_t> batchMemo_;
+    std::vector<size_t> batchPending_;
+
     // TorchScript-related members
     bool torchScriptModelLoaded_ = false;
     // torch::jit::script::Module module_;
@@ -297,8 +616,8 @@ private:
 // MLHelper Class Method Implementations
 
 // Constructor
-MLHelper::MLHelper(const std::string &modelPath, ModelType modelType)
-    : pImpl(std::make_unique<MLHelperImpl>(modelPath, modelType))
+MLHelper::MLHelper(const std::string &modelPath, ModelType modelType, int numThreads)
+    : pImpl(std::make_unique<MLHelperImpl>(modelPath, modelType, numThreads))
 {
 }
 
@@ -323,6 +642,37 @@ std::unordered_map<std::string, FloatArray> MLHelper::Run_ONNX_Model(const std::
     return pImpl->Run_ONNX_Model(inputDataMap, inputDataShapeMap);
 }
 
+// Batched inference
+void MLHelper::SetBatchSize(size_t batchSize, size_t memoSize)
+{
+    pImpl->SetBatchSize(batchSize, memoSize);
+}
+
+size_t MLHelper::PushBatch(const std::unordered_map<std::string, VariousArray> &rowData, BatchCallback callback)
+{
+    return pImpl->PushBatch(rowData, std::move(callback));
+}
+
+void MLHelper::FlushBatch()
+{
+    pImpl->FlushBatch();
+}
+
+bool MLHelper::HasBatchResult(size_t ticket) const
+{
+    return pImpl->HasBatchResult(ticket);
+}
+
+const MLHelper::BatchOutputs &MLHelper::GetBatchResult(size_t ticket) const
+{
+    return pImpl->GetBatchResult(ticket);
+}
+
+void MLHelper::ClearBatchMemo()
+{
+    pImpl->ClearBatchMemo();
+}
+
     // Get Model Type
 MLHelper::ModelType MLHelper::GetModelType() const
 {
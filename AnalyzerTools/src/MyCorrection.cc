@@ -10,42 +10,61 @@ MyCorrection::MyCorrection(const TString &era, const TString &period, const TStr
     setIsData(IsData);
 
     EraConfig config = GetEraConfig(era, btagging_eff_file, ctagging_eff_file, btagging_R_file, ctagging_R_file);
-    struct CorrectionInfo {
-        string name;
-        string path;  
-        unique_ptr<CorrectionSet> &cset;
-        bool isOptional;
-    };
-
-    // load correction sets
-    loadCorrectionSet("muon SF", config.json_muon, cset_muon, false);
-    loadCorrectionSet("puWeights", config.json_puWeights, cset_puWeights, false);
-    loadCorrectionSet("btagging", config.json_btagging, cset_btagging, false);
-    loadCorrectionSet("ctagging", config.json_ctagging, cset_ctagging, false);
-    loadCorrectionSet("btagging eff", config.json_btagging_eff, cset_btagging_eff, false);
-    loadCorrectionSet("ctagging eff", config.json_ctagging_eff, cset_ctagging_eff, false);
-    loadCorrectionSet("electron", config.json_electron, cset_electron, false);
-    loadCorrectionSet("electron variation", config.json_electron_variation, cset_electron_variation, false);
-    loadCorrectionSet("photon", config.json_photon, cset_photon, false);
-    loadCorrectionSet("jerc", config.json_jerc, cset_jerc, false);
-    loadCorrectionSet("jerc_fatjet", config.json_jerc_fatjet, cset_jerc_fatjet, false);
-    loadCorrectionSet("jetvetomap", config.json_jetvetomap, cset_jetvetomap, false);
+    // correction sets are only registered here, the files are read on first access
+    cset_muon.Configure("muon SF", config.json_muon, false);
+    cset_puWeights.Configure("puWeights", config.json_puWeights, false);
+    cset_btagging.Configure("btagging", config.json_btagging, false);
+    cset_ctagging.Configure("ctagging", config.json_ctagging, false);
+    cset_btagging_eff.Configure("btagging eff", config.json_btagging_eff, false);
+    cset_ctagging_eff.Configure("ctagging eff", config.json_ctagging_eff, false);
+    cset_electron.Configure("electron", config.json_electron, false);
+    cset_electron_variation.Configure("electron variation", config.json_electron_variation, false);
+    cset_photon.Configure("photon", config.json_photon, false);
+    cset_jerc.Configure("jerc", config.json_jerc, false);
+    cset_jerc_fatjet.Configure("jerc_fatjet", config.json_jerc_fatjet, false);
+    cset_jetvetomap.Configure("jetvetomap", config.json_jetvetomap, false);
     // Optional files
-    loadRoccoR(config.txt_roccor, true);
-    loadCorrectionSet("jmar", config.json_jmar, cset_jmar, true);
-    loadCorrectionSet("muon trig eff", config.json_muon_trig_eff, cset_muon_trig_eff, true);
-    loadCorrectionSet("electron hlt", config.json_electron_hlt, cset_electron_hlt, true);
-    loadCorrectionSet("met", config.json_met, cset_met, true);
-    loadCorrectionSet("btagging R", config.json_btagging_R, cset_btagging_R, true);
-    loadCorrectionSet("ctagging R", config.json_ctagging_R, cset_ctagging_R, true);
-    loadCorrectionSet("muon TopHNT idsf", config.json_muon_TopHNT_idsf, cset_muon_TopHNT_idsf, true);
-    loadCorrectionSet("muon TopHNT dblmu leg1 eff", config.json_muon_TopHNT_dblmu_leg1_eff, cset_muon_TopHNT_dblmu_leg1_eff, true);
-    loadCorrectionSet("muon TopHNT dblmu leg2 eff", config.json_muon_TopHNT_dblmu_leg2_eff, cset_muon_TopHNT_dblmu_leg2_eff, true);
-    loadCorrectionSet("muon TopHNT emu leg1 eff", config.json_muon_TopHNT_emu_leg1_eff, cset_muon_TopHNT_emu_leg1_eff, true);
-    loadCorrectionSet("muon TopHNT emu leg2 eff", config.json_muon_TopHNT_emu_leg2_eff, cset_muon_TopHNT_emu_leg2_eff, true);
-    loadCorrectionSet("electron TopHNT idsf", config.json_electron_TopHNT_idsf, cset_electron_TopHNT_idsf, true);
-    loadCorrectionSet("electron TopHNT emu leg1 eff", config.json_electron_TopHNT_emu_leg1_eff, cset_electron_TopHNT_emu_leg1_eff, true);
-    loadCorrectionSet("electron TopHNT emu leg2 eff", config.json_electron_TopHNT_emu_leg2_eff, cset_electron_TopHNT_emu_leg2_eff, true);
+    txt_roccor = config.txt_roccor;
+    cset_jmar.Configure("jmar", config.json_jmar, true);
+    cset_muon_trig_eff.Configure("muon trig eff", config.json_muon_trig_eff, true);
+    cset_electron_hlt.Configure("electron hlt", config.json_electron_hlt, true);
+    cset_met.Configure("met", config.json_met, true);
+    cset_btagging_R.Configure("btagging R", config.json_btagging_R, true);
+    cset_ctagging_R.Configure("ctagging R", config.json_ctagging_R, true);
+    cset_muon_TopHNT_idsf.Configure("muon TopHNT idsf", config.json_muon_TopHNT_idsf, true);
+    cset_muon_TopHNT_dblmu_leg1_eff.Configure("muon TopHNT dblmu leg1 eff", config.json_muon_TopHNT_dblmu_leg1_eff, true);
+    cset_muon_TopHNT_dblmu_leg2_eff.Configure("muon TopHNT dblmu leg2 eff", config.json_muon_TopHNT_dblmu_leg2_eff, true);
+    cset_muon_TopHNT_emu_leg1_eff.Configure("muon TopHNT emu leg1 eff", config.json_muon_TopHNT_emu_leg1_eff, true);
+    cset_muon_TopHNT_emu_leg2_eff.Configure("muon TopHNT emu leg2 eff", config.json_muon_TopHNT_emu_leg2_eff, true);
+    cset_electron_TopHNT_idsf.Configure("electron TopHNT idsf", config.json_electron_TopHNT_idsf, true);
+    cset_electron_TopHNT_emu_leg1_eff.Configure("electron TopHNT emu leg1 eff", config.json_electron_TopHNT_emu_leg1_eff, true);
+    cset_electron_TopHNT_emu_leg2_eff.Configure("electron TopHNT emu leg2 eff", config.json_electron_TopHNT_emu_leg2_eff, true);
+    csetRegistry["muon"] = &cset_muon;
+    csetRegistry["puWeights"] = &cset_puWeights;
+    csetRegistry["btagging"] = &cset_btagging;
+    csetRegistry["ctagging"] = &cset_ctagging;
+    csetRegistry["btagging_eff"] = &cset_btagging_eff;
+    csetRegistry["ctagging_eff"] = &cset_ctagging_eff;
+    csetRegistry["electron"] = &cset_electron;
+    csetRegistry["electron_variation"] = &cset_electron_variation;
+    csetRegistry["photon"] = &cset_photon;
+    csetRegistry["jerc"] = &cset_jerc;
+    csetRegistry["jerc_fatjet"] = &cset_jerc_fatjet;
+    csetRegistry["jetvetomap"] = &cset_jetvetomap;
+    csetRegistry["jmar"] = &cset_jmar;
+    csetRegistry["muon_trig_eff"] = &cset_muon_trig_eff;
+    csetRegistry["electron_hlt"] = &cset_electron_hlt;
+    csetRegistry["met"] = &cset_met;
+    csetRegistry["btagging_R"] = &cset_btagging_R;
+    csetRegistry["ctagging_R"] = &cset_ctagging_R;
+    csetRegistry["muon_TopHNT_idsf"] = &cset_muon_TopHNT_idsf;
+    csetRegistry["muon_TopHNT_dblmu_leg1_eff"] = &cset_muon_TopHNT_dblmu_leg1_eff;
+    csetRegistry["muon_TopHNT_dblmu_leg2_eff"] = &cset_muon_TopHNT_dblmu_leg2_eff;
+    csetRegistry["muon_TopHNT_emu_leg1_eff"] = &cset_muon_TopHNT_emu_leg1_eff;
+    csetRegistry["muon_TopHNT_emu_leg2_eff"] = &cset_muon_TopHNT_emu_leg2_eff;
+    csetRegistry["electron_TopHNT_idsf"] = &cset_electron_TopHNT_idsf;
+    csetRegistry["electron_TopHNT_emu_leg1_eff"] = &cset_electron_TopHNT_emu_leg1_eff;
+    csetRegistry["electron_TopHNT_emu_leg2_eff"] = &cset_electron_TopHNT_emu_leg2_eff;
 
 
     LUM_keys["2023BPix"] = "Collisions2023_369803_370790_eraD_GoldenJson";
@@ -80,18 +99,10 @@ MyCorrection::MyCorrection(const TString &era, const TString &period, const TStr
     // JES tags
     // ###### as placeholder
     if (IsDATA) {
-        string period = static_cast<string>(GetPeriod().Data());
-        if (GetEra() == "2016preVFP") {
-            period = TString("EF").Contains(GetPeriod()) ? "EF" : "BCD";
+        for (const auto &this_era : {"2023BPix", "2023", "2022EE", "2022", "2018", "2017", "2016postVFP", "2016preVFP"}) {
+            JME_JES_GT[this_era] = getJESDataGT(this_era, GetPeriod());
         }
-        JME_JES_GT["2023BPix"] = "Summer23BPixPrompt23_V3_DATA_######_AK4PFPuppi";
-        JME_JES_GT["2023"] = "Summer23Prompt23_V2_DATA_######_AK4PFPuppi";
-        JME_JES_GT["2022EE"] = "Summer22EE_22Sep2023_Run"+period+"_V2_DATA_######_AK4PFPuppi";
-        JME_JES_GT["2022"] = "Summer22_22Sep2023_RunCD_V2_DATA_######_AK4PFPuppi";
-        JME_JES_GT["2018"] = "Summer19UL18_Run"+period+"_V5_DATA_######_AK4PFchs";
-        JME_JES_GT["2017"] = "Summer19UL17_Run"+period+"_V5_DATA_######_AK4PFchs";
-        JME_JES_GT["2016postVFP"] = "Summer19UL16_RunFGH_V7_DATA_######_AK4PFchs";
-        JME_JES_GT["2016preVFP"] = "Summer19UL16APV_Run"+period+"_V7_DATA_######_AK4PFchs";
+        setDataRunRanges();
     } else { // MC
         JME_JES_GT["2023BPix"] = "Summer23BPixPrompt23_V3_MC_######_AK4PFPuppi";
         JME_JES_GT["2023"] = "Summer23Prompt23_V2_MC_######_AK4PFPuppi";
@@ -119,7 +130,98 @@ MyCorrection::MyCorrection(const TString &era, const TString &period, const TStr
     JME_PILEUP_keys["2018"] = "PUJetID_eff";
 }
 
-MyCorrection::~MyCorrection() {}
+MyCorrection::~MyCorrection() {
+    PrintEventCacheStats();
+}
+
+void MyCorrection::PrintEventCacheStats() const {
+    const vector<string> slot_names = {"GetJER", "GetJERSF", "GetMuonIDSF"};
+    for (int slot = 0; slot < kNCacheSlots; slot++) {
+        const unsigned long total = eventCacheHits[slot] + eventCacheMisses[slot];
+        if (total == 0) continue;
+        cout << "[MyCorrection::PrintEventCacheStats] " << slot_names[slot] << ": " << eventCacheHits[slot] << " / " << total
+             << " hits (" << 100. * eventCacheHits[slot] / total << "%)" << endl;
+    }
+}
+
+void MyCorrection::Preload(const vector<string> &payloads) {
+    for (const auto &payload : payloads) {
+        if (payload == "all") {
+            for (const auto &entry : csetRegistry) entry.second->get();
+            getRoccoR();
+        } else if (payload == "roccor") {
+            getRoccoR();
+        } else if (csetRegistry.find(payload) != csetRegistry.end()) {
+            csetRegistry.at(payload)->get();
+        } else {
+            cerr << "[MyCorrection::Preload] Unknown payload: " << payload << endl;
+            throw invalid_argument("[MyCorrection::Preload] Unknown payload: " + payload);
+        }
+    }
+}
+
+string MyCorrection::getJESDataGT(const TString &era, const TString &period) const {
+    // ###### as placeholder
+    string this_period = static_cast<string>(period.Data());
+    if (era == "2016preVFP") {
+        this_period = TString("EF").Contains(period) ? "EF" : "BCD";
+    }
+    if (era == "2023BPix") return "Summer23BPixPrompt23_V3_DATA_######_AK4PFPuppi";
+    else if (era == "2023") return "Summer23Prompt23_V2_DATA_######_AK4PFPuppi";
+    else if (era == "2022EE") return "Summer22EE_22Sep2023_Run"+this_period+"_V2_DATA_######_AK4PFPuppi";
+    else if (era == "2022") return "Summer22_22Sep2023_RunCD_V2_DATA_######_AK4PFPuppi";
+    else if (era == "2018") return "Summer19UL18_Run"+this_period+"_V5_DATA_######_AK4PFchs";
+    else if (era == "2017") return "Summer19UL17_Run"+this_period+"_V5_DATA_######_AK4PFchs";
+    else if (era == "2016postVFP") return "Summer19UL16_RunFGH_V7_DATA_######_AK4PFchs";
+    else if (era == "2016preVFP") return "Summer19UL16APV_Run"+this_period+"_V7_DATA_######_AK4PFchs";
+    throw invalid_argument("[MyCorrection::getJESDataGT] Invalid era: " + era);
+}
+
+void MyCorrection::setDataRunRanges() {
+    // first and last run of each data period, used to pick the period-dependent corrections
+    vector<tuple<TString, unsigned int, unsigned int>> periods;
+    if (GetEra() == "2016preVFP") {
+        periods = {{"B", 272007, 275376}, {"C", 275657, 276283}, {"D", 276315, 276811}, {"E", 276831, 277420}, {"F", 277772, 278768}};
+    } else if (GetEra() == "2016postVFP") {
+        periods = {{"F", 278769, 278808}, {"G", 278820, 280385}, {"H", 280919, 284044}};
+    } else if (GetEra() == "2017") {
+        periods = {{"B", 297020, 299329}, {"C", 299337, 302029}, {"D", 302030, 303434}, {"E", 303435, 304826}, {"F", 304911, 306462}};
+    } else if (GetEra() == "2018") {
+        periods = {{"A", 315252, 316995}, {"B", 316998, 319312}, {"C", 319313, 320393}, {"D", 320394, 325273}};
+    } else if (GetEra() == "2022") {
+        periods = {{"C", 355794, 357486}, {"D", 357487, 359021}};
+    } else if (GetEra() == "2022EE") {
+        periods = {{"E", 359022, 360331}, {"F", 360332, 362180}, {"G", 362350, 362760}};
+    } else if (GetEra() == "2023") {
+        periods = {{"B", 366403, 367079}, {"C", 367080, 369802}};
+    } else if (GetEra() == "2023BPix") {
+        periods = {{"D", 369803, 370790}};
+    }
+
+    dataRunRanges.clear();
+    for (const auto &[period, first_run, last_run] : periods) {
+        RunRange range;
+        range.first = first_run;
+        range.last = last_run;
+        range.period = period;
+        range.JES_GT = getJESDataGT(GetEra(), period);
+        dataRunRanges.push_back(range);
+    }
+    sort(dataRunRanges.begin(), dataRunRanges.end(), [](const RunRange &a, const RunRange &b) { return a.first < b.first; });
+}
+
+const MyCorrection::RunRange *MyCorrection::findRunRange(const unsigned int runNumber) const {
+    auto it = upper_bound(dataRunRanges.begin(), dataRunRanges.end(), runNumber,
+                          [](const unsigned int run, const RunRange &range) { return run < range.first; });
+    if (it == dataRunRanges.begin()) return nullptr;
+    --it;
+    return (runNumber <= it->last) ? &(*it) : nullptr;
+}
+
+TString MyCorrection::GetPeriodFromRun(const unsigned int runNumber) const {
+    const RunRange *range = findRunRange(runNumber);
+    return range ? range->period : GetPeriod();
+}
 
 MyCorrection::EraConfig MyCorrection::GetEraConfig(TString era, const string &btagging_eff_file, const string &ctagging_eff_file, const string &btagging_R_file, const string &ctagging_R_file) const {
     EraConfig config;
@@ -328,7 +430,7 @@ MyCorrection::EraConfig MyCorrection::GetEraConfig(TString era, const string &bt
 
 // Muon
 // Rochestor correction
-float MyCorrection::GetMuonScaleSF(const Muon &muon, const variation syst, const float matched_pt) const {
+float MyCorrection::GetMuonScaleSF(const Muon &muon, const variation syst, const float matched_pt, const uint64_t seed) const {
     float roccor = 1.;
     float roccor_err = 0.;
 
@@ -336,22 +438,22 @@ float MyCorrection::GetMuonScaleSF(const Muon &muon, const variation syst, const
     // still true for Run3?
     if (muon.Pt() < 10.) return 1.;
 
+    const RoccoR &rochester = getRoccoR();
     if (IsDATA) {
-        roccor = rc.kScaleDT(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), 0, 0);
-        roccor_err = rc.kScaleDTerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi());
+        roccor = rochester.kScaleDT(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), 0, 0);
+        roccor_err = rochester.kScaleDTerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi());
     } else {
-        // Random seed is initialized in SKNanoLoader::Init()
-        gRandom->SetSeed(int(muon.Pt()/muon.Eta()));
-        float u = gRandom->Rndm();
+        const uint64_t stream = seed ? seed : CounterRNG::Stream(muon.Pt(), muon.Eta(), muon.Phi(), 0);
+        const float u = CounterRNG::Uniform(stream);
         if (matched_pt > 0) { // matched
-            roccor = rc.kSpreadMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), matched_pt, 0, 0);
-            roccor_err = rc.kSpreadMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), matched_pt);
+            roccor = rochester.kSpreadMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), matched_pt, 0, 0);
+            roccor_err = rochester.kSpreadMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), matched_pt);
         } else {
-            //roccor = rc.kScaleMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), 0, 0);
+            //roccor = rochester.kScaleMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), 0, 0);
             //roccor_err = 0.;
-            //roccor_err = rc.kScaleMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi());
-            roccor = rc.kSmearMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), muon.nTrackerLayers(), u, 0, 0);
-            roccor_err = rc.kSmearMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), muon.nTrackerLayers(), u);
+            //roccor_err = rochester.kScaleMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi());
+            roccor = rochester.kSmearMC(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), muon.nTrackerLayers(), u, 0, 0);
+            roccor_err = rochester.kSmearMCerror(muon.Charge(), muon.Pt(), muon.Eta(), muon.Phi(), muon.nTrackerLayers(), u);
         }
     }
 
@@ -382,23 +484,24 @@ float MyCorrection::GetMuonRECOSF(const RVec<Muon> &muons, const variation syst)
 }
 
 float MyCorrection::GetMuonIDSF(const TString &Muon_ID_SF_Key, const Muon &muon, const variation syst) const {
-    if (Muon_ID_SF_Key == "TopHNT") {
-        auto cset = cset_muon_TopHNT_idsf->at("sf");
-        if (syst == variation::nom) {
-            return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "nom"});
-        } else if (syst == variation::up) {
-            return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "up"});
-        } else if (syst == variation::down) {
-            return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "down"});
+    return cachedEvaluate(kCacheMuonIDSF, hash<string>()(Muon_ID_SF_Key.Data()), syst, fabs(muon.Eta()), muon.OriginalPt(), 0., [&]() -> float {
+        if (Muon_ID_SF_Key == "TopHNT") {
+            auto cset = cset_muon_TopHNT_idsf->at("sf");
+            if (syst == variation::nom) {
+                return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "nom"});
+            } else if (syst == variation::up) {
+                return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "up"});
+            } else if (syst == variation::down) {
+                return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), "down"});
+            } else {
+                throw runtime_error("[MyCorrection::GetMuonIDSF] Invalid syst value");
+            }
         } else {
-            throw runtime_error("[MyCorrection::GetMuonIDSF] Invalid syst value");
+            auto cset = cset_muon->at(string(Muon_ID_SF_Key));
+            return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), getSystString_MUO(syst)});
         }
-    } else {
-        auto cset = cset_muon->at(string(Muon_ID_SF_Key));
-        return safeEvaluate(cset, "GetMuonIDSF", {fabs(muon.Eta()), muon.OriginalPt(), getSystString_MUO(syst)});
-    }
+    });
 }
-
 float MyCorrection::GetMuonIDSF(const TString &Muon_ID_SF_Key, const RVec<Muon> &muons, const variation syst) const {
     float weight = 1.;
     for (const auto &muon : muons) {
@@ -452,7 +555,7 @@ float MyCorrection::GetElectronScaleUnc(const float scEta, const unsigned char s
     return 1.0;
 }
     
-float MyCorrection::GetElectronSmearUnc(const Electron &electron, const variation syst, const unsigned int seed) const {
+float MyCorrection::GetElectronSmearUnc(const Electron &electron, const variation syst, const uint64_t seed) const {
     if (IsDATA) return 1.0; // No smearing for data, only applied to MC
     if (Run == 2) throw runtime_error("[MyCorrection::GetElectronSmearUnc] Run2 is not supported by NanoAODv9");
 
@@ -465,18 +568,18 @@ float MyCorrection::GetElectronSmearUnc(const Electron &electron, const variatio
     };
     const float rho = safeEvaluate(cset, "GetElectronScaleSF", args);
     
-    TRandom3 rng(seed);
+    const double gaus = CounterRNG::Gaus(seed);
     
     // Handle different variation cases
     if (syst == variation::nom) {
         // For nominal case, apply normal smearing
-        return rng.Gaus(1.0, rho);
+        return 1.0 + rho*gaus;
     } else if (syst == variation::up) {
         // For up variation, increase the width of the Gaussian
-        return rng.Gaus(1.0, rho + safeEvaluate(cset, "GetElectronScaleSF", {"err_rho", electron.scEta(), electron.r9()}));
+        return 1.0 + (rho + safeEvaluate(cset, "GetElectronScaleSF", {"err_rho", electron.scEta(), electron.r9()}))*gaus;
     } else if (syst == variation::down) {
         // For down variation, decrease the width of the Gaussian
-        return rng.Gaus(1.0, rho - safeEvaluate(cset, "GetElectronScaleSF", {"err_rho", electron.scEta(), electron.r9()}));
+        return 1.0 + (rho - safeEvaluate(cset, "GetElectronScaleSF", {"err_rho", electron.scEta(), electron.r9()}))*gaus;
     } else {
         throw runtime_error("[MyCorrection::GetElectronSmearUnc] Invalid syst value");
     }
@@ -898,23 +1001,18 @@ float MyCorrection::GetBTaggingSF(const RVec<Jet> &jets, const JetTagging::JetFl
         }
         return weight;
     } else if (method == JetTagging::JetTaggingSFMethod::comb or method == JetTagging::JetTaggingSFMethod::mujets) {
-        auto cset = cset_btagging->at(this_taggerStr + "_" + JetTagging::GetJetTaggingSFMethodStr(method).Data());
-        string light_str;
-        if (Run == 2)
-            light_str = this_taggerStr + "_incl";
-        else if (Run == 3)
-            light_str = this_taggerStr + "_light";
-        auto cset_light = cset_btagging->at(light_str);
-        float this_cut = GetBTaggingWP(tagger, wp);
+        const BTaggingFixedWPTable &table = getBTaggingFixedWPTable(tagger, wp, method);
         for (const auto &jet : jets) {
             const bool is_heavy = abs(jet.hadronFlavour()) == 5 || abs(jet.hadronFlavour()) == 4;
             const int this_flav = is_heavy ? abs(jet.hadronFlavour()) : 0;
+            const float abseta = fabs(jet.Eta());
+            const float pt = jet.Pt();
 
-            const float eff = GetBTaggingEff(jet.Eta(), jet.Pt(), this_flav, tagger, wp, syst);
-            auto this_cset = is_heavy ? cset : cset_light;
+            const float eff = getBTaggingFixedWPEff(table, this_flav, abseta, pt);
+            const correction::Correction::Ref &this_cset = is_heavy ? table.cset_heavy : table.cset_light;
 
-            const float sf = safeEvaluate(this_cset, "GetBTaggingSF", {syst_str, this_wpStr, this_flav, fabs(jet.Eta()), jet.Pt()});
-            if (jet.GetBTaggerResult(tagger) > this_cut) {
+            const float sf = safeEvaluate(this_cset, "GetBTaggingSF", {syst_str, table.wpStr, this_flav, abseta, pt});
+            if (jet.GetBTaggerResult(tagger) > table.cut) {
                 weight *= sf;
             } else {
                 weight *= (1. - eff * sf) / (1. - eff);
@@ -927,6 +1025,124 @@ float MyCorrection::GetBTaggingSF(const RVec<Jet> &jets, const JetTagging::JetFl
     }
 }
 
+const MyCorrection::BTaggingFixedWPTable &MyCorrection::getBTaggingFixedWPTable(const JetTagging::JetFlavTagger tagger, const JetTagging::JetFlavTaggerWP wp, const JetTagging::JetTaggingSFMethod method) {
+    const string this_taggerStr = JetTagging::GetTaggerCorrectionLibStr(tagger).Data();
+    const string this_wpStr = JetTagging::GetTaggerCorrectionWPStr(wp).Data();
+    const string this_methodStr = JetTagging::GetJetTaggingSFMethodStr(method).Data();
+    const string key = this_taggerStr + "_" + this_wpStr + "_" + this_methodStr;
+    auto it = btagFixedWPTables.find(key);
+    if (it != btagFixedWPTables.end()) return it->second;
+
+    cout << "[MyCorrection::getBTaggingFixedWPTable] Preparing fixedWP tables for " << key << endl;
+    BTaggingFixedWPTable table;
+    table.cut = GetBTaggingWP(tagger, wp);
+    table.wpStr = this_wpStr;
+    table.cset_heavy = cset_btagging->at(this_taggerStr + "_" + this_methodStr);
+    table.cset_light = cset_btagging->at(this_taggerStr + (Run == 2 ? "_incl" : "_light"));
+    table.etabins = JetTagging::GetTaggingEffEtaBins();
+    table.ptbins = JetTagging::GetTaggingEffPtBins();
+
+    // evaluate the efficiency maps once at the bin centers
+    table.cset_eff = cset_btagging_eff->at(this_taggerStr);
+    const size_t n_eta = table.etabins.size() - 1;
+    const size_t n_pt = table.ptbins.size() - 1;
+    const int flavs[3] = {0, 4, 5};
+    for (int i_flav = 0; i_flav < 3; i_flav++) {
+        table.eff[i_flav].resize(n_eta * n_pt);
+        table.tabulated[i_flav] = true;
+        for (size_t i_eta = 0; i_eta < n_eta && table.tabulated[i_flav]; i_eta++) {
+            const float eta_lo = table.etabins[i_eta], eta_hi = table.etabins[i_eta + 1];
+            const float eta_center = 0.5 * (eta_lo + eta_hi);
+            for (size_t i_pt = 0; i_pt < n_pt && table.tabulated[i_flav]; i_pt++) {
+                const float pt_lo = table.ptbins[i_pt], pt_hi = table.ptbins[i_pt + 1];
+                const float pt_center = 0.5 * (pt_lo + pt_hi);
+                const float eff = safeEvaluate(table.cset_eff, "getBTaggingFixedWPTable", {"central", this_wpStr, flavs[i_flav], eta_center, pt_center});
+                // the efficiency must be flat within each table bin, otherwise the efficiency file was made with another binning
+                const float eta_eps = 1e-3 * (eta_hi - eta_lo), pt_eps = 1e-3 * (pt_hi - pt_lo);
+                for (const float eta : {eta_lo + eta_eps, eta_hi - eta_eps}) {
+                    for (const float pt : {pt_lo + pt_eps, pt_hi - pt_eps}) {
+                        const float this_eff = safeEvaluate(table.cset_eff, "getBTaggingFixedWPTable", {"central", this_wpStr, flavs[i_flav], eta, pt});
+                        if (table.tabulated[i_flav] && fabs(this_eff - eff) > 1e-6) {
+                            cerr << "[MyCorrection::getBTaggingFixedWPTable] Warning: " << this_taggerStr << " efficiency for flavour " << flavs[i_flav]
+                                 << " is not constant in the bin eta [" << eta_lo << ", " << eta_hi << "], pt [" << pt_lo << ", " << pt_hi << "]"
+                                 << ", the binning of the efficiency file does not match JetTagging::GetTaggingEffEtaBins/GetTaggingEffPtBins."
+                                 << " The efficiency is evaluated per jet for this flavour" << endl;
+                            table.tabulated[i_flav] = false;
+                        }
+                    }
+                }
+                table.eff[i_flav][i_eta * n_pt + i_pt] = eff;
+            }
+        }
+        if (!table.tabulated[i_flav]) table.eff[i_flav].clear();
+    }
+    return btagFixedWPTables.emplace(key, std::move(table)).first->second;
+}
+
+float MyCorrection::getBTaggingFixedWPEff(const BTaggingFixedWPTable &table, const int flav, const float abseta, const float pt) {
+    const int i_flav = flav == 5 ? 2 : (flav == 4 ? 1 : 0);
+    if (!table.tabulated[i_flav] || abseta < table.etabins.front() || abseta >= table.etabins.back() || pt < table.ptbins.front() || pt >= table.ptbins.back())
+        return safeEvaluate(table.cset_eff, "getBTaggingFixedWPEff", {"central", table.wpStr, flav, abseta, pt});
+    // same bin assignment as MeasureJetTaggingEff
+    const size_t n_pt = table.ptbins.size() - 1;
+    const size_t i_eta = upper_bound(table.etabins.begin(), table.etabins.end(), abseta) - table.etabins.begin() - 1;
+    const size_t i_pt = upper_bound(table.ptbins.begin(), table.ptbins.end(), pt) - table.ptbins.begin() - 1;
+    return table.eff[i_flav][i_eta * n_pt + i_pt];
+}
+
+unordered_map<string, float> MyCorrection::GetBTaggingSFVariations(const RVec<Jet> &jets, const JetTagging::JetFlavTagger tagger, const JetTagging::JetFlavTaggerWP wp, const JetTagging::JetTaggingSFMethod method) {
+    const size_t n_syst = btagFixedWPSysts.size();
+    float w_central = 1.;
+    vector<float> w_comb(n_syst, 1.), w_heavy(n_syst, 1.), w_light(n_syst, 1.);
+    auto to_map = [&]() {
+        unordered_map<string, float> weights;
+        weights["central"] = w_central;
+        for (size_t i = 0; i < n_syst; i++) {
+            weights[btagFixedWPSysts[i]] = w_comb[i];
+            weights["heavy_" + btagFixedWPSysts[i]] = w_heavy[i];
+            weights["light_" + btagFixedWPSysts[i]] = w_light[i];
+        }
+        return weights;
+    };
+
+    if (Run == 2 && tagger != JetTagging::JetFlavTagger::DeepJet) {
+        cerr << "[MyCorrection::GetBTaggingSFVariations] DeepJet is the only supported tagger for 2016preVFP, 2016postVFP, 2017, 2018, and 2018UL" << endl;
+        return to_map();
+    }
+    if (method != JetTagging::JetTaggingSFMethod::comb && method != JetTagging::JetTaggingSFMethod::mujets) {
+        cout << "[MyCorrection::GetBTaggingSFVariations] method " << JetTagging::GetJetTaggingSFMethodStr(method) << " is not a fixedWP method" << endl;
+        exit(ENODATA);
+    }
+
+    const BTaggingFixedWPTable &table = getBTaggingFixedWPTable(tagger, wp, method);
+    // per-jet factor for a given sf, tagged or not
+    auto jet_factor = [](const bool is_tagged, const float eff, const float sf) -> float {
+        return is_tagged ? sf : (1. - eff * sf) / (1. - eff);
+    };
+
+    for (const auto &jet : jets) {
+        const bool is_heavy = abs(jet.hadronFlavour()) == 5 || abs(jet.hadronFlavour()) == 4;
+        const int this_flav = is_heavy ? abs(jet.hadronFlavour()) : 0;
+        const float abseta = fabs(jet.Eta());
+        const float pt = jet.Pt();
+        const float eff = getBTaggingFixedWPEff(table, this_flav, abseta, pt);
+
+        const correction::Correction::Ref &this_cset = is_heavy ? table.cset_heavy : table.cset_light;
+        const bool is_tagged = jet.GetBTaggerResult(tagger) > table.cut;
+        const float central = jet_factor(is_tagged, eff, safeEvaluate(this_cset, "GetBTaggingSFVariations", {"central", table.wpStr, this_flav, abseta, pt}));
+        w_central *= central;
+        vector<float> &w_varied = is_heavy ? w_heavy : w_light;
+        vector<float> &w_fixed = is_heavy ? w_light : w_heavy;
+        for (size_t i = 0; i < n_syst; i++) {
+            const float this_factor = jet_factor(is_tagged, eff, safeEvaluate(this_cset, "GetBTaggingSFVariations", {btagFixedWPSysts[i], table.wpStr, this_flav, abseta, pt}));
+            w_comb[i] *= this_factor;
+            w_varied[i] *= this_factor;
+            w_fixed[i] *= central;
+        }
+    }
+    return to_map();
+}
+
 float MyCorrection::GetBTaggingR(const RVec<Jet> &jets, const JetTagging::JetFlavTagger tagger, string &processName, const variation syst, const TString &source) const {
     string this_taggerStr = JetTagging::GetTaggerCorrectionLibStr(tagger).Data();
     string syst_str = getSystString_BTV(syst);
@@ -1132,33 +1348,44 @@ float MyCorrection::GetPileupJetIDSF(const RVec<Jet> &jets, const unordered_map<
 
 // JERC
 float MyCorrection::GetJER(const float eta, const float pt, const float rho) const {
-    correction::Correction::Ref cset = nullptr;
-    string cset_string = JME_JER_GT.at(GetEra().Data());
-    cset_string.replace(cset_string.find("######"), 6, "PtResolution");
-    cset = cset_jerc->at(cset_string);
-    return safeEvaluate(cset, "GetJER", {eta, pt, rho});
+    return cachedEvaluate(kCacheJER, 0, variation::nom, eta, pt, rho, [&]() {
+        correction::Correction::Ref cset = nullptr;
+        string cset_string = JME_JER_GT.at(GetEra().Data());
+        cset_string.replace(cset_string.find("######"), 6, "PtResolution");
+        cset = cset_jerc->at(cset_string);
+        return safeEvaluate(cset, "GetJER", {eta, pt, rho});
+    });
 }
 
 float MyCorrection::GetJERSF(const float eta, const float pt, const variation syst, const TString &source) const {
-    correction::Correction::Ref cset = nullptr;
-    string cset_string = JME_JER_GT.at(GetEra().Data());
-    cset_string.replace(cset_string.find("######"), 6, "ScaleFactor");
-    cset = cset_jerc->at(cset_string);
-    if (Run == 3)
-    {
-        return safeEvaluate(cset, "GetJERSF", {eta, pt, getSystString_JME(syst)});
-    }
-    else if (Run == 2)
-    {
-        return safeEvaluate(cset, "GetJERSF", {eta, getSystString_JME(syst)});
-    }
-    return 1.;
+    // Run2 JER SF does not depend on pt
+    const float pt_key = (Run == 3) ? pt : 0.;
+    return cachedEvaluate(kCacheJERSF, 0, syst, eta, pt_key, 0., [&]() -> float {
+        correction::Correction::Ref cset = nullptr;
+        string cset_string = JME_JER_GT.at(GetEra().Data());
+        cset_string.replace(cset_string.find("######"), 6, "ScaleFactor");
+        cset = cset_jerc->at(cset_string);
+        if (Run == 3)
+        {
+            return safeEvaluate(cset, "GetJERSF", {eta, pt, getSystString_JME(syst)});
+        }
+        else if (Run == 2)
+        {
+            return safeEvaluate(cset, "GetJERSF", {eta, getSystString_JME(syst)});
+        }
+        return 1.;
+    });
 }
 
 //JESC
 float MyCorrection::GetJESSF(const float area, const float eta, const float pt, const float phi, const float rho, const unsigned int runNumber) const {
     correction::CompoundCorrection::Ref cset = nullptr;
     string cset_string = JME_JES_GT.at(GetEra().Data());
+    if (IsDATA) {
+        // period-dependent GTs are dispatched by run number
+        const RunRange *range = findRunRange(runNumber);
+        if (range) cset_string = range->JES_GT;
+    }
     cset_string.replace(cset_string.find("######"), 6, "L1L2L3Res");
     cset = cset_jerc->compound().at(cset_string);
     vector<correction::Variable::Type> args;
@@ -1184,15 +1411,40 @@ float MyCorrection::GetJESUncertainty(const float eta, const float pt, const var
     else
         int_syst = 0;
 
-    correction::Correction::Ref cset = nullptr;
-    string cset_string = JME_JES_GT.at(GetEra().Data());
-    cset_string.replace(cset_string.find("######"), 6, source);
-    cset = cset_jerc->at(cset_string);
+    const correction::Correction::Ref &cset = getJESUncertaintyHandle(source);
     float this_factor = 1.;
     this_factor += (int_syst * safeEvaluate(cset, "GetJESUncertainty", {eta, pt}));
     return this_factor;
 }
 
+RVec<RVec<float>> MyCorrection::GetJESUncertaintyMatrix(const RVec<float> &etas, const RVec<float> &pts, const RVec<TString> &sources) const {
+    if (etas.size() != pts.size()) {
+        throw runtime_error("[MyCorrection::GetJESUncertaintyMatrix] etas and pts have different sizes");
+    }
+    // resolve all handles before the jet loop
+    vector<const correction::Correction::Ref*> csets;
+    csets.reserve(sources.size());
+    for (const auto &source : sources) csets.push_back(&getJESUncertaintyHandle(source));
+
+    RVec<RVec<float>> uncertainties(etas.size(), RVec<float>(sources.size(), 0.));
+    for (size_t i = 0; i < etas.size(); i++) {
+        for (size_t j = 0; j < csets.size(); j++) {
+            uncertainties[i][j] = safeEvaluate(*csets[j], "GetJESUncertaintyMatrix", {etas[i], pts[i]});
+        }
+    }
+    return uncertainties;
+}
+
+const correction::Correction::Ref &MyCorrection::getJESUncertaintyHandle(const TString &source) const {
+    lock_guard<mutex> lock(JME_JES_unc_handles_mutex);
+    auto it = JME_JES_unc_handles.find(source.Data());
+    if (it != JME_JES_unc_handles.end()) return it->second;
+
+    string cset_string = JME_JES_GT.at(GetEra().Data());
+    cset_string.replace(cset_string.find("######"), 6, source);
+    return JME_JES_unc_handles.emplace(source.Data(), cset_jerc->at(cset_string)).first->second;
+}
+
 bool MyCorrection::IsJetVetoZone(const float eta, const float phi, TString mapCategory) const
 {
     correction::Correction::Ref cset = nullptr;
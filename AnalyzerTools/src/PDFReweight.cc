@@ -12,3 +12,64 @@ PDFReweight::~PDFReweight() {
     delete NewPDFAlphaSDown;
     delete NewPDFAlphaSUp;
 }
+
+float PDFReweight::evaluate(LHAPDF::PDF *pdf) const {
+    return pdf->xfxQ2(evt_id1, evt_x1, evt_scalePDF) * pdf->xfxQ2(evt_id2, evt_x2, evt_scalePDF);
+}
+
+bool PDFReweight::setEvent(int id1, int id2, float x1, float x2, float scalePDF) {
+    if (evt_valid && id1 == evt_id1 && id2 == evt_id2 && x1 == evt_x1 && x2 == evt_x2 && scalePDF == evt_scalePDF) return false;
+    if (!ProdPDF || !NewPDF) {
+        cerr << "[PDFReweight::setEvent] Production and new PDFs should be set first" << endl;
+        exit(EXIT_FAILURE);
+    }
+    evt_id1 = id1;
+    evt_id2 = id2;
+    evt_x1 = x1;
+    evt_x2 = x2;
+    evt_scalePDF = scalePDF;
+    evt_prod = evaluate(ProdPDF);
+    evt_central = evaluate(NewPDF) / evt_prod;
+    evt_errorset_done = false;
+    evt_valid = true;
+    return true;
+}
+
+void PDFReweight::evaluateErrorSet() {
+    errorset_weights.resize(NErrorSet);
+    for (unsigned int i = 0; i < NErrorSet; i++) errorset_weights[i] = evaluate(PDFErrorSet[i]) / evt_prod;
+}
+
+float PDFReweight::GetCentralReweight(int id1, int id2, float x1, float x2, float scalePDF) {
+    setEvent(id1, id2, x1, x2, scalePDF);
+    return evt_central;
+}
+
+const RVec<float>& PDFReweight::GetErrorSetReweights(int id1, int id2, float x1, float x2, float scalePDF, const RVec<float> &lheWeights) {
+    setEvent(id1, id2, x1, x2, scalePDF);
+    if (evt_errorset_done) return errorset_weights;
+    evt_errorset_done = true;
+
+    const bool hasLHE = lheCheck && lheWeights.size() >= lheFirstMember + NErrorSet && lheWeights[0] != 0.;
+    if (lheCompatible && hasLHE) {
+        errorset_weights.resize(NErrorSet);
+        for (unsigned int i = 0; i < NErrorSet; i++) errorset_weights[i] = evt_central * lheWeights[lheFirstMember + i] / lheWeights[0];
+        return errorset_weights;
+    }
+
+    evaluateErrorSet();
+    if (hasLHE && lheCheckedEvents < lheCheckEvents) {
+        // compare the variations relative to the central member, the normalisation of LHEPdfWeight is w_i/w_0
+        for (unsigned int i = 0; i < NErrorSet; i++) {
+            const float lhapdf = errorset_weights[i] / evt_central;
+            const float lhe = lheWeights[lheFirstMember + i] / lheWeights[0];
+            lheMaxDeviation = max(lheMaxDeviation, fabs(lhapdf - lhe) / max(fabs(lhapdf), 1e-6f));
+        }
+        if (++lheCheckedEvents == lheCheckEvents) {
+            lheCompatible = lheMaxDeviation < lheTolerance;
+            cout << "[PDFReweight::GetErrorSetReweights] LHEPdfWeight cross-check over " << lheCheckedEvents << " events: max relative deviation "
+                 << lheMaxDeviation << (lheCompatible ? ", using LHEPdfWeight from now on" : ", keep evaluating LHAPDF") << endl;
+        }
+    }
+    return errorset_weights;
+}
@@ -87,6 +87,7 @@ Era(Era.Data()){
     isDedicatedSample = IsDedicatedSample();
     checkBadSystematics();
     make_Iter_obj_EvtLoopAgain();
+    compileWeights();
     current_Iter_obj.clone(systematics_evtLoopAgain[0]); // Central
     std::cout << "[SystematicHelper::SystematicHelper] SystematicHelper is created for " <<  sample << std::endl;
     std::cout << "[SystematicHelper::SystematicHelper] Iterator has " << systematics_evtLoopAgain.size() << " elements" << std::endl;
@@ -228,14 +229,12 @@ void SystematicHelper::make_map_dedicatedSample()
 void SystematicHelper::assignWeightFunctionMap(const unordered_map<std::string, std::variant<std::function<float(MyCorrection::variation, TString)>, std::function<float()>>> &weight_function_map)
 {
     std::vector<std::string> syst_no_weight_function;
-    // clear weight functions
-    weight_functions.clear();
-    weight_functions_onesided.clear();
-    std::unordered_set<std::string> all_targets;
-    for (const auto &syst : systematics)
-        all_targets.insert(syst.target);
-    for (const auto &syst : systematics)
+    for (unsigned int i = 0; i < systematics.size(); i++)
     {
+        const auto &syst = systematics[i];
+        auto &compiled = compiled_systs[i];
+        compiled.weight_function = nullptr;
+        compiled.weight_function_onesided = nullptr;
         if (syst.hasDedicatedSample || syst.evtLoopAgain)
             continue;
 
@@ -255,7 +254,7 @@ void SystematicHelper::assignWeightFunctionMap(const unordered_map<std::string,
                 std::cerr << "Weight function for " << syst.syst << " is not a one-sided weight function" << std::endl;
                 exit(1);
             }
-            weight_functions_onesided[syst.target] = std::get<std::function<float()>>(weight_variant);
+            compiled.weight_function_onesided = std::get<std::function<float()>>(weight_variant);
         };
 
         auto assignTwoSided = [&]()
@@ -265,7 +264,7 @@ void SystematicHelper::assignWeightFunctionMap(const unordered_map<std::string,
                 std::cerr << "Weight function for " << syst.syst << " is not a two-sided weight function" << std::endl;
                 exit(1);
             }
-            weight_functions[syst.target] = std::get<std::function<float(MyCorrection::variation, TString)>>(weight_variant);
+            compiled.weight_function = std::get<std::function<float(MyCorrection::variation, TString)>>(weight_variant);
         };
 
         syst.oneSided ? assignOneSided() : assignTwoSided();
@@ -283,108 +282,57 @@ void SystematicHelper::assignWeightFunctionMap(const unordered_map<std::string,
     weight_functions_assigned = true;
 }
 
-std::unordered_map<std::string, float> SystematicHelper::calculateWeight(bool dry_run)
+int SystematicHelper::getWeightSlot(const std::string &name)
 {
-    if(!weight_functions_assigned && !dry_run)
-    {
-        std::cerr << "Weight functions are not assigned" << std::endl;
-        exit(1);
-    }
-    for (const auto &syst : systematics)
-    {
-        if (syst.hasDedicatedSample || syst.evtLoopAgain)
-        {
-            weight_map_nominal[syst.target] = 1.;
-            weight_map_up[syst.target] = 1.;
-            weight_map_down[syst.target] = 1.;
-        }
-        else if (syst.oneSided)
-        {
-            float weight = 1.;
-            auto weight_function = weight_functions_onesided[syst.target];
-            if(!dry_run) weight = weight_function();
-
-            weight_map_nominal[syst.target] = weight;
-            weight_map_up[syst.syst] = 1.;
-            weight_map_down[syst.syst] = weight;
-        }
-        else
-        {
-            float weight_up = 1.;
-            float weight_down = 1.;
-            float weight_nominal = 1.;
-
-            auto weight_function = weight_functions[syst.target];
-            if(!dry_run)
-            {
-                weight_nominal = weight_function(MyCorrection::variation::nom, "total");
-                weight_up = weight_function(MyCorrection::variation::up, syst.source);
-                weight_down = weight_function(MyCorrection::variation::down, syst.source);
-            }
+    auto it = weight_slots.find(name);
+    if (it != weight_slots.end())
+        return it->second;
+    const int slot = weight_slots.size();
+    weight_slots[name] = slot;
+    weight_values_nominal.push_back(0.);
+    weight_values_up.push_back(0.);
+    weight_values_down.push_back(0.);
+    return slot;
+}
 
-            weight_map_nominal[syst.target] = weight_nominal;
-            weight_map_up[syst.syst] = weight_up;
-            weight_map_down[syst.syst] = weight_down;
-        }
-    }
-    unordered_map<std::string, float> weights;
-    if (current_Iter_obj.variation == MyCorrection::variation::nom)
-    {
-        weights = calculateWeight_central_case();
-    }
-    else
+void SystematicHelper::compileWeights()
+{
+    // per systematic: which slots are written and how
+    for (const auto &syst : systematics)
     {
-        weights = calculateWeight_non_central_case();
+        COMPILED_SYST compiled;
+        compiled.kind = (syst.hasDedicatedSample || syst.evtLoopAgain) ? 0 : (syst.oneSided ? 1 : 2);
+        compiled.target_slot = getWeightSlot(syst.target);
+        compiled.syst_slot = getWeightSlot(syst.syst);
+        compiled.source = syst.source;
+        compiled_systs.push_back(compiled);
     }
 
-    return weights;
-}
-
-unordered_map<std::string, float> SystematicHelper::calculateWeight_central_case()
-{
-    std::vector<string> all_weight_systs;
-    unordered_map<std::string, float> weights;
-    float nominal_weight = 1.;
+    // nominal weight is the product over all targets
     unordered_set<std::string> all_weight_targets;
-
     for (const auto &syst : systematics)
         all_weight_targets.insert(syst.target);
-
     for (const auto &target : all_weight_targets)
-        nominal_weight *= weight_map_nominal[target];
+        nominal_target_slots.push_back(getWeightSlot(target));
 
+    // central iteration: correlation groups first, then the systematics not in any group
+    std::vector<string> all_weight_systs;
     for (const auto &syst : systematics)
-    {
         all_weight_systs.push_back(syst.syst);
-    }
-
-    weights[central_name] = nominal_weight;
-
     for (const auto &correlation : correlations)
     {
         unordered_set<std::string> all_sources_name = correlation.second.child_syst_names;
         all_sources_name.insert(correlation.second.rep_name);
-        float weight_up = nominal_weight;
-        float weight_down = nominal_weight;
-        // If current Iter_obj is Central and correlation include systematic that has dedicated sample of require evtLoopAgain, skip.
-        // that correlation set will be calculated in that situation
         bool correlation_should_be_skipped = false;
+        WEIGHT_PRODUCT product;
+        product.name_up = correlation.second.rep_name + variation_prefix[MyCorrection::variation::up];
+        product.name_down = correlation.second.rep_name + variation_prefix[MyCorrection::variation::down];
         for (const auto &sources_in_table : all_sources_name)
         {
-            if (findSystematic(sources_in_table)->hasDedicatedSample || findSystematic(sources_in_table)->evtLoopAgain)
-            {
+            SYST *syst = findSystematic(sources_in_table);
+            if (syst->hasDedicatedSample || syst->evtLoopAgain)
                 correlation_should_be_skipped = true;
-                break;
-            }
-        }
-        
-        for (const auto &sources_in_table : all_sources_name)
-        {
-            std::string this_target = findSystematic(sources_in_table)->target;
-            weight_up = safe_divide(weight_up, weight_map_nominal[this_target]);
-            weight_down = safe_divide(weight_down, weight_map_nominal[this_target]);
-            weight_up *= weight_map_up[sources_in_table];
-            weight_down *= weight_map_down[sources_in_table];
+            product.factors.emplace_back(getWeightSlot(syst->target), getWeightSlot(sources_in_table));
             auto it = find(all_weight_systs.begin(), all_weight_systs.end(), sources_in_table);
             if (it != all_weight_systs.end())
             {
@@ -392,109 +340,191 @@ unordered_map<std::string, float> SystematicHelper::calculateWeight_central_case
             }
         }
         if (correlation_should_be_skipped) continue;
-        weights[correlation.second.rep_name + variation_prefix[MyCorrection::variation::up]] = weight_up;
-        weights[correlation.second.rep_name + variation_prefix[MyCorrection::variation::down]] = weight_down;
+        central_products.push_back(product);
     }
-
-    // systematic that not in correlation table
-    for (const auto &syst : all_weight_systs)
+    for (const auto &syst_name : all_weight_systs)
     {
-        float weight_up = nominal_weight;
-        float weight_down = nominal_weight;
-        if(findSystematic(syst)->hasDedicatedSample || findSystematic(syst)->evtLoopAgain)
-        {
+        SYST *syst = findSystematic(syst_name);
+        if (syst->hasDedicatedSample || syst->evtLoopAgain)
             continue;
-        }
-        std::string this_target = findSystematic(syst)->target;
-        weight_up = safe_divide(weight_up, weight_map_nominal[this_target]);
-        weight_down = safe_divide(weight_down, weight_map_nominal[this_target]);
-        weight_up *= weight_map_up[syst];
-        weight_down *= weight_map_down[syst];
-        weights[syst + variation_prefix[MyCorrection::variation::up]] = weight_up;
-        weights[syst + variation_prefix[MyCorrection::variation::down]] = weight_down;
+        WEIGHT_PRODUCT product;
+        product.name_up = syst_name + variation_prefix[MyCorrection::variation::up];
+        product.name_down = syst_name + variation_prefix[MyCorrection::variation::down];
+        product.factors.emplace_back(getWeightSlot(syst->target), getWeightSlot(syst_name));
+        central_products.push_back(product);
+    }
+    central_weight_names.push_back(central_name);
+    for (const auto &product : central_products)
+    {
+        central_weight_names.push_back(product.name_up);
+        central_weight_names.push_back(product.name_down);
     }
-    if(isDedicatedSample)
+    if (isDedicatedSample)
     {
         for (const auto &dedicatedSample : map_dedicatesamplekey_systname)
         {
-            std::string this_key = dedicatedSample.first;
-            // Check if sample is found as a substring of this_sample
-            if (sample.find(this_key) != std::string::npos)
+            if (sample.find(dedicatedSample.first) != std::string::npos)
             {
-                float central_weight = weights[central_name];
-                weights.clear();
-                weights[dedicatedSample.second] = central_weight; // Use value from "Central"
-                return weights;
+                dedicated_weight_name = dedicatedSample.second;
+                break;
             }
         }
-        throw std::runtime_error("[SystematicHelper::calculateWeight_central_case] Dedicated sample not found");
+        if (dedicated_weight_name.empty())
+            throw std::runtime_error("[SystematicHelper::compileWeights] Dedicated sample not found");
+        central_weight_names = {dedicated_weight_name};
     }
-    return weights;
-}
 
-unordered_map<std::string, float> SystematicHelper::calculateWeight_non_central_case()
-{
-    // first check current Iter_obj is in correlation table
-    bool Iter_obj_in_correlation = false;
-    CORRELATION this_correlation;
-    unordered_map<std::string, float> weights;
-    unordered_set<std::string> all_weight_targets;
-    for (const auto &syst : systematics)
-        all_weight_targets.insert(syst.target);
-    for (const auto &correlation : correlations)
+    // other iterations: the correlation group the iterated systematic belongs to
+    for (const auto &iter_obj : systematics_evtLoopAgain)
     {
-        if (correlation.second.rep_name == current_Iter_obj.syst_name)
-        {
-            Iter_obj_in_correlation = true;
-            this_correlation = correlation.second;
-            break;
-        }
-        for (const auto &child_syst : correlation.second.child_syst_names)
+        if (iter_obj.variation == MyCorrection::variation::nom)
+            continue;
+        bool Iter_obj_in_correlation = false;
+        CORRELATION this_correlation;
+        for (const auto &correlation : correlations)
         {
-            if (child_syst == current_Iter_obj.syst_name)
+            if (correlation.second.rep_name == iter_obj.syst_name)
             {
                 Iter_obj_in_correlation = true;
                 this_correlation = correlation.second;
                 break;
             }
+            for (const auto &child_syst : correlation.second.child_syst_names)
+            {
+                if (child_syst == iter_obj.syst_name)
+                {
+                    Iter_obj_in_correlation = true;
+                    this_correlation = correlation.second;
+                    break;
+                }
+            }
         }
+        WEIGHT_PRODUCT product;
+        if (Iter_obj_in_correlation)
+        {
+            SYST *rep = findSystematic(this_correlation.rep_name);
+            product.factors.emplace_back(getWeightSlot(rep->target), getWeightSlot(rep->syst));
+            for (const auto &syst : this_correlation.child_syst_names)
+                product.factors.emplace_back(getWeightSlot(findSystematic(syst)->target), getWeightSlot(syst));
+        }
+        non_central_products[iter_obj.syst_name] = product;
     }
 
-    weights[current_Iter_obj.iter_name] = 1.;
-    for (const auto &target : all_weight_targets)
+    weight_values.reserve(central_weight_names.size());
+}
+
+std::unordered_map<std::string, float> SystematicHelper::calculateWeight(bool dry_run)
+{
+    const std::vector<float> &values = calculateWeightVector(dry_run);
+    const std::vector<std::string> &names = getWeightNames();
+    unordered_map<std::string, float> weights;
+    for (unsigned int i = 0; i < values.size(); i++)
+        weights[names[i]] = values[i];
+    return weights;
+}
+
+const std::vector<float>& SystematicHelper::calculateWeightVector(bool dry_run)
+{
+    if(!weight_functions_assigned && !dry_run)
     {
-        weights[current_Iter_obj.iter_name] *= weight_map_nominal[target];
+        std::cerr << "Weight functions are not assigned" << std::endl;
+        exit(1);
     }
-    if (!Iter_obj_in_correlation)
-        return weights;
-    else
+    for (const auto &syst : compiled_systs)
     {
-
-        switch (current_Iter_obj.variation)
+        switch (syst.kind)
         {
-        case MyCorrection::variation::up:
-            weights[current_Iter_obj.iter_name]  = safe_divide(weights[current_Iter_obj.iter_name], weight_map_nominal[findSystematic(this_correlation.rep_name)->target]);
-            weights[current_Iter_obj.iter_name] *= weight_map_up[findSystematic(this_correlation.rep_name)->syst];
-            for (const auto &syst : this_correlation.child_syst_names)
-            {
-                weights[current_Iter_obj.iter_name] = safe_divide(weights[current_Iter_obj.iter_name] ,weight_map_nominal[findSystematic(syst)->target]);
-                weights[current_Iter_obj.iter_name] *= weight_map_up[syst];
-            }
+        case 0:
+            weight_values_nominal[syst.target_slot] = 1.;
+            weight_values_up[syst.target_slot] = 1.;
+            weight_values_down[syst.target_slot] = 1.;
             break;
-        case MyCorrection::variation::down:
-            weights[current_Iter_obj.iter_name] = safe_divide(weights[current_Iter_obj.iter_name], weight_map_nominal[findSystematic(this_correlation.rep_name)->target]);
-            weights[current_Iter_obj.iter_name] *= weight_map_down[findSystematic(this_correlation.rep_name)->syst];
-            for (const auto &syst : this_correlation.child_syst_names)
-            {
-                weights[current_Iter_obj.iter_name] = safe_divide(weights[current_Iter_obj.iter_name], weight_map_nominal[findSystematic(syst)->target]);
-                weights[current_Iter_obj.iter_name] *= weight_map_down[syst];
-            }
+        case 1:
+        {
+            float weight = 1.;
+            if(!dry_run) weight = syst.weight_function_onesided();
+            weight_values_nominal[syst.target_slot] = weight;
+            weight_values_up[syst.syst_slot] = 1.;
+            weight_values_down[syst.syst_slot] = weight;
             break;
+        }
         default:
+        {
+            float weight_up = 1.;
+            float weight_down = 1.;
+            float weight_nominal = 1.;
+            if(!dry_run)
+            {
+                weight_nominal = syst.weight_function(MyCorrection::variation::nom, "total");
+                weight_up = syst.weight_function(MyCorrection::variation::up, syst.source);
+                weight_down = syst.weight_function(MyCorrection::variation::down, syst.source);
+            }
+            weight_values_nominal[syst.target_slot] = weight_nominal;
+            weight_values_up[syst.syst_slot] = weight_up;
+            weight_values_down[syst.syst_slot] = weight_down;
             break;
         }
+        }
     }
-    return weights;
+    weight_values.clear();
+    if (current_Iter_obj.variation == MyCorrection::variation::nom)
+    {
+        calculateWeight_central_case();
+    }
+    else
+    {
+        calculateWeight_non_central_case();
+    }
+
+    return weight_values;
+}
+
+void SystematicHelper::calculateWeight_central_case()
+{
+    float nominal_weight = 1.;
+    for (const auto &slot : nominal_target_slots)
+        nominal_weight *= weight_values_nominal[slot];
+
+    current_weight_names = &central_weight_names;
+    if (isDedicatedSample)
+    {
+        weight_values.push_back(nominal_weight);
+        return;
+    }
+    weight_values.push_back(nominal_weight);
+    for (const auto &product : central_products)
+    {
+        float weight_up = nominal_weight;
+        float weight_down = nominal_weight;
+        for (const auto &factor : product.factors)
+        {
+            weight_up = safe_divide(weight_up, weight_values_nominal[factor.first]);
+            weight_down = safe_divide(weight_down, weight_values_nominal[factor.first]);
+            weight_up *= weight_values_up[factor.second];
+            weight_down *= weight_values_down[factor.second];
+        }
+        weight_values.push_back(weight_up);
+        weight_values.push_back(weight_down);
+    }
+}
+
+void SystematicHelper::calculateWeight_non_central_case()
+{
+    if (non_central_weight_names.empty() || non_central_weight_names[0] != current_Iter_obj.iter_name)
+        non_central_weight_names = {current_Iter_obj.iter_name};
+    current_weight_names = &non_central_weight_names;
+
+    float weight = 1.;
+    for (const auto &slot : nominal_target_slots)
+        weight *= weight_values_nominal[slot];
+
+    const std::vector<float> &this_values = current_Iter_obj.variation == MyCorrection::variation::up ? weight_values_up : weight_values_down;
+    for (const auto &factor : non_central_products.at(current_Iter_obj.syst_name).factors)
+    {
+        weight = safe_divide(weight, weight_values_nominal[factor.first]);
+        weight *= this_values[factor.second];
+    }
+    weight_values.push_back(weight);
 }
 
 bool SystematicHelper::IsDedicatedSample()
@@ -5,16 +5,30 @@
 #include <unordered_map>
 #include <string>
 #include <deque>
+#include <tuple>
+#include <typeindex>
+#include <functional>
+#include <any>
+#include <unordered_set>
 
 #include "TFile.h"
+#include "Compression.h"
 #include "TH1.h"
 #include "TH1D.h"
 #include "TH2D.h"
 #include "TH3D.h"
+#include "THnSparse.h"
 #include "TTree.h"
 #include "TBranch.h"
 #include "TString.h"
 #include "TObjString.h"
+#include "TLeaf.h"
+#include "TSystem.h"
+#include "RVersion.h"
+#include <ROOT/RNTupleModel.hxx>
+#include <ROOT/RNTupleWriter.hxx>
+#include <ROOT/RDFHelpers.hxx>
+#include <ROOT/RResultHandle.hxx>
 #include "TMath.h"
 
 #include "SKNanoLoader.h"
@@ -39,6 +53,13 @@
 
 #include "LHAPDFHandler.h"
 #include "PDFReweight.h"
+
+// RNTupleModel and RNTupleWriter moved out of ROOT::Experimental in 6.36
+#if ROOT_VERSION_CODE >= ROOT_VERSION(6, 36, 0)
+namespace RNTupleAPI = ROOT;
+#else
+namespace RNTupleAPI = ROOT::Experimental;
+#endif
 #include "MyCorrection.h"
 #include "JetTaggingParameter.h"
 #include "PhysicalConstants.h"
@@ -66,6 +87,12 @@ public:
 
     virtual void initializeAnalyzer() {};
     virtual void executeEvent() {};
+    // called by SKNanoLoader::Loop before executeEvent, resets per-event caches
+    virtual void beginEvent() {
+        if (myCorr) myCorr->ClearEventCache();
+        if (histbuffer_flush_interval > 0 && ++histbuffer_nevents % histbuffer_flush_interval == 0) FlushHistBuffer();
+        ResetObjects();
+    }
 
     inline bool HasFlag(const TString &flag) { return std::find(Userflags.begin(), Userflags.end(), flag) != Userflags.end(); }
 
@@ -79,7 +106,9 @@ public:
     PDFReweight *pdfReweight;
     float GetPDFWeight(LHAPDF::PDF *pdf_);
     float GetPDFReweight();
-    float GetPDFReweight(int member);    
+    float GetPDFReweight(int member);
+    // all members of the error set at once, see PDFReweight::GetErrorSetReweights
+    const RVec<float>& GetPDFReweights();    
     // Correction
     MyCorrection *myCorr;
     //unique_ptr<CorrectionSet> csetMuon;
@@ -142,6 +171,14 @@ public:
     int GetGenPhotonType(const Gen& genph, const RVec<Gen>& gens);
     int GetPrElType_InSameSCRange_Public(int genIdx, const RVec<Gen>& gens);
 
+    // Counter-based random numbers, see CounterRNG.h
+    // A stream is a pure function of (run, lumi, event, object index, purpose), no generator state is kept,
+    // so the draws are thread-safe and identical in every systematic rerun of the same event
+    enum class RandomPurpose { JetSmear = 1, MuonScale = 2, ElectronSmear = 3, User = 100 };
+    uint64_t GetRandomStream(RandomPurpose purpose, unsigned int index) const;
+    inline double GetRandomUniform(RandomPurpose purpose, unsigned int index, unsigned int draw = 0) const { return CounterRNG::Uniform(GetRandomStream(purpose, index), draw); }
+    inline double GetRandomGaus(RandomPurpose purpose, unsigned int index, double mean = 0., double sigma = 1., unsigned int draw = 0) const { return CounterRNG::Gaus(GetRandomStream(purpose, index), mean, sigma, draw); }
+
     // Scale and smear
     void METType1Propagation(Particle &MET, RVec<Particle> &original_objects, RVec<Particle> &corrected_objects);
     float GetL1PrefireWeight(MyCorrection::variation syst = MyCorrection::variation::nom);
@@ -155,6 +192,10 @@ public:
     RVec<Jet> SmearJets(const RVec<Jet> &jets, const RVec<GenJet> &genjets, const TString &syst, const TString &source="total");
     RVec<Jet> ScaleJets(const RVec<Jet> &jets, const MyCorrection::variation &syst=MyCorrection::variation::nom, const TString &source = "total");
     RVec<Jet> ScaleJets(const RVec<Jet> &jets, const TString &syst, const TString &source="total");
+    // JES uncertainty of every jet and source in JESUncertaintySources, [jet][source]
+    // Evaluated on the unsmeared P4 and cached until the input jets change, so up/down and split sources share one evaluation
+    const RVec<RVec<float>> &GetJESUncertaintyMatrix(const RVec<Jet> &jets);
+    inline const RVec<TString> &GetJESUncertaintySources() const { return JESUncertaintySources; }
     
     // Type-I MET correction with correlated object variations
     Particle ApplyTypeICorrection(const Particle& MET,
@@ -165,7 +206,14 @@ public:
     
     // Histogram Handlers
     TFile* GetOutfile() { return outfile; }
-    inline void SetOutfilePath(const TString &outpath) { outfile = new TFile(outpath, "RECREATE"); }
+    inline void SetOutfilePath(const TString &outpath) {
+        outfile = new TFile(outpath, "RECREATE");
+        if (outfileCompression >= 0) outfile->SetCompressionSettings(outfileCompression);
+    }
+    // algorithm: ZLIB, LZMA, LZ4 or ZSTD, level: 1-9. ROOT default compression is used if not set
+    void SetOutfileCompression(const TString &algorithm, int level);
+    // print a single summary line in WriteHist instead of one line per histogram
+    inline void SetWriteHistSummaryOnly(bool summaryOnly=true) { writeHistSummaryOnly = summaryOnly; }
     TH1D* GetHist1D(const string &histname);
     bool PassVetoMap(const Jet &jet, const RVec<Muon> &AllMuons, const TString mapCategory="jetvetomap");
     bool PassVetoMap(const RVec<Jet> &AllJets, const RVec<Muon> &AllMuons, const TString mapCategory="jetvetomap");
@@ -194,6 +242,138 @@ public:
     inline void FillHist(const TString &histname, float value_x, float value_y, float weight, const RVec<float> &xbins, const RVec<float> &ybins) {FillHist(histname, value_x, value_y, weight, xbins.size() - 1, const_cast<float *>(xbins.data()), ybins.size() - 1, const_cast<float *>(ybins.data())); }
     inline void FillHist(const TString &histname, float value_x, float value_y, float value_z, float weight, const RVec<float> &xbins, const RVec<float> &ybins, const RVec<float> &zbins) {FillHist(histname, value_x, value_y, value_z, weight, xbins.size() - 1, const_cast<float *>(xbins.data()), ybins.size() - 1, const_cast<float *>(ybins.data()), zbins.size() - 1, const_cast<float *>(zbins.data())); }
 
+    // Sparse storage for 2D/3D histograms
+    // Histograms whose path starts with one of the registered prefixes (all 2D/3D histograms with the useSparseHist flag)
+    // are backed by THnSparse while filling and converted to dense TH2D/TH3D in WriteHist.
+    // Only applies to the string based FillHist, booked handles are always dense.
+    inline void SetSparseHist(const TString &prefix) { sparsePrefixes.push_back(string(prefix)); }
+    // Print the estimated memory of all histograms and the ntop largest ones, called in WriteHist with the printHistMemory flag
+    void PrintHistMemoryReport(int ntop=10);
+
+    // Pre-registered histogram handles
+    // BookHist creates (or finds) the histogram once and returns an integer handle,
+    // FillHist(handle, ...) is then a direct array access without string formatting or hashing.
+    // Booked histograms share the same storage as the string based FillHist and are written by WriteHist.
+    int BookHist(const TString &histname, int n_bin, float x_min, float x_max);
+    int BookHist(const TString &histname, int n_bin, float *xbins);
+    int BookHist(const TString &histname, int n_binx, float x_min, float x_max,
+                                          int n_biny, float y_min, float y_max);
+    int BookHist(const TString &histname, int n_binx, float *xbins,
+                                          int n_biny, float *ybins);
+    int BookHist(const TString &histname, int n_binx, float x_min, float x_max,
+                                          int n_biny, float y_min, float y_max,
+                                          int n_binz, float z_min, float z_max);
+    int BookHist(const TString &histname, int n_binx, float *xbins,
+                                          int n_biny, float *ybins,
+                                          int n_binz, float *zbins);
+    inline int BookHist(const TString &histname, const RVec<float> &xbins) { return BookHist(histname, xbins.size()-1, const_cast<float*>(xbins.data())); }
+    inline int BookHist(const TString &histname, const RVec<float> &xbins, const RVec<float> &ybins) { return BookHist(histname, xbins.size()-1, const_cast<float*>(xbins.data()), ybins.size()-1, const_cast<float*>(ybins.data())); }
+    inline int BookHist(const TString &histname, const RVec<float> &xbins, const RVec<float> &ybins, const RVec<float> &zbins) { return BookHist(histname, xbins.size()-1, const_cast<float*>(xbins.data()), ybins.size()-1, const_cast<float*>(ybins.data()), zbins.size()-1, const_cast<float*>(zbins.data())); }
+    inline TH1* GetHist(int handle) const { return histhandles[handle]; }
+    inline void FillHist(int handle, float value, float weight) {
+        const int systbin = histhandle_systbins[handle];
+        if (systbin < 0) histhandles[handle]->Fill(value, weight);
+        else static_cast<TH2*>(histhandles[handle])->Fill(value, systbin - 0.5, weight);
+    }
+    inline void FillHist(int handle, float value_x, float value_y, float weight) { static_cast<TH2*>(histhandles[handle])->Fill(value_x, value_y, weight); }
+    inline void FillHist(int handle, float value_x, float value_y, float value_z, float weight) { static_cast<TH3*>(histhandles[handle])->Fill(value_x, value_y, value_z, weight); }
+
+    // Templated histogram paths indexed by (channel, syst, object index)
+    // The pattern may contain the placeholders {channel}, {syst} and {idx}, e.g. "{channel}/{syst}/jets/{idx}/pt".
+    // Histograms are booked lazily on the first GetHistHandle call for each combination,
+    // so only the combinations that are actually filled end up in the output.
+    // With the useSystAxis flag, 1D patterns containing {syst} are stored as one TH2 per (channel, idx)
+    // with a labelled systematic axis along y, named after the pattern with {syst} -> SystAxis.
+    // The legacy path template is kept in the histogram title, python/exportSystAxis.py
+    // splits such a file back into the one-histogram-per-systematic layout.
+    int BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                        int n_bin, float x_min, float x_max);
+    int BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                        const RVec<float> &xbins);
+    int BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                        int n_binx, float x_min, float x_max,
+                        int n_biny, float y_min, float y_max);
+    int BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                        const RVec<float> &xbins, const RVec<float> &ybins);
+    int GetHistHandle(int pattern, int channel, int syst, int idx=0);
+    inline void FillHist(int pattern, int channel, int syst, int idx, float value, float weight) { FillHist(GetHistHandle(pattern, channel, syst, idx), value, weight); }
+
+    // Multi-weight filling for weight-only systematics
+    // The value is computed once and filled with one weight per variation, weights[i] goes to handles[i] / systs[i].
+    // The string based variant takes a path with a {syst} placeholder and a set of systematics booked with BookSystSet,
+    // its handles are looked up once per (path, set) so the cost per variation is a single Fill.
+    // GetSystSetHandles returns these handles, one per systematic of the set; with the useSystAxis flag they are
+    // booked through BookHistPattern and point to the bins of one systematic axis histogram.
+    void FillHist(const RVec<int> &handles, float value, const RVec<float> &weights);
+    void FillHist(int pattern, int channel, const RVec<int> &systs, int idx, float value, const RVec<float> &weights);
+    int BookSystSet(const RVec<TString> &systs);
+    const vector<int>& GetSystSetHandles(const TString &pattern, int systset, int n_bin, float x_min, float x_max);
+    void FillHist(const TString &pattern, int systset, float value, const RVec<float> &weights, int n_bin, float x_min, float x_max);
+
+    // RDataFrame backend, see SKNanoLoader::UseDataFrame
+    // FillHist on a data frame node books a lazy Histo1D/Histo2D action instead of filling, an empty weight fills with 1.
+    // All booked actions run in a single pass in Loop and are merged into the same storage as the imperative FillHist,
+    // so WriteHist writes both. From python, pass nodes as ROOT.RDF.AsRNode(df).
+    void FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column, const string &weight, int n_bin, float x_min, float x_max);
+    void FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column, const string &weight, const RVec<float> &xbins);
+    void FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column_x, const string &column_y, const string &weight,
+                  int n_binx, float x_min, float x_max,
+                  int n_biny, float y_min, float y_max);
+    // Objects of the imperative getters as data frame columns
+    // The getter runs on the branch buffers after LoadEntry, so these need a single-threaded data frame (NThreads = 1).
+    template <typename T>
+    ROOT::RDF::RNode DefineFromEntry(ROOT::RDF::RNode df, const string &name, function<T()> getter) {
+        if (ROOT::IsImplicitMTEnabled()) throw runtime_error("[AnalyzerCore::DefineFromEntry] " + name + " reads the entry into the branch buffers, set NThreads = 1");
+        return df.DefineSlotEntry(name, [this, getter](unsigned int, ULong64_t entry) { LoadEntry(entry); return getter(); }, {});
+    }
+    ROOT::RDF::RNode DefineAllMuons(ROOT::RDF::RNode df, const string &name = "AllMuons");
+    ROOT::RDF::RNode DefineAllElectrons(ROOT::RDF::RNode df, const string &name = "AllElectrons");
+    ROOT::RDF::RNode DefineAllJets(ROOT::RDF::RNode df, const string &name = "AllJets");
+    // Object selections on data frame columns, these only read their input column and are thread-safe
+    ROOT::RDF::RNode DefineSelectedMuons(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax);
+    ROOT::RDF::RNode DefineSelectedElectrons(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax);
+    ROOT::RDF::RNode DefineSelectedJets(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax);
+    void runDataFrame() override;
+
+    // Buffered bulk filling of booked 1D histograms
+    // (handle, value, weight) are stored in contiguous arrays and flushed through TH1::FillN
+    // when the buffer is full, every SetHistFlushInterval events and in WriteHist.
+    // FillHistBuffered appends whole arrays at once, e.g. numpy arrays collected on the python side.
+    inline void BufferHist(int handle, double value, double weight) {
+        histbuffer_handles.push_back(handle);
+        histbuffer_values.push_back(value);
+        histbuffer_weights.push_back(weight);
+        if (histbuffer_handles.size() >= histbuffer_size) FlushHistBuffer();
+    }
+    void FillHistBuffered(int n, const int *handles, const double *values, const double *weights);
+    void FillHistN(int handle, int n, const double *values, const double *weights);
+    void FlushHistBuffer();
+    inline void SetHistBufferSize(size_t size) { histbuffer_size = max<size_t>(size, 1); }
+    inline void SetHistFlushInterval(int nevents) { histbuffer_flush_interval = nevents; }
+
+    // Columnar batch mode, enabled with BatchSize > 0
+    // Loop collects the declared columns of BatchSize events into flat arrays and calls executeBatch once per batch.
+    // Jagged columns have offsets of size nevents+1, the values of event i are values[offsets[i]:offsets[i+1]].
+    // SetBatchColumns reads input branches as they are, SetBatchObjects collects the kinematics of the
+    // corrected GetAllMuons / GetAllElectrons / GetAllJets objects as <collection>.pt, .eta, .phi, .mass (.charge for leptons)
+    // and <collection>.idbits, where bit i is PassID(ids[i]).
+    void SetBatchColumns(const RVec<TString> &branches);
+    void SetBatchObjects(const TString &collection, const RVec<TString> &ids = {});
+    inline long GetBatchNEvents() const { return batch_nevents; }
+    inline RVec<TString> GetBatchColumnNames() const {
+        RVec<TString> names;
+        for (const auto &column: batchcolumns) names.push_back(column.name);
+        return names;
+    }
+    const vector<double>& GetBatchValues(const TString &column) const;
+    const vector<Long64_t>& GetBatchOffsets(const TString &column) const;
+    void collectBatchEntry() override;
+    void clearBatch() override;
+    // Array versions of the per-object corrections, entries with n values
+    RVec<double> GetMuonIDSFBatch(const TString &Muon_ID_SF_Key, int n, const double *eta, const double *pt, MyCorrection::variation syst = MyCorrection::variation::nom);
+    RVec<double> GetElectronIDSFBatch(const TString &Electron_ID_SF_Key, int n, const double *eta, const double *pt, const double *phi, MyCorrection::variation syst = MyCorrection::variation::nom);
+    RVec<double> GetPUWeightBatch(int n, const double *nTrueInt, MyCorrection::variation syst = MyCorrection::variation::nom);
+
 
     TTree* NewTree(const TString &treename, const RVec<TString> &keeps = {}, const RVec<TString> &drops = {});
     TTree* GetTree(const TString &treename);
@@ -206,19 +386,285 @@ public:
     //inline void SetBranch(const TString &treename, const TString &branchname, std::vector<T> &val) {SetBranch_Vector(treename, branchname, val);};
 
     void FillTrees(const TString &treename="");
+
+    // Typed output columns
+    // Declare each column once (e.g. in initializeAnalyzer), the returned pointer has a stable address until WriteHist.
+    // Set the value through the pointer every event and call FillTrees, no per-event allocation or string lookup is needed.
+    // Vector columns are cleared after each fill of their tree, their capacity is kept.
+    // Supported types: bool, int, unsigned int, Long64_t, ULong64_t, float, double
+    // From python: ptr = self.NewColumn['float']("Events", "pt"); ptr[0] = mu.Pt()
+    template <typename T>
+    T* NewColumn(const TString &treename, const TString &colname) {
+        if (T *address = static_cast<T*>(findColumn(treename, colname, typeid(T)))) return address;
+        auto &storage = get<deque<T>>(column_scalars);
+        storage.emplace_back();
+        T *address = &storage.back();
+        if (isNTupleOutput(treename)) getNTupleModel(treename)->MakeField<T>(colname.Data());
+        else NewTree(treename)->Branch(colname, address);
+        registerColumn(treename, colname, typeid(T), address);
+        return address;
+    }
+    template <typename T>
+    vector<T>* NewVectorColumn(const TString &treename, const TString &colname) {
+        if (vector<T> *address = static_cast<vector<T>*>(findColumn(treename, colname, typeid(vector<T>)))) return address;
+        auto &storage = get<deque<vector<T>>>(column_vectors);
+        storage.emplace_back();
+        vector<T> *address = &storage.back();
+        if (isNTupleOutput(treename)) getNTupleModel(treename)->MakeField<vector<T>>(colname.Data());
+        else NewTree(treename)->Branch(colname, address);
+        registerColumn(treename, colname, typeid(vector<T>), address);
+        column_resetters[string(treename)].push_back([address]() { address->clear(); });
+        return address;
+    }
+
+    // Output backend of a tree: "TTree" (default), "RNTuple" or "Parquet", set before the first NewColumn of the tree.
+    // RNTuple and Parquet trees are filled through the typed column API only, SetBranch and NewTree do not apply to them.
+    // Parquet trees are written as RNTuple and listed in the SKNanoParquetTrees object of the output file,
+    // mergeHists.py converts them to <output>_<tree>.parquet after the merge.
+    void SetTreeBackend(const TString &treename, const TString &backend);
+
+    // Object pipeline
+    // Each object is defined once with the inputs it depends on, other objects or variation tags such as "MuonEn".
+    // SetVariation(syst, tags) marks the tags as varied, GetObject then recomputes only the objects downstream of them
+    // and takes all the others from the nominal pass of the same event. Raw inputs are registered per event with SetObject,
+    // all objects are dropped in beginEvent. Producers must read their inputs with GetObject, reading an undeclared input throws.
+    // e.g. DefineObject<RVec<Muon>>("looseMuons", {"allMuons"}, [this](const TString &syst) { return SelectMuons(GetObject<RVec<Muon>>("allMuons"), ...); });
+    template <typename T>
+    void DefineObject(const TString &name, const RVec<TString> &inputs, function<T(const TString &syst)> producer) {
+        ObjectStep step;
+        for (const auto &input: inputs) step.inputs.push_back(string(input));
+        step.producer = [producer](const TString &syst) { return any(producer(syst)); };
+        objectsteps[string(name)] = std::move(step);
+        objects_isvaried.clear();
+        objects_current_isvaried = &objects_isvaried[string(objects_variation)];
+    }
+    template <typename T>
+    void SetObject(const TString &name, T object) { objects_nominal[string(name)] = any(std::move(object)); }
+    template <typename T>
+    const T& GetObject(const TString &name) {
+        const T *object = any_cast<T>(&getObject(string(name)));
+        if (!object) throw runtime_error("[AnalyzerCore::GetObject] " + string(name) + " is not of the requested type");
+        return *object;
+    }
+    void SetVariation(const TString &syst, const RVec<TString> &tags = {});
+    void ResetObjects();
+
+    // Slim event cache
+    // Stores per selected event the declared variables, cut bits, weights and labels (e.g. channel, scale variation)
+    // so that python/reHist.py can make histograms with new binnings or cuts without rerunning the event loop.
+    // Declare everything once in initializeAnalyzer, set the values per event and call FillEventCache.
+    // Label values are declared up front so that the integer codes agree between jobs,
+    // the names of cuts, weights and label values are written to the SKNanoEventCache object of the output file.
+    void EnableEventCache(const TString &backend = "RNTuple", const TString &treename = "EventCache");
+    float* CacheVariable(const TString &name);
+    float* CacheWeight(const TString &name);
+    int CacheCut(const TString &name);
+    void CacheLabel(const TString &label, const RVec<TString> &values);
+    inline void SetCacheCut(int bit, bool pass) { if (pass) *eventcache_cutbits |= (ULong64_t(1) << bit); }
+    void SetCacheWeights(const unordered_map<string, float> &weights);
+    void SetCacheLabel(const TString &label, const TString &value);
+    void FillEventCache();
+    // Friend tree output for incremental reruns, read back with SKNanoLoader::AddFriend
+    // An augment run calls EnableFriendOutput in initializeAnalyzer and FillFriend for every entry, before any selection.
+    // FillFriend stores the jet (Jet_JESSF, Jet_smearFactor) and muon (Muon_roccor, Muon_roccorErr) corrections
+    // of the unselected GetAllJets / GetAllMuons output, plus any columns declared with NewColumn / NewVectorColumn
+    // on the friend tree (per-object SFs, ML scores, ...). The friend is always a TTree since TChain friends have to be trees,
+    // name the tree in FillTrees calls of the analyzer so that it is not filled twice.
+    // The friend is written to its own file, outpath or by default the output path with hists replaced by friend
+    // (output/hists_3.root -> output/friend_3.root), so that it is not merged with the histograms.
+    // The UUID and entry count of every input file are written to the SKNanoFriendInfo object of the friend file.
+    void EnableFriendOutput(const TString &treename = "Friends", const TString &outpath = "");
+    void FillFriend(const RVec<Jet> &allJets, const RVec<Muon> &allMuons);
+    // Columns of an attached friend tree, declare them once in initializeAnalyzer, the pointer is valid for every entry
+    // From python: score = self.FriendColumn['float']("mlscore"); score[0]
+    template <typename T>
+    const T* FriendColumn(const TString &colname) {
+        if (!HasFriendColumn(colname)) throw runtime_error("[AnalyzerCore::FriendColumn] " + string(colname) + " is not in an attached friend tree");
+        T *address = any_cast<T>(&friendcolumns.emplace_back(T()));
+        fChain->SetBranchStatus(colname, 1);
+        fChain->SetBranchAddress(colname, address);
+        return address;
+    }
+    template <typename T>
+    const vector<T>* FriendVectorColumn(const TString &colname) {
+        if (!HasFriendColumn(colname)) throw runtime_error("[AnalyzerCore::FriendVectorColumn] " + string(colname) + " is not in an attached friend tree");
+        vector<T> *address = any_cast<vector<T>>(&friendcolumns.emplace_back(vector<T>()));
+        vector<T> **pointer = any_cast<vector<T>*>(&friendcolumns.emplace_back(address));
+        fChain->SetBranchStatus(colname, 1);
+        fChain->SetBranchAddress(colname, pointer);
+        return address;
+    }
+    // Skim writer
+    // Instead of NewTree(name, keeps, drops) + per-event Fill, call SelectSkimEntry() for every event to keep.
+    // WriteHist then copies the selected entries of each input file into <outpath stem>_<input index>.root
+    // (or into a single outpath with perInput=false). Inputs with every entry selected are fast-cloned without
+    // recompression, the others are copied with IMT parallel basket compression if SetSkimNThreads is set,
+    // IMT is enabled only during the copy. Skim_DiLepton is an example.
+    // Compression follows SetOutfileCompression. In per-input mode the analyzer outfile is removed if it is left empty.
+    void SetSkimOutput(const TString &outpath, const RVec<TString> &keeps = {}, const RVec<TString> &drops = {}, bool perInput = true);
+    inline void SelectSkimEntry() { skim_entries.emplace_back(fChain->GetTreeNumber(), fChain->GetTree()->GetReadEntry()); }
+    inline void SetSkimAutoFlush(Long64_t autoflush) { skim_autoflush = autoflush; }
+    inline void SetSkimNThreads(int nthreads) { skim_nthreads = nthreads; }
+    void WriteSkim();
+
+    // Basket size in bytes of all branches in the tree, and the AutoFlush setting (>0: entries, <0: bytes)
+    void SetTreeBasketSize(const TString &treename, int basketsize);
+    void SetTreeAutoFlush(const TString &treename, Long64_t autoflush);
     virtual void WriteHist();
 
 private:
     bool useTH1F = false;
+    // lazy data frame histograms, merged into histmap1d / histmap2d in runDataFrame
+    vector<pair<string, ROOT::RDF::RResultPtr<TH1D>>> dfhists1d; //!
+    vector<pair<string, ROOT::RDF::RResultPtr<TH2D>>> dfhists2d; //!
+    RVec<TString> JESUncertaintySources = {"AbsoluteMPFBias",
+                                           "AbsoluteScale",
+                                           "AbsoluteStat",
+                                           "FlavorQCD",
+                                           "Fragmentation",
+                                           //"PileUpDataMC",
+                                           //"PileUpPtBB",
+                                           //"PileUpPtEC1",
+                                           //"PileUpPtEC2",
+                                           //"PileUpPtHF",
+                                           //"PileUpPtRef",
+                                           "PileUpEnvelope",
+                                           "RelativeJEREC1",
+                                           "RelativeJEREC2",
+                                           "RelativeJERHF",
+                                           "RelativePtBB",
+                                           "RelativePtEC1",
+                                           "RelativePtEC2",
+                                           "RelativePtHF",
+                                           "RelativeBal",
+                                           "RelativeSample",
+                                           "RelativeFSR",
+                                           "RelativeStatFSR",
+                                           "RelativeStatEC",
+                                           "RelativeStatHF",
+                                           "SinglePionECAL",
+                                           "SinglePionHCAL",
+                                           "TimePtEta"};
+    RVec<float> jes_unc_cache_eta;
+    RVec<float> jes_unc_cache_pt;
+    RVec<RVec<float>> jes_unc_cache;
     unordered_map<string, TH1*> histmap1d;
     unordered_map<string, TH2*> histmap2d;
     unordered_map<string, TH3*> histmap3d;
+    unordered_map<string, THnSparse*> sparsemap;
+    vector<string> sparsePrefixes;
+    bool isSparseHist(const string &histkey);
+    inline THnSparse* findSparseHist(const string &histkey) const {
+        if (sparsemap.empty()) return nullptr;
+        auto it = sparsemap.find(histkey);
+        return it == sparsemap.end() ? nullptr : it->second;
+    }
+    THnSparse* newSparseHist(const string &histkey, const vector<TAxis> &axes);
+    vector<TH1*> histhandles;
+    vector<int> histhandle_systbins; // systematic axis bin of the handle, -1 for plain histograms
+    unordered_map<string, int> histhandlemap;
+    vector<RVec<TString>> systsets;
+    unordered_map<string, vector<int>> systsethandles;
+    struct HistPattern {
+        string pattern;
+        RVec<TString> channels;
+        RVec<TString> systs;
+        int n_idx;
+        bool systAxis;
+        TH1 *proto;
+        vector<int> handles;
+    };
+    vector<HistPattern> histpatterns; //!
+    TH1 *findHist(const string &histkey, int dim) const;
+    int registerHist(const string &histkey, TH1 *hist, int systbin=-1);
+    int bookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx, TH1 *proto);
+    vector<int> histbuffer_handles;
+    vector<double> histbuffer_values;
+    vector<double> histbuffer_weights;
+    vector<double> histbuffer_sorted_values;
+    vector<double> histbuffer_sorted_weights;
+    vector<size_t> histbuffer_offsets;
+    size_t histbuffer_size = 1 << 20;
+    int histbuffer_flush_interval = 1000;
+    long histbuffer_nevents = 0;
+    struct BatchColumn {
+        string name;
+        TLeaf *leaf = nullptr;
+        bool jagged = false;
+        vector<double> values;
+        vector<Long64_t> offsets;
+    };
+    vector<BatchColumn> batchcolumns; //!
+    unordered_map<string, size_t> batchcolumn_index; //!
+    map<string, RVec<TString>> batchobjects; //!
+    int batch_treenumber = -1;
+    long batch_nevents = 0;
+    BatchColumn& addBatchColumn(const string &name, bool jagged);
     unordered_map<string, TTree*> treemap;
     unordered_map<TTree*, unordered_map<string, TBranch*>> branchmaps; 
+    tuple<deque<bool>, deque<int>, deque<unsigned int>, deque<Long64_t>, deque<ULong64_t>, deque<float>, deque<double>> column_scalars; //!
+    tuple<deque<vector<bool>>, deque<vector<int>>, deque<vector<unsigned int>>, deque<vector<Long64_t>>, deque<vector<ULong64_t>>, deque<vector<float>>, deque<vector<double>>> column_vectors; //!
+    unordered_map<string, pair<type_index, void*>> columnmap; //!
+    unordered_map<string, vector<function<void()>>> column_resetters; //!
+    unordered_map<string, string> treebackends;
+    unordered_map<string, unique_ptr<RNTupleAPI::RNTupleModel>> ntuplemodels; //!
+    unordered_map<string, unique_ptr<RNTupleAPI::RNTupleWriter>> ntuplewriters; //!
+    unordered_map<string, unique_ptr<RNTupleAPI::REntry>> ntupleentries; //!
+    unordered_map<string, vector<pair<string, void*>>> ntuplecolumns;
+    inline bool isNTupleOutput(const TString &treename) const {
+        auto it = treebackends.find(string(treename));
+        return it != treebackends.end() && it->second != "TTree";
+    }
+    RNTupleAPI::RNTupleModel* getNTupleModel(const TString &treename);
+    void fillNTuple(const string &treename);
+    void* findColumn(const TString &treename, const TString &colname, const type_info &type) const;
+    void registerColumn(const TString &treename, const TString &colname, const type_info &type, void *address);
+    TString skim_outpath = "";
+    RVec<TString> skim_keeps;
+    RVec<TString> skim_drops;
+    bool skim_perInput = true;
+    Long64_t skim_autoflush = 0;
+    int skim_nthreads = 0;
+    vector<pair<int, Long64_t>> skim_entries;
+    TString friend_name = "";
+    TFile *friend_file = nullptr;
+    vector<float> *friend_jet_jessf = nullptr;
+    vector<float> *friend_jet_smearfactor = nullptr;
+    vector<float> *friend_muon_roccor = nullptr;
+    vector<float> *friend_muon_roccorerr = nullptr;
+    deque<any> friendcolumns; //!
+    void writeFriendInfo();
+    TString eventcache_name = "";
+    ULong64_t *eventcache_cutbits = nullptr;
+    vector<string> eventcache_variables;
+    vector<string> eventcache_weights;
+    vector<string> eventcache_cuts;
+    map<string, vector<string>> eventcache_labels;
+    unordered_map<string, int*> eventcache_labelcolumns;
+    unordered_map<string, float*> eventcache_weightcolumns;
+    void writeEventCacheInfo();
+    struct ObjectStep {
+        vector<string> inputs;
+        function<any(const TString&)> producer;
+    };
+    unordered_map<string, ObjectStep> objectsteps; //!
+    unordered_map<string, any> objects_nominal; //!
+    unordered_map<string, any> objects_varied; //!
+    unordered_set<string> objects_varied_tags; //!
+    TString objects_variation = "Central"; //!
+    unordered_map<string, unordered_map<string, bool>> objects_isvaried; //!
+    unordered_map<string, bool> *objects_current_isvaried = nullptr; //!
+    vector<const ObjectStep*> objects_running; //!
+    const any& getObject(const string &name);
+    bool isVariedObject(const string &name);
     deque<float> this_floats;
     deque<int> this_ints;
     deque<char> this_bools;
     TFile *outfile;
+    int outfileCompression = -1;
+    bool writeHistSummaryOnly = false;
+    unordered_map<string, TDirectory*> outdirmap;
+    TDirectory* getOutputDirectory(const string &prefix);
     void SetBranch(const TString &treename, const TString &branchname, void *address, const TString &leaflist);
     template <typename T>
     void SetBranch_Vector(const TString &treename, const TString &branchname, std::vector<T> &address) {
@@ -20,4 +20,5 @@
 #pragma link C++ class LRSM_TBChannel+;
 #pragma link C++ class TTbar_test+;
 #pragma link C++ class DY+;
+#pragma link C++ class Skim_DiLepton+;
 #pragma link C++ class ttbar_hadronic
\ No newline at end of file
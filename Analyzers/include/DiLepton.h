@@ -65,11 +65,8 @@ private:
 
     // private methods
     Channel selectEvent(Event& ev, const RecoObjects& recoObjects, const TString& syst);
-    RecoObjects defineObjects(Event& ev, const RVec<Muon>& rawMuons, 
-                             const RVec<Electron>& rawElectrons, 
-                             const RVec<Jet>& rawJets,
-                             const RVec<GenJet>& genJets, 
-                             const TString& syst = "Central");
+    void defineObjectPipeline();
+    RecoObjects defineObjects(const TString& syst = "Central");
     WeightInfo getWeights(const Channel& channel,
                           const Event& event,
                           const RecoObjects& recoObjects, 
@@ -80,6 +77,10 @@ private:
                      const RecoObjects& recoObjects, 
                      const WeightInfo& weights, 
                      const TString& syst = "Central");
+    void fillObjects(const Channel& channel,
+                     const RecoObjects& recoObjects,
+                     const RVec<WeightInfo>& weights,
+                     const RVec<TString>& systs);
 
     // Cutflow functionality
     enum class CutStage {
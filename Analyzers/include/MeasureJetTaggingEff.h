@@ -28,6 +28,8 @@ protected:
 
     RVec<JetTagging::JetFlavTagger> Taggers;
     RVec<JetTagging::JetFlavTaggerWP> WPs;
+    RVec<RVec<float>> BTaggingCuts;
+    RVec<RVec<pair<float, float>>> CTaggingCuts;
 };
 
 #endif
\ No newline at end of file
@@ -9,6 +9,7 @@ using namespace std;
 #include "TROOT.h"
 #include "TChain.h"
 #include "TChainElement.h"
+#include "TFriendElement.h"
 #include "TFile.h"
 #include "TTree.h"
 #include "TString.h"
@@ -28,6 +29,9 @@ public:
     virtual int AddFile(TString filename) { return fChain->Add(filename, -1); }
 
     long MaxEvent, NSkipEvent;
+    // BatchSize > 0 switches Loop to batch mode: events are collected with collectBatchEntry
+    // and handed over BatchSize at a time to executeBatch instead of executeEvent
+    long BatchSize;
     int LogEvery;
     bool IsDATA;
     TString DataStream;
@@ -44,7 +48,32 @@ public:
     virtual void Init();
     virtual void SetMaxLeafSize();
     virtual void Loop();
+    virtual void beginEvent(){};
     virtual void executeEvent(){};
+    virtual void collectBatchEntry(){};
+    virtual void executeBatch(){};
+    virtual void clearBatch(){};
+
+    // RDataFrame backend
+    // With UseDataFrame, Init builds a ROOT::RDataFrame over the input files and Loop runs the computation graph
+    // booked on GetDataFrame() in a single pass (runDataFrame) instead of calling executeEvent.
+    // The data frame includes the friends attached with AddFriend.
+    // NThreads != 1 enables implicit multithreading, 0 uses all cores. MaxEvent and NSkipEvent need NThreads = 1.
+    bool UseDataFrame;
+    int NThreads;
+    ROOT::RDF::RNode GetDataFrame();
+    virtual void runDataFrame(){};
+    // Friend trees with precomputed columns, written by AnalyzerCore::EnableFriendOutput in an earlier run
+    // Call after AddFile and before Init. The friend has to be produced from the same input files in the same order
+    // with one entry per input entry, which is checked with the UUID and the entry count of every input file.
+    // Init binds the stored jet and muon corrections, GetAllJets and GetAllMuons then use them instead of recomputing.
+    void AddFriend(const TString &path, const TString &treename = "Friends");
+    inline bool HasFriendColumn(const TString &colname) const { return find(FriendColumns.begin(), FriendColumns.end(), colname) != FriendColumns.end(); }
+    RVec<TString> FriendColumns;
+
+    // Read one entry of fChain into the branch buffers and call beginEvent,
+    // so the imperative getters can be called from a single-threaded RDataFrame
+    void LoadEntry(long entry);
 
     virtual void SetEra(TString era) {
         DataEra=era;
@@ -61,6 +90,18 @@ public:
     virtual int GetYear() const { return DataYear; }
 
     TChain *fChain=nullptr;
+    unique_ptr<TChain> fDataFrameChain; //!
+    unique_ptr<ROOT::RDataFrame> fDataFrame; //!
+    // corrections from a friend tree, see AddFriend
+    bool FriendJetCorrections = false;
+    bool FriendMuonCorrections = false;
+    vector<float> *Friend_Jet_JESSF = nullptr; //!
+    vector<float> *Friend_Jet_smearFactor = nullptr; //!
+    vector<float> *Friend_Muon_roccor = nullptr; //!
+    vector<float> *Friend_Muon_roccorErr = nullptr; //!
+    long fLoadedEntry = -1; //!
+    void SyncRunIICounts();
+    bool isDataFrameRanged() const;
     // ****** WARNING ******
     // Do not mix RVec and Array while declaring variables
     // It will cause a memory allocation issue - not be spotted while compiling
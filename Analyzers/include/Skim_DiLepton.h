@@ -0,0 +1,16 @@
+#ifndef Skim_DiLepton_h
+#define Skim_DiLepton_h
+
+#include "AnalyzerCore.h"
+
+// Keeps events with at least two loose leptons (muons and electrons, pt > 10 GeV)
+// The selected entries are copied with the skim writer, see AnalyzerCore::SetSkimOutput
+class Skim_DiLepton : public AnalyzerCore {
+public:
+    Skim_DiLepton();
+    ~Skim_DiLepton();
+    void initializeAnalyzer();
+    void executeEvent();
+};
+
+#endif
@@ -1,4 +1,5 @@
 #include "AnalyzerCore.h"
+using json = nlohmann::json;
 
 AnalyzerCore::AnalyzerCore() {
     myCorr = nullptr;
@@ -18,7 +19,11 @@ AnalyzerCore::~AnalyzerCore() {
     for (const auto &pair: histmap1d) delete pair.second; histmap1d.clear();
     for (const auto &pair: histmap2d) delete pair.second; histmap2d.clear();
     for (const auto &pair: histmap3d) delete pair.second; histmap3d.clear();
+    for (const auto &pair: sparsemap) delete pair.second; sparsemap.clear();
+    for (const auto &pattern: histpatterns) delete pattern.proto; histpatterns.clear();
+    histhandles.clear(); histhandle_systbins.clear(); histhandlemap.clear();
     if (outfile) delete outfile;
+    if (friend_file) delete friend_file;
     if (myCorr) delete myCorr;
     // if (pdfReweight) delete pdfReweight;
 }
@@ -214,10 +219,13 @@ unordered_map<int, int> AnalyzerCore::deltaRMatching(const RVec<Particle> &objs1
     return matched_idx;
 }
 
+uint64_t AnalyzerCore::GetRandomStream(RandomPurpose purpose, unsigned int index) const {
+    return CounterRNG::Stream(RunNumber, LumiBlock, uint32_t(EventNumber), index, static_cast<uint32_t>(purpose));
+}
+
 RVec<Jet> AnalyzerCore::SmearJets(const RVec<Jet> &jets, const RVec<GenJet> &genjets, const MyCorrection::variation &syst, const TString &source) {
     unordered_map<int, int> matched_idx = GenJetMatching(jets, genjets, fixedGridRhoFastjetAll);
     RVec<Jet> smeared_jets;
-    gRandom->SetSeed(int(MET_pt*1e6));
     const float MIN_JET_ENERGY=1e-2;
     for(size_t i = 0; i < jets.size(); i++){
         Jet this_jet = jets.at(i);
@@ -241,7 +249,7 @@ RVec<Jet> AnalyzerCore::SmearJets(const RVec<Jet> &jets, const RVec<GenJet> &gen
             const float matched_genjet_pt = genjets[matched_idx[i]].Pt();
             this_corr += (this_sf-1.) * (1.-matched_genjet_pt/this_jet.Pt());
         } else {
-            this_corr += (gRandom->Gaus(0., this_jer))*sqrt(max(this_sf*this_sf-1., 0.));
+            this_corr += GetRandomGaus(RandomPurpose::JetSmear, this_jet.OriginalIndex(), 0., this_jer)*sqrt(max(this_sf*this_sf-1., 0.));
         }
         // To avoid flipping direction (this_corr < 0)
         const float min_corr = MIN_JET_ENERGY/this_jet.E();
@@ -253,7 +261,7 @@ RVec<Jet> AnalyzerCore::SmearJets(const RVec<Jet> &jets, const RVec<GenJet> &gen
             if(this_sf < 1.) {
                 this_corr = MIN_JET_ENERGY / this_jet.E();
             } else{
-                this_corr += (gRandom->Gaus(0, this_jer)) * sqrt(max(this_sf * this_sf - 1., 0.0));
+                this_corr += GetRandomGaus(RandomPurpose::JetSmear, this_jet.OriginalIndex(), 0., this_jer) * sqrt(max(this_sf * this_sf - 1., 0.0));
                 float new_corr = MIN_JET_ENERGY / this_jet.E();
                 this_corr = max(this_corr, new_corr);
             }
@@ -279,60 +287,72 @@ RVec<Jet> AnalyzerCore::SmearJets(const RVec<Jet> &jets, const RVec<GenJet> &gen
 
 RVec<Jet> AnalyzerCore::ScaleJets(const RVec<Jet> &jets, const MyCorrection::variation &syst, const TString &source) {
     if(syst == MyCorrection::variation::nom) return jets;
-    
+    const float sign = (syst == MyCorrection::variation::up) ? 1. : -1.;
+
     RVec<Jet> scaled_jets;
-    RVec<TString> syst_sources = {"AbsoluteMPFBias",
-                                  "AbsoluteScale",
-                                  "AbsoluteStat",
-                                  "FlavorQCD",
-                                  "Fragmentation",
-                                  //"PileUpDataMC",
-                                  //"PileUpPtBB",
-                                  //"PileUpPtEC1",
-                                  //"PileUpPtEC2",
-                                  //"PileUpPtHF",
-                                  //"PileUpPtRef",
-                                  "PileUpEnvelope",
-                                  "RelativeJEREC1",
-                                  "RelativeJEREC2",
-                                  "RelativeJERHF",
-                                  "RelativePtBB",
-                                  "RelativePtEC1",
-                                  "RelativePtEC2",
-                                  "RelativePtHF",
-                                  "RelativeBal",
-                                  "RelativeSample",
-                                  "RelativeFSR",
-                                  "RelativeStatFSR",
-                                  "RelativeStatEC",
-                                  "RelativeStatHF",
-                                  "SinglePionECAL",
-                                  "SinglePionHCAL",
-                                  "TimePtEta"};
+    scaled_jets.reserve(jets.size());
+
+    // sources outside JESUncertaintySources are evaluated directly
+    int source_idx = -1;
+    if(source != "total"){
+        auto it = find(JESUncertaintySources.begin(), JESUncertaintySources.end(), source);
+        if(it == JESUncertaintySources.end()){
+            for(const auto &jet: jets){
+                Jet this_jet = jet;
+                TLorentzVector this_unsmearedP4 = jet.GetUnsmearedP4();
+                if(this_unsmearedP4.E() < 0) this_unsmearedP4 = jet;
+                this_jet *= myCorr->GetJESUncertainty(this_unsmearedP4.Eta(), this_unsmearedP4.Pt(), syst, source);
+                scaled_jets.push_back(this_jet);
+            }
+            return scaled_jets;
+        }
+        source_idx = distance(JESUncertaintySources.begin(), it);
+    }
 
-    for(const auto &jet: jets){
-        Jet this_jet = jet;
+    const RVec<RVec<float>> &jes_unc = GetJESUncertaintyMatrix(jets);
+    for(size_t i = 0; i < jets.size(); i++){
+        Jet this_jet = jets[i];
+        if(source_idx < 0){
+            // total: product over all sources
+            float this_factor = 1.;
+            for(const auto &unc: jes_unc[i]) this_factor *= (1. + sign*unc);
+            this_jet *= this_factor;
+        } else{
+            this_jet *= (1. + sign*jes_unc[i][source_idx]);
+        }
+        scaled_jets.push_back(this_jet);
+    }
+    return scaled_jets;
+}
 
+const RVec<RVec<float>> &AnalyzerCore::GetJESUncertaintyMatrix(const RVec<Jet> &jets) {
+    RVec<float> etas, pts;
+    etas.reserve(jets.size());
+    pts.reserve(jets.size());
+    bool warned = false;
+    for(const auto &jet: jets){
         TLorentzVector this_unsmearedP4 = jet.GetUnsmearedP4();
         if(this_unsmearedP4.E() < 0){
-            cerr << "[AnalyzerCore::ScaleJets] It seems the attribute UnsmearedP4 has never been set for this Jet." << endl;
-            cerr << "[AnalyzerCore::ScaleJets] Since all jets in MC are smeared when calling GetAllJets(), UnsmearedP4 should have been set by AnalyzerCore::SmearJets at the same time." << endl;
-            cerr << "[AnalyzerCore::ScaleJets] This may indicate spurious behavior in your code. For now, Jet.pt() is used for scaling, but I recommend inspecting your code." << endl;
-
-            this_unsmearedP4 = jet;
-        }
-
-        if(source == "total"){
-            for(const auto &it: syst_sources) {
-                this_jet *= myCorr->GetJESUncertainty(this_unsmearedP4.Eta(), this_unsmearedP4.Pt(), syst, it);
+            if(!warned){
+                cerr << "[AnalyzerCore::ScaleJets] It seems the attribute UnsmearedP4 has never been set for this Jet." << endl;
+                cerr << "[AnalyzerCore::ScaleJets] Since all jets in MC are smeared when calling GetAllJets(), UnsmearedP4 should have been set by AnalyzerCore::SmearJets at the same time." << endl;
+                cerr << "[AnalyzerCore::ScaleJets] This may indicate spurious behavior in your code. For now, Jet.pt() is used for scaling, but I recommend inspecting your code." << endl;
+                warned = true;
             }
-            scaled_jets.push_back(this_jet);
-        } else{
-            this_jet *= myCorr->GetJESUncertainty(this_unsmearedP4.Eta(), this_unsmearedP4.Pt(), syst, source);
-            scaled_jets.push_back(this_jet);
+            this_unsmearedP4 = jet;
         }
+        etas.push_back(this_unsmearedP4.Eta());
+        pts.push_back(this_unsmearedP4.Pt());
     }
-    return scaled_jets;
+
+    // same jets as the last call, e.g. up after down or another split source
+    if(etas.size() == jes_unc_cache_eta.size() && All(etas == jes_unc_cache_eta) && All(pts == jes_unc_cache_pt))
+        return jes_unc_cache;
+
+    jes_unc_cache = myCorr->GetJESUncertaintyMatrix(etas, pts, JESUncertaintySources);
+    jes_unc_cache_eta = std::move(etas);
+    jes_unc_cache_pt = std::move(pts);
+    return jes_unc_cache;
 }
 
 RVec<Jet> AnalyzerCore::ScaleJets(const RVec<Jet> &jets, const TString &syst, const TString &source){
@@ -442,11 +462,17 @@ float AnalyzerCore::GetPDFWeight(LHAPDF::PDF *pdf) {
 }
 
 float AnalyzerCore::GetPDFReweight() {
-    return GetPDFWeight(pdfReweight->NewPDF) / GetPDFWeight(pdfReweight->ProdPDF);
+    return pdfReweight->GetCentralReweight(Generator_id1, Generator_id2, Generator_x1, Generator_x2, Generator_scalePDF);
 }
 
 float AnalyzerCore::GetPDFReweight(int member) {
-    return GetPDFWeight(pdfReweight->PDFErrorSet.at(member)) / GetPDFWeight(pdfReweight->ProdPDF);
+    return GetPDFReweights().at(member);
+}
+
+const RVec<float>& AnalyzerCore::GetPDFReweights() {
+    // LHEPdfWeight is sized to the longest array in the input, only the first nLHEPdfWeight entries belong to this event
+    const RVec<float> lheWeights(LHEPdfWeight.data(), max(nLHEPdfWeight, 0));
+    return pdfReweight->GetErrorSetReweights(Generator_id1, Generator_id2, Generator_x1, Generator_x2, Generator_scalePDF, lheWeights);
 }
 
 // MC weights
@@ -505,14 +531,18 @@ RVec<Muon> AnalyzerCore::GetAllMuons() {
         muon.SetNTrackerLayers(Muon_nTrackerLayers[i]);
         float roccor = 1.;
         float roccor_err = 0.;
-        if (IsDATA) {
+        if (FriendMuonCorrections) {
+            roccor = Friend_Muon_roccor->at(i);
+            roccor_err = Friend_Muon_roccorErr->at(i);
+        } else if (IsDATA) {
             roccor = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::nom);
             roccor_err = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::up) - roccor;
         } else {
             Gen matched_gen = GetGenMatchedMuon(muon, truth);
             float matched_pt = matched_gen.Pt();
-            roccor = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::nom, matched_pt);
-            roccor_err = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::up, matched_pt) - roccor;
+            const uint64_t seed = GetRandomStream(RandomPurpose::MuonScale, i);
+            roccor = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::nom, matched_pt, seed);
+            roccor_err = myCorr->GetMuonScaleSF(muon, MyCorrection::variation::up, matched_pt, seed) - roccor;
         }
         muon.SetOriginalPt(muon.Pt());
         muon.SetMomentumScaleUpDown(muon.Pt()*(roccor+roccor_err), muon.Pt()*(roccor-roccor_err)); 
@@ -651,6 +681,7 @@ RVec<Electron> AnalyzerCore::GetAllElectrons(){
         Electron electron;
         electron.SetPtEtaPhiM(Electron_pt[i], Electron_eta[i], Electron_phi[i], Electron_mass[i]);
         electron.SetCharge(Electron_charge[i]);
+        electron.SetOriginalIndex(i);
         electron.SetScEta(Electron_scEta[i]);
         electron.SetDeltaEtaInSC(Electron_deltaEtaInSC[i]);
         electron.SetDeltaEtaInSeed(Electron_deltaEtaInSeed[i]);
@@ -792,14 +823,16 @@ RVec<Electron> AnalyzerCore::SmearElectrons(const RVec<Electron> &electrons, con
             }
             break;
         case 3: 
-            for (const auto &electron: electrons) {
+            for (size_t i = 0; i < electrons.size(); i++) {
+                const Electron &electron = electrons[i];
+                const uint64_t seed = GetRandomStream(RandomPurpose::ElectronSmear, electron.OriginalIndex());
                 float smeared_pt = electron.Pt();
                 if (syst == "nom") {
-                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::nom, int(electron.Rho()));
+                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::nom, seed);
                 } else if (syst == "up") {
-                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::up, int(electron.Rho()));
+                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::up, seed);
                 } else if (syst == "down") {
-                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::down, int(electron.Rho()));
+                    smeared_pt *= myCorr->GetElectronSmearUnc(electron, MyCorrection::variation::down, seed);
                 } else {
                     throw runtime_error("[AnalyzerCore::SmearElectrons] Invalid variation");
                 }
@@ -919,7 +952,7 @@ RVec<Jet> AnalyzerCore::GetAllJets() {
         Jet jet;
         const float rawPt = Jet_pt[i] * (1.-Jet_rawFactor[i]);
         const float rawMass = Jet_mass[i] * (1.-Jet_rawFactor[i]);
-        const float JESSF = myCorr->GetJESSF(Jet_area[i], Jet_eta[i], rawPt, Jet_phi[i], fixedGridRhoFastjetAll, RunNumber);
+        const float JESSF = FriendJetCorrections ? Friend_Jet_JESSF->at(i) : myCorr->GetJESSF(Jet_area[i], Jet_eta[i], rawPt, Jet_phi[i], fixedGridRhoFastjetAll, RunNumber);
         const float correctedPt = rawPt * JESSF;
         const float correctedMass = rawMass * JESSF;
         jet.SetPtEtaPhiM(correctedPt, Jet_eta[i], Jet_phi[i], correctedMass);
@@ -980,7 +1013,13 @@ RVec<Jet> AnalyzerCore::GetAllJets() {
         jet.SetCorrections(tvs2);
         Jets.push_back(jet);
     }
-    if(!IsDATA) Jets = SmearJets(Jets, GetAllGenJets());
+    if (!IsDATA && FriendJetCorrections) {
+        for (auto &jet: Jets) {
+            jet.SetUnsmearedP4(jet);
+            jet *= Friend_Jet_smearFactor->at(jet.OriginalIndex());
+        }
+    }
+    else if(!IsDATA) Jets = SmearJets(Jets, GetAllGenJets());
     return Jets;
 }
 
@@ -1795,6 +1834,13 @@ void AnalyzerCore::FillHist(const TString &histname, float value_x, float value_
     auto histkey = string(histname);
     auto it = histmap2d.find(histkey);
     if (it == histmap2d.end()) {
+        THnSparse *sparse = findSparseHist(histkey);
+        if (!sparse && isSparseHist(histkey)) sparse = newSparseHist(histkey, {TAxis(n_binx, x_min, x_max), TAxis(n_biny, y_min, y_max)});
+        if (sparse) {
+            const double x[2] = {value_x, value_y};
+            sparse->Fill(x, weight);
+            return;
+        }
         TH2 *this_hist;
         if(useTH1F) this_hist = new TH2F(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max);
         else this_hist = new TH2D(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max);
@@ -1813,6 +1859,14 @@ void AnalyzerCore::FillHist(const TString &histname, float value_x, float value_
     auto histkey = string(histname);
     auto it = histmap2d.find(histkey);
     if (it == histmap2d.end()) {
+        THnSparse *sparse = findSparseHist(histkey);
+        if (!sparse && isSparseHist(histkey)) sparse = newSparseHist(histkey, {TAxis(vector<double>(xbins, xbins + n_binx + 1)),
+                                                                               TAxis(vector<double>(ybins, ybins + n_biny + 1))});
+        if (sparse) {
+            const double x[2] = {value_x, value_y};
+            sparse->Fill(x, weight);
+            return;
+        }
         TH2 *this_hist;
         if(useTH1F) this_hist = new TH2F(histkey.c_str(), "", n_binx, xbins, n_biny, ybins);
         else this_hist = new TH2D(histkey.c_str(), "", n_binx, xbins, n_biny, ybins);
@@ -1832,6 +1886,13 @@ void AnalyzerCore::FillHist(const TString &histname, float value_x, float value_
     auto histkey = string(histname);
     auto it = histmap3d.find(histkey);
     if (it == histmap3d.end()) {
+        THnSparse *sparse = findSparseHist(histkey);
+        if (!sparse && isSparseHist(histkey)) sparse = newSparseHist(histkey, {TAxis(n_binx, x_min, x_max), TAxis(n_biny, y_min, y_max), TAxis(n_binz, z_min, z_max)});
+        if (sparse) {
+            const double x[3] = {value_x, value_y, value_z};
+            sparse->Fill(x, weight);
+            return;
+        }
         TH3 *this_hist;
         if(useTH1F) this_hist = new TH3F(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max, n_binz, z_min, z_max);
         else this_hist = new TH3D(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max, n_binz, z_min, z_max);
@@ -1851,6 +1912,15 @@ void AnalyzerCore::FillHist(const TString &histname, float value_x, float value_
     auto histkey = string(histname);
     auto it = histmap3d.find(histkey);
     if (it == histmap3d.end()) {
+        THnSparse *sparse = findSparseHist(histkey);
+        if (!sparse && isSparseHist(histkey)) sparse = newSparseHist(histkey, {TAxis(vector<double>(xbins, xbins + n_binx + 1)),
+                                                                               TAxis(vector<double>(ybins, ybins + n_biny + 1)),
+                                                                               TAxis(vector<double>(zbins, zbins + n_binz + 1))});
+        if (sparse) {
+            const double x[3] = {value_x, value_y, value_z};
+            sparse->Fill(x, weight);
+            return;
+        }
         TH3 *this_hist;
         if(useTH1F) this_hist = new TH3F(histkey.c_str(), "", n_binx, xbins, n_biny, ybins, n_binz, zbins);
         else this_hist = new TH3D(histkey.c_str(), "", n_binx, xbins, n_biny, ybins, n_binz, zbins);
@@ -1862,6 +1932,517 @@ void AnalyzerCore::FillHist(const TString &histname, float value_x, float value_
         it->second->Fill(value_x, value_y, value_z, weight);
     }
 }
+
+bool AnalyzerCore::isSparseHist(const string &histkey) {
+    if (HasFlag("useSparseHist")) return true;
+    for (const auto &prefix: sparsePrefixes) {
+        if (histkey.compare(0, prefix.size(), prefix) == 0) return true;
+    }
+    return false;
+}
+
+THnSparse* AnalyzerCore::newSparseHist(const string &histkey, const vector<TAxis> &axes) {
+    const int dim = axes.size();
+    vector<int> nbins(dim);
+    vector<double> xmin(dim), xmax(dim);
+    for (int i = 0; i < dim; i++) {
+        nbins[i] = axes[i].GetNbins();
+        xmin[i] = axes[i].GetXmin();
+        xmax[i] = axes[i].GetXmax();
+    }
+    THnSparse *this_hist;
+    if(useTH1F) this_hist = new THnSparseF(histkey.c_str(), "", dim, nbins.data(), xmin.data(), xmax.data());
+    else this_hist = new THnSparseD(histkey.c_str(), "", dim, nbins.data(), xmin.data(), xmax.data());
+    for (int i = 0; i < dim; i++) {
+        if (axes[i].IsVariableBinSize()) this_hist->GetAxis(i)->Set(nbins[i], axes[i].GetXbins()->GetArray());
+    }
+    this_hist->Sumw2();
+    sparsemap[histkey] = this_hist;
+    return this_hist;
+}
+
+void AnalyzerCore::PrintHistMemoryReport(int ntop) {
+    vector<tuple<double, string, bool>> sizes;
+    sizes.reserve(histmap1d.size() + histmap2d.size() + histmap3d.size() + sparsemap.size());
+    auto denseSize = [](const TH1 *hist) {
+        const double elemsize = dynamic_cast<const TArrayD*>(hist) ? sizeof(double) : sizeof(float);
+        const double sumw2size = hist->GetSumw2N() > 0 ? sizeof(double) : 0.;
+        return hist->GetNcells() * (elemsize + sumw2size);
+    };
+    for (const auto &pair: histmap1d) sizes.emplace_back(denseSize(pair.second), pair.first, false);
+    for (const auto &pair: histmap2d) sizes.emplace_back(denseSize(pair.second), pair.first, false);
+    for (const auto &pair: histmap3d) sizes.emplace_back(denseSize(pair.second), pair.first, false);
+    for (const auto &pair: sparsemap) {
+        const THnSparse *hist = pair.second;
+        double ncells = 1.;
+        for (int i = 0; i < hist->GetNdimensions(); i++) ncells *= hist->GetAxis(i)->GetNbins() + 2;
+        sizes.emplace_back(hist->GetSparseFractionMem() * ncells * sizeof(double), pair.first, true);
+    }
+    sort(sizes.begin(), sizes.end(), [](const auto &a, const auto &b) { return get<0>(a) > get<0>(b); });
+
+    double total = 0.;
+    for (const auto &entry: sizes) total += get<0>(entry);
+    cout << "[AnalyzerCore::PrintHistMemoryReport] " << sizes.size() << " histograms, "
+         << total / (1024. * 1024.) << " MB in total (" << sparsemap.size() << " sparse)" << endl;
+    for (int i = 0; i < min<int>(ntop, sizes.size()); i++) {
+        cout << "[AnalyzerCore::PrintHistMemoryReport] " << get<1>(sizes[i]) << ": " << get<0>(sizes[i]) / 1024. << " kB"
+             << (get<2>(sizes[i]) ? " (sparse)" : "") << endl;
+    }
+}
+
+TH1* AnalyzerCore::findHist(const string &histkey, int dim) const {
+    if (dim == 1) {
+        auto it = histmap1d.find(histkey);
+        return it == histmap1d.end() ? nullptr : it->second;
+    }
+    else if (dim == 2) {
+        auto it = histmap2d.find(histkey);
+        return it == histmap2d.end() ? nullptr : it->second;
+    }
+    else if (dim == 3) {
+        auto it = histmap3d.find(histkey);
+        return it == histmap3d.end() ? nullptr : it->second;
+    }
+    return nullptr;
+}
+
+int AnalyzerCore::registerHist(const string &histkey, TH1 *hist, int systbin) {
+    // 1D, 2D and 3D histograms live in separate maps and may share a name,
+    // systematic axis histograms get one handle per systematic bin
+    const int dim = hist->GetDimension();
+    string handlekey = to_string(dim) + ":" + histkey;
+    if (systbin >= 0) handlekey += "#" + to_string(systbin);
+    auto it = histhandlemap.find(handlekey);
+    if (it != histhandlemap.end()) return it->second;
+
+    if (dim == 1) histmap1d[histkey] = hist;
+    else if (dim == 2) histmap2d[histkey] = static_cast<TH2*>(hist);
+    else histmap3d[histkey] = static_cast<TH3*>(hist);
+
+    const int handle = histhandles.size();
+    histhandles.push_back(hist);
+    histhandle_systbins.push_back(systbin);
+    histhandlemap[handlekey] = handle;
+    return handle;
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_bin, float x_min, float x_max) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 1)) return registerHist(histkey, hist);
+    TH1 *this_hist;
+    if(useTH1F) this_hist = new TH1F(histkey.c_str(), "", n_bin, x_min, x_max);
+    else this_hist = new TH1D(histkey.c_str(), "", n_bin, x_min, x_max);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_bin, float *xbins) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 1)) return registerHist(histkey, hist);
+    TH1 *this_hist;
+    if(useTH1F) this_hist = new TH1F(histkey.c_str(), "", n_bin, xbins);
+    else this_hist = new TH1D(histkey.c_str(), "", n_bin, xbins);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_binx, float x_min, float x_max,
+                                                    int n_biny, float y_min, float y_max) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 2)) return registerHist(histkey, hist);
+    TH2 *this_hist;
+    if(useTH1F) this_hist = new TH2F(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max);
+    else this_hist = new TH2D(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_binx, float *xbins,
+                                                    int n_biny, float *ybins) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 2)) return registerHist(histkey, hist);
+    TH2 *this_hist;
+    if(useTH1F) this_hist = new TH2F(histkey.c_str(), "", n_binx, xbins, n_biny, ybins);
+    else this_hist = new TH2D(histkey.c_str(), "", n_binx, xbins, n_biny, ybins);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_binx, float x_min, float x_max,
+                                                    int n_biny, float y_min, float y_max,
+                                                    int n_binz, float z_min, float z_max) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 3)) return registerHist(histkey, hist);
+    TH3 *this_hist;
+    if(useTH1F) this_hist = new TH3F(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max, n_binz, z_min, z_max);
+    else this_hist = new TH3D(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max, n_binz, z_min, z_max);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::BookHist(const TString &histname, int n_binx, float *xbins,
+                                                    int n_biny, float *ybins,
+                                                    int n_binz, float *zbins) {
+    auto histkey = string(histname);
+    if (TH1 *hist = findHist(histkey, 3)) return registerHist(histkey, hist);
+    TH3 *this_hist;
+    if(useTH1F) this_hist = new TH3F(histkey.c_str(), "", n_binx, xbins, n_biny, ybins, n_binz, zbins);
+    else this_hist = new TH3D(histkey.c_str(), "", n_binx, xbins, n_biny, ybins, n_binz, zbins);
+    this_hist->SetDirectory(nullptr);
+    return registerHist(histkey, this_hist);
+}
+
+int AnalyzerCore::bookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx, TH1 *proto) {
+    proto->SetDirectory(nullptr);
+    HistPattern this_pattern;
+    this_pattern.pattern = string(pattern);
+    this_pattern.channels = channels.size() > 0 ? channels : RVec<TString>{""};
+    this_pattern.systs = systs.size() > 0 ? systs : RVec<TString>{""};
+    this_pattern.n_idx = max(n_idx, 1);
+    this_pattern.proto = proto;
+    this_pattern.systAxis = HasFlag("useSystAxis") && pattern.Contains("{syst}") && proto->GetDimension() == 1;
+    this_pattern.handles.assign(this_pattern.channels.size() * this_pattern.systs.size() * this_pattern.n_idx, -1);
+    histpatterns.push_back(std::move(this_pattern));
+    return histpatterns.size() - 1;
+}
+
+int AnalyzerCore::BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                                  int n_bin, float x_min, float x_max) {
+    TH1 *proto;
+    if(useTH1F) proto = new TH1F("", "", n_bin, x_min, x_max);
+    else proto = new TH1D("", "", n_bin, x_min, x_max);
+    return bookHistPattern(pattern, channels, systs, n_idx, proto);
+}
+
+int AnalyzerCore::BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                                  const RVec<float> &xbins) {
+    TH1 *proto;
+    if(useTH1F) proto = new TH1F("", "", xbins.size()-1, xbins.data());
+    else proto = new TH1D("", "", xbins.size()-1, xbins.data());
+    return bookHistPattern(pattern, channels, systs, n_idx, proto);
+}
+
+int AnalyzerCore::BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                                  int n_binx, float x_min, float x_max,
+                                  int n_biny, float y_min, float y_max) {
+    TH1 *proto;
+    if(useTH1F) proto = new TH2F("", "", n_binx, x_min, x_max, n_biny, y_min, y_max);
+    else proto = new TH2D("", "", n_binx, x_min, x_max, n_biny, y_min, y_max);
+    return bookHistPattern(pattern, channels, systs, n_idx, proto);
+}
+
+int AnalyzerCore::BookHistPattern(const TString &pattern, const RVec<TString> &channels, const RVec<TString> &systs, int n_idx,
+                                  const RVec<float> &xbins, const RVec<float> &ybins) {
+    TH1 *proto;
+    if(useTH1F) proto = new TH2F("", "", xbins.size()-1, xbins.data(), ybins.size()-1, ybins.data());
+    else proto = new TH2D("", "", xbins.size()-1, xbins.data(), ybins.size()-1, ybins.data());
+    return bookHistPattern(pattern, channels, systs, n_idx, proto);
+}
+
+int AnalyzerCore::GetHistHandle(int pattern, int channel, int syst, int idx) {
+    if (pattern < 0 || pattern >= int(histpatterns.size())) {
+        throw runtime_error("[AnalyzerCore::GetHistHandle] Invalid pattern id " + to_string(pattern));
+    }
+    HistPattern &this_pattern = histpatterns[pattern];
+    if (channel < 0 || channel >= int(this_pattern.channels.size()) ||
+        syst < 0 || syst >= int(this_pattern.systs.size()) ||
+        idx < 0 || idx >= this_pattern.n_idx) {
+        throw runtime_error("[AnalyzerCore::GetHistHandle] Index out of range for pattern " + this_pattern.pattern
+                            + " (channel=" + to_string(channel) + ", syst=" + to_string(syst) + ", idx=" + to_string(idx) + ")");
+    }
+    int &handle = this_pattern.handles[(size_t(channel) * this_pattern.systs.size() + syst) * this_pattern.n_idx + idx];
+    if (handle >= 0) return handle;
+
+    TString histname = this_pattern.pattern;
+    histname.ReplaceAll("{channel}", this_pattern.channels[channel]);
+    histname.ReplaceAll("{idx}", TString::Format("%d", idx));
+    if (this_pattern.systAxis) {
+        const TString legacyname = histname;
+        histname.ReplaceAll("{syst}", "SystAxis");
+        auto histkey = string(histname);
+        TH1 *this_hist = findHist(histkey, 2);
+        if (!this_hist) {
+            const TAxis *xaxis = this_pattern.proto->GetXaxis();
+            const int n_syst = this_pattern.systs.size();
+            TH2 *this_hist2d;
+            if (xaxis->IsVariableBinSize()) {
+                if (useTH1F) this_hist2d = new TH2F(histkey.c_str(), legacyname, xaxis->GetNbins(), xaxis->GetXbins()->GetArray(), n_syst, 0., n_syst);
+                else this_hist2d = new TH2D(histkey.c_str(), legacyname, xaxis->GetNbins(), xaxis->GetXbins()->GetArray(), n_syst, 0., n_syst);
+            }
+            else {
+                if (useTH1F) this_hist2d = new TH2F(histkey.c_str(), legacyname, xaxis->GetNbins(), xaxis->GetXmin(), xaxis->GetXmax(), n_syst, 0., n_syst);
+                else this_hist2d = new TH2D(histkey.c_str(), legacyname, xaxis->GetNbins(), xaxis->GetXmin(), xaxis->GetXmax(), n_syst, 0., n_syst);
+            }
+            for (int i = 0; i < n_syst; i++) this_hist2d->GetYaxis()->SetBinLabel(i + 1, this_pattern.systs[i]);
+            this_hist2d->SetDirectory(nullptr);
+            this_hist = this_hist2d;
+        }
+        else if (TString(this_hist->GetYaxis()->GetBinLabel(syst + 1)) != this_pattern.systs[syst]) {
+            // the same path booked with another list of systematics would fill the wrong y bins
+            throw runtime_error("[AnalyzerCore::GetHistHandle] " + histkey + " is already booked with systematic " + this_hist->GetYaxis()->GetBinLabel(syst + 1)
+                                + " in bin " + to_string(syst + 1) + ", not " + string(this_pattern.systs[syst]));
+        }
+        handle = registerHist(histkey, this_hist, syst + 1);
+        return handle;
+    }
+    histname.ReplaceAll("{syst}", this_pattern.systs[syst]);
+    auto histkey = string(histname);
+    TH1 *this_hist = findHist(histkey, this_pattern.proto->GetDimension());
+    if (!this_hist) {
+        this_hist = static_cast<TH1*>(this_pattern.proto->Clone(histkey.c_str()));
+        this_hist->SetDirectory(nullptr);
+    }
+    handle = registerHist(histkey, this_hist);
+    return handle;
+}
+
+void AnalyzerCore::FillHist(const RVec<int> &handles, float value, const RVec<float> &weights) {
+    if (handles.size() != weights.size()) {
+        throw runtime_error("[AnalyzerCore::FillHist] " + to_string(handles.size()) + " handles for " + to_string(weights.size()) + " weights");
+    }
+    for (size_t i = 0; i < handles.size(); i++) FillHist(handles[i], value, weights[i]);
+}
+
+void AnalyzerCore::FillHist(int pattern, int channel, const RVec<int> &systs, int idx, float value, const RVec<float> &weights) {
+    if (systs.size() != weights.size()) {
+        throw runtime_error("[AnalyzerCore::FillHist] " + to_string(systs.size()) + " systematics for " + to_string(weights.size()) + " weights");
+    }
+    // with a systematic axis all handles point to the same TH2, only the y bin differs
+    for (size_t i = 0; i < systs.size(); i++) FillHist(GetHistHandle(pattern, channel, systs[i], idx), value, weights[i]);
+}
+
+int AnalyzerCore::BookSystSet(const RVec<TString> &systs) {
+    for (size_t i = 0; i < systsets.size(); i++) {
+        if (systsets[i].size() == systs.size() && All(systsets[i] == systs)) return i;
+    }
+    systsets.push_back(systs);
+    return systsets.size() - 1;
+}
+
+const vector<int>& AnalyzerCore::GetSystSetHandles(const TString &pattern, int systset, int n_bin, float x_min, float x_max) {
+    if (systset < 0 || systset >= int(systsets.size())) {
+        throw runtime_error("[AnalyzerCore::GetSystSetHandles] Invalid systematic set id " + to_string(systset));
+    }
+    const string key = string(pattern) + "#" + to_string(systset);
+    auto it = systsethandles.find(key);
+    if (it != systsethandles.end()) return it->second;
+
+    vector<int> handles;
+    if (HasFlag("useSystAxis")) {
+        const int this_pattern = BookHistPattern(pattern, {}, systsets[systset], 1, n_bin, x_min, x_max);
+        for (size_t i = 0; i < systsets[systset].size(); i++) handles.push_back(GetHistHandle(this_pattern, 0, i, 0));
+    }
+    else {
+        for (const auto &syst: systsets[systset]) {
+            TString histname = pattern;
+            histname.ReplaceAll("{syst}", syst);
+            handles.push_back(BookHist(histname, n_bin, x_min, x_max));
+        }
+    }
+    return systsethandles.emplace(key, std::move(handles)).first->second;
+}
+
+void AnalyzerCore::FillHist(const TString &pattern, int systset, float value, const RVec<float> &weights, int n_bin, float x_min, float x_max) {
+    const vector<int> &handles = GetSystSetHandles(pattern, systset, n_bin, x_min, x_max);
+    if (handles.size() != weights.size()) {
+        throw runtime_error("[AnalyzerCore::FillHist] " + to_string(handles.size()) + " systematics for " + to_string(weights.size()) + " weights");
+    }
+    for (size_t i = 0; i < handles.size(); i++) FillHist(handles[i], value, weights[i]);
+}
+
+void AnalyzerCore::FillHistBuffered(int n, const int *handles, const double *values, const double *weights) {
+    histbuffer_handles.insert(histbuffer_handles.end(), handles, handles + n);
+    histbuffer_values.insert(histbuffer_values.end(), values, values + n);
+    histbuffer_weights.insert(histbuffer_weights.end(), weights, weights + n);
+    if (histbuffer_handles.size() >= histbuffer_size) FlushHistBuffer();
+}
+
+void AnalyzerCore::FillHistN(int handle, int n, const double *values, const double *weights) {
+    const int systbin = histhandle_systbins[handle];
+    if (systbin < 0) {
+        histhandles[handle]->FillN(n, values, weights);
+        return;
+    }
+    TH2 *hist = static_cast<TH2*>(histhandles[handle]);
+    for (int i = 0; i < n; i++) hist->Fill(values[i], systbin - 0.5, weights[i]);
+}
+
+void AnalyzerCore::FlushHistBuffer() {
+    const size_t nentries = histbuffer_handles.size();
+    if (nentries == 0) return;
+
+    // Group the entries by handle with a stable counting sort,
+    // so each histogram receives a single FillN call with its entries in the original order
+    const size_t nhists = histhandles.size();
+    histbuffer_offsets.assign(nhists + 1, 0);
+    for (const int handle : histbuffer_handles) {
+        if (handle < 0 || size_t(handle) >= nhists) {
+            throw runtime_error("[AnalyzerCore::FlushHistBuffer] Invalid histogram handle " + to_string(handle));
+        }
+        histbuffer_offsets[handle + 1]++;
+    }
+    for (size_t i = 0; i < nhists; i++) histbuffer_offsets[i + 1] += histbuffer_offsets[i];
+
+    histbuffer_sorted_values.resize(nentries);
+    histbuffer_sorted_weights.resize(nentries);
+    vector<size_t> cursor(histbuffer_offsets.begin(), histbuffer_offsets.end() - 1);
+    for (size_t i = 0; i < nentries; i++) {
+        const size_t pos = cursor[histbuffer_handles[i]]++;
+        histbuffer_sorted_values[pos] = histbuffer_values[i];
+        histbuffer_sorted_weights[pos] = histbuffer_weights[i];
+    }
+
+    for (size_t handle = 0; handle < nhists; handle++) {
+        const size_t begin = histbuffer_offsets[handle];
+        const size_t n = histbuffer_offsets[handle + 1] - begin;
+        if (n == 0) continue;
+        TH1 *hist = histhandles[handle];
+        if (hist->GetDimension() != 1 && histhandle_systbins[handle] < 0) {
+            throw runtime_error("[AnalyzerCore::FlushHistBuffer] Buffered filling only supports 1D histograms, got " + string(hist->GetName()));
+        }
+        FillHistN(handle, n, histbuffer_sorted_values.data() + begin, histbuffer_sorted_weights.data() + begin);
+    }
+
+    histbuffer_handles.clear();
+    histbuffer_values.clear();
+    histbuffer_weights.clear();
+}
+
+AnalyzerCore::BatchColumn& AnalyzerCore::addBatchColumn(const string &name, bool jagged) {
+    auto it = batchcolumn_index.find(name);
+    if (it != batchcolumn_index.end()) return batchcolumns[it->second];
+    if (batch_nevents > 0) {
+        throw runtime_error("[AnalyzerCore::addBatchColumn] Cannot add column " + name + " in the middle of a batch");
+    }
+    batchcolumn_index[name] = batchcolumns.size();
+    batchcolumns.emplace_back();
+    BatchColumn &column = batchcolumns.back();
+    column.name = name;
+    column.jagged = jagged;
+    if (jagged) column.offsets.push_back(0);
+    return column;
+}
+
+void AnalyzerCore::SetBatchColumns(const RVec<TString> &branches) {
+    for (const auto &branch: branches) {
+        TLeaf *leaf = fChain->GetLeaf(branch);
+        if (!leaf) {
+            throw runtime_error("[AnalyzerCore::SetBatchColumns] Branch " + string(branch) + " not found");
+        }
+        fChain->SetBranchStatus(branch, 1);
+        if (leaf->GetLeafCount()) fChain->SetBranchStatus(leaf->GetLeafCount()->GetName(), 1);
+        addBatchColumn(string(branch), leaf->GetLeafCount() || leaf->GetLenStatic() > 1);
+    }
+    // leaves are looked up again for the current tree at the next entry
+    batch_treenumber = -1;
+}
+
+void AnalyzerCore::SetBatchObjects(const TString &collection, const RVec<TString> &ids) {
+    if (collection != "Muon" && collection != "Electron" && collection != "Jet") {
+        throw runtime_error("[AnalyzerCore::SetBatchObjects] Unknown collection " + string(collection) + ", use Muon, Electron or Jet");
+    }
+    // idbits are stored as double like all batch values, exact up to 2^53
+    if (ids.size() > 32) {
+        throw runtime_error("[AnalyzerCore::SetBatchObjects] At most 32 IDs fit in the idbits column");
+    }
+    batchobjects[string(collection)] = ids;
+    RVec<string> fields = {"pt", "eta", "phi", "mass", "idbits"};
+    if (collection != "Jet") fields.push_back("charge");
+    for (const auto &field: fields) addBatchColumn(string(collection) + "." + field, true);
+}
+
+const vector<double>& AnalyzerCore::GetBatchValues(const TString &column) const {
+    auto it = batchcolumn_index.find(string(column));
+    if (it == batchcolumn_index.end()) {
+        throw runtime_error("[AnalyzerCore::GetBatchValues] Column " + string(column) + " is not collected");
+    }
+    return batchcolumns[it->second].values;
+}
+
+const vector<Long64_t>& AnalyzerCore::GetBatchOffsets(const TString &column) const {
+    auto it = batchcolumn_index.find(string(column));
+    if (it == batchcolumn_index.end()) {
+        throw runtime_error("[AnalyzerCore::GetBatchOffsets] Column " + string(column) + " is not collected");
+    }
+    return batchcolumns[it->second].offsets;
+}
+
+void AnalyzerCore::collectBatchEntry() {
+    if (fChain->GetTreeNumber() != batch_treenumber) {
+        batch_treenumber = fChain->GetTreeNumber();
+        for (auto &column: batchcolumns) {
+            if (column.name.find('.') == string::npos) column.leaf = fChain->GetLeaf(column.name.c_str());
+        }
+    }
+    for (auto &column: batchcolumns) {
+        if (!column.leaf) continue;
+        const int len = column.leaf->GetLen();
+        for (int i = 0; i < len; i++) column.values.push_back(column.leaf->GetValue(i));
+        if (column.jagged) column.offsets.push_back(column.values.size());
+    }
+
+    auto collectObjects = [this](const string &collection, const auto &objects) {
+        const RVec<TString> &ids = batchobjects[collection];
+        vector<double> &pt = batchcolumns[batchcolumn_index[collection + ".pt"]].values;
+        vector<double> &eta = batchcolumns[batchcolumn_index[collection + ".eta"]].values;
+        vector<double> &phi = batchcolumns[batchcolumn_index[collection + ".phi"]].values;
+        vector<double> &mass = batchcolumns[batchcolumn_index[collection + ".mass"]].values;
+        vector<double> &idbits = batchcolumns[batchcolumn_index[collection + ".idbits"]].values;
+        for (const auto &obj: objects) {
+            pt.push_back(obj.Pt());
+            eta.push_back(obj.Eta());
+            phi.push_back(obj.Phi());
+            mass.push_back(obj.M());
+            ULong64_t bits = 0;
+            for (size_t i = 0; i < ids.size(); i++) {
+                if (obj.PassID(ids[i])) bits |= (ULong64_t(1) << i);
+            }
+            idbits.push_back(bits);
+            if constexpr (!is_same_v<decay_t<decltype(obj)>, Jet>) {
+                batchcolumns[batchcolumn_index[collection + ".charge"]].values.push_back(obj.Charge());
+            }
+        }
+        for (auto &column: batchcolumns) {
+            if (column.name.rfind(collection + ".", 0) == 0) column.offsets.push_back(column.values.size());
+        }
+    };
+    if (batchobjects.count("Muon")) collectObjects("Muon", GetAllMuons());
+    if (batchobjects.count("Electron")) collectObjects("Electron", GetAllElectrons());
+    if (batchobjects.count("Jet")) collectObjects("Jet", GetAllJets());
+    batch_nevents++;
+}
+
+void AnalyzerCore::clearBatch() {
+    for (auto &column: batchcolumns) {
+        column.values.clear();
+        if (column.jagged) column.offsets.assign(1, 0);
+    }
+    batch_nevents = 0;
+}
+
+RVec<double> AnalyzerCore::GetMuonIDSFBatch(const TString &Muon_ID_SF_Key, int n, const double *eta, const double *pt, MyCorrection::variation syst) {
+    RVec<double> sfs(n);
+    Muon muon;
+    for (int i = 0; i < n; i++) {
+        muon.SetPtEtaPhiM(pt[i], eta[i], 0., 0.);
+        muon.SetOriginalPt(pt[i]);
+        sfs[i] = myCorr->GetMuonIDSF(Muon_ID_SF_Key, muon, syst);
+    }
+    return sfs;
+}
+
+RVec<double> AnalyzerCore::GetElectronIDSFBatch(const TString &Electron_ID_SF_Key, int n, const double *eta, const double *pt, const double *phi, MyCorrection::variation syst) {
+    RVec<double> sfs(n);
+    for (int i = 0; i < n; i++) sfs[i] = myCorr->GetElectronIDSF(Electron_ID_SF_Key, fabs(eta[i]), pt[i], phi[i], syst);
+    return sfs;
+}
+
+RVec<double> AnalyzerCore::GetPUWeightBatch(int n, const double *nTrueInt, MyCorrection::variation syst) {
+    RVec<double> weights(n);
+    for (int i = 0; i < n; i++) weights[i] = myCorr->GetPUWeight(nTrueInt[i], syst);
+    return weights;
+}
+
 TTree* AnalyzerCore::NewTree(const TString &treename, const RVec<TString> &keeps, const RVec<TString> &drops){
     auto treekey = string(treename);
     auto it = treemap.find(treekey);
@@ -1926,6 +2507,382 @@ void AnalyzerCore::SetBranch(const TString &treename, const TString &branchname,
     }
 }
 
+void* AnalyzerCore::findColumn(const TString &treename, const TString &colname, const type_info &type) const {
+    auto it = columnmap.find(string(treename) + ":" + string(colname));
+    if (it == columnmap.end()) return nullptr;
+    if (it->second.first != type_index(type)) {
+        throw runtime_error("[AnalyzerCore::NewColumn] Column " + string(colname) + " in tree " + string(treename) + " is already declared with a different type");
+    }
+    return it->second.second;
+}
+
+void AnalyzerCore::registerColumn(const TString &treename, const TString &colname, const type_info &type, void *address) {
+    columnmap.emplace(string(treename) + ":" + string(colname), make_pair(type_index(type), address));
+    if (isNTupleOutput(treename)) ntuplecolumns[string(treename)].emplace_back(string(colname), address);
+}
+
+void AnalyzerCore::SetTreeBackend(const TString &treename, const TString &backend) {
+    const string treekey = string(treename);
+    if (backend != "TTree" && backend != "RNTuple" && backend != "Parquet") {
+        throw runtime_error("[AnalyzerCore::SetTreeBackend] Unknown backend " + string(backend) + ", choose from TTree, RNTuple, Parquet");
+    }
+    if (treemap.count(treekey) || ntuplemodels.count(treekey)) {
+        throw runtime_error("[AnalyzerCore::SetTreeBackend] Tree " + treekey + " already has columns, set the backend before the first NewColumn");
+    }
+    if (backend != "TTree" && treekey.find('/') != string::npos) {
+        throw runtime_error("[AnalyzerCore::SetTreeBackend] " + string(backend) + " output " + treekey + " can not be placed in a subdirectory");
+    }
+    treebackends[treekey] = string(backend);
+}
+
+RNTupleAPI::RNTupleModel* AnalyzerCore::getNTupleModel(const TString &treename) {
+    const string treekey = string(treename);
+    if (ntuplewriters.count(treekey)) {
+        throw runtime_error("[AnalyzerCore::NewColumn] " + treekey + " is already being written, declare all of its columns before the first FillTrees");
+    }
+    auto &model = ntuplemodels[treekey];
+    if (!model) model = RNTupleAPI::RNTupleModel::CreateBare();
+    return model.get();
+}
+
+void AnalyzerCore::fillNTuple(const string &treename) {
+    auto it = ntuplewriters.find(treename);
+    if (it == ntuplewriters.end()) {
+        // the model is frozen by the writer, the entry points to the column storage of the analyzer
+        RNTupleAPI::RNTupleWriteOptions options;
+        if (outfileCompression >= 0) options.SetCompression(outfileCompression);
+        it = ntuplewriters.emplace(treename, RNTupleAPI::RNTupleWriter::Append(std::move(ntuplemodels[treename]), treename, *outfile, options)).first;
+        auto &entry = ntupleentries[treename];
+        entry = it->second->CreateEntry();
+        for (const auto &column: ntuplecolumns[treename]) entry->BindRawPtr(column.first, column.second);
+    }
+    it->second->Fill(*ntupleentries[treename]);
+}
+
+void AnalyzerCore::EnableEventCache(const TString &backend, const TString &treename) {
+    eventcache_name = treename;
+    if (backend != "TTree") SetTreeBackend(treename, backend);
+    eventcache_cutbits = NewColumn<ULong64_t>(treename, "cutbits");
+}
+
+float* AnalyzerCore::CacheVariable(const TString &name) {
+    if (eventcache_name == "") throw runtime_error("[AnalyzerCore::CacheVariable] Call EnableEventCache first");
+    if (find(eventcache_variables.begin(), eventcache_variables.end(), string(name)) == eventcache_variables.end()) {
+        eventcache_variables.push_back(string(name));
+    }
+    return NewColumn<float>(eventcache_name, name);
+}
+
+float* AnalyzerCore::CacheWeight(const TString &name) {
+    if (eventcache_name == "") throw runtime_error("[AnalyzerCore::CacheWeight] Call EnableEventCache first");
+    auto it = eventcache_weightcolumns.find(string(name));
+    if (it != eventcache_weightcolumns.end()) return it->second;
+    float *address = NewColumn<float>(eventcache_name, "weight_" + name);
+    eventcache_weights.push_back(string(name));
+    eventcache_weightcolumns[string(name)] = address;
+    return address;
+}
+
+int AnalyzerCore::CacheCut(const TString &name) {
+    if (eventcache_name == "") throw runtime_error("[AnalyzerCore::CacheCut] Call EnableEventCache first");
+    auto it = find(eventcache_cuts.begin(), eventcache_cuts.end(), string(name));
+    if (it != eventcache_cuts.end()) return it - eventcache_cuts.begin();
+    if (eventcache_cuts.size() == 64) throw runtime_error("[AnalyzerCore::CacheCut] At most 64 cuts can be cached");
+    eventcache_cuts.push_back(string(name));
+    return eventcache_cuts.size() - 1;
+}
+
+void AnalyzerCore::CacheLabel(const TString &label, const RVec<TString> &values) {
+    if (eventcache_name == "") throw runtime_error("[AnalyzerCore::CacheLabel] Call EnableEventCache first");
+    auto &this_values = eventcache_labels[string(label)];
+    this_values.clear();
+    for (const auto &value: values) this_values.push_back(string(value));
+    eventcache_labelcolumns[string(label)] = NewColumn<int>(eventcache_name, label);
+}
+
+void AnalyzerCore::SetCacheWeights(const unordered_map<string, float> &weights) {
+    for (const auto &pair: weights) *CacheWeight(pair.first) = pair.second;
+}
+
+void AnalyzerCore::SetCacheLabel(const TString &label, const TString &value) {
+    auto it = eventcache_labels.find(string(label));
+    if (it == eventcache_labels.end()) {
+        throw runtime_error("[AnalyzerCore::SetCacheLabel] Label " + string(label) + " is not declared with CacheLabel");
+    }
+    auto value_it = find(it->second.begin(), it->second.end(), string(value));
+    if (value_it == it->second.end()) {
+        throw runtime_error("[AnalyzerCore::SetCacheLabel] Value " + string(value) + " is not declared for label " + string(label));
+    }
+    *eventcache_labelcolumns[string(label)] = value_it - it->second.begin();
+}
+
+void AnalyzerCore::FillEventCache() {
+    FillTrees(eventcache_name);
+    *eventcache_cutbits = 0;
+}
+
+void AnalyzerCore::writeEventCacheInfo() {
+    if (eventcache_name == "") return;
+    json info;
+    info["tree"] = string(eventcache_name);
+    info["variables"] = eventcache_variables;
+    info["weights"] = eventcache_weights;
+    info["cuts"] = eventcache_cuts;
+    info["labels"] = eventcache_labels;
+    TNamed cache_info("SKNanoEventCache", info.dump().c_str());
+    outfile->WriteTObject(&cache_info);
+    eventcache_name = "";
+    eventcache_cutbits = nullptr;
+    eventcache_labelcolumns.clear();
+    eventcache_weightcolumns.clear();
+}
+
+void AnalyzerCore::EnableFriendOutput(const TString &treename, const TString &outpath) {
+    if (isNTupleOutput(treename)) throw runtime_error("[AnalyzerCore::EnableFriendOutput] Friend trees have to be TTree, not " + string(treebackends[string(treename)]));
+    if (treemap.count(string(treename))) throw runtime_error("[AnalyzerCore::EnableFriendOutput] Tree " + string(treename) + " already exists, call EnableFriendOutput before declaring its columns");
+    if (!outfile) throw runtime_error("[AnalyzerCore::EnableFriendOutput] Call SetOutfilePath first");
+    TString friend_path = outpath;
+    if (friend_path == "") {
+        const TString outfile_path = outfile->GetName();
+        TString basename = gSystem->BaseName(outfile_path);
+        if (basename.BeginsWith("hists")) basename.Replace(0, 5, "friend");
+        else basename.ReplaceAll(".root", "_friend.root");
+        friend_path = gSystem->GetDirName(outfile_path) + "/" + basename;
+    }
+    if (friend_path == outfile->GetName()) throw runtime_error("[AnalyzerCore::EnableFriendOutput] The friend file cannot be the output file " + string(friend_path));
+    TDirectory *previous = gDirectory;
+    friend_file = new TFile(friend_path, "RECREATE");
+    if (friend_file->IsZombie()) throw runtime_error("[AnalyzerCore::EnableFriendOutput] Cannot create " + string(friend_path));
+    if (outfileCompression >= 0) friend_file->SetCompressionSettings(outfileCompression);
+    // the tree is created in the friend file, so its baskets are flushed there while filling
+    friend_file->cd();
+    friend_name = treename;
+    friend_jet_jessf = NewVectorColumn<float>(treename, "Jet_JESSF");
+    friend_jet_smearfactor = NewVectorColumn<float>(treename, "Jet_smearFactor");
+    friend_muon_roccor = NewVectorColumn<float>(treename, "Muon_roccor");
+    friend_muon_roccorerr = NewVectorColumn<float>(treename, "Muon_roccorErr");
+    previous->cd();
+}
+
+void AnalyzerCore::FillFriend(const RVec<Jet> &allJets, const RVec<Muon> &allMuons) {
+    if (friend_name == "") throw runtime_error("[AnalyzerCore::FillFriend] Call EnableFriendOutput first");
+    if (static_cast<int>(allMuons.size()) != nMuon) throw runtime_error("[AnalyzerCore::FillFriend] Pass the unselected output of GetAllMuons");
+    // jets are stored at their NanoAOD index, the JES factor relative to the raw pt and the smearing relative to the JES corrected pt
+    friend_jet_jessf->assign(nJet, 1.);
+    friend_jet_smearfactor->assign(nJet, 1.);
+    for (const auto &jet: allJets) {
+        const TLorentzVector unsmeared = jet.GetUnsmearedP4();
+        const float jes_pt = unsmeared.E() < 0 ? jet.Pt() : unsmeared.Pt();
+        (*friend_jet_jessf)[jet.OriginalIndex()] = jes_pt / jet.GetRawPt();
+        (*friend_jet_smearfactor)[jet.OriginalIndex()] = jet.Pt() / jes_pt;
+    }
+    for (const auto &muon: allMuons) {
+        friend_muon_roccor->push_back(muon.Pt() / muon.OriginalPt());
+        friend_muon_roccorerr->push_back((muon.MomentumScaleUp() - muon.Pt()) / muon.OriginalPt());
+    }
+    FillTrees(friend_name);
+}
+
+void AnalyzerCore::writeFriendInfo() {
+    if (friend_name == "") return;
+    TTree *tree = treemap[string(friend_name)];
+    json info;
+    info["tree"] = string(friend_name);
+    info["entries"] = tree->GetEntries();
+    info["inputs"] = json::array();
+    Long64_t total_entries = 0;
+    TObjArray *elements = fChain->GetListOfFiles();
+    for (int i = 0; i < elements->GetEntries(); i++) {
+        const TString filename = elements->At(i)->GetTitle();
+        unique_ptr<TFile> input(TFile::Open(filename));
+        if (!input || input->IsZombie()) throw runtime_error("[AnalyzerCore::writeFriendInfo] Cannot open input " + string(filename));
+        TTree *input_tree = input->Get<TTree>(fChain->GetName());
+        const Long64_t entries = input_tree ? input_tree->GetEntries() : 0;
+        info["inputs"].push_back({{"file", string(filename)}, {"uuid", input->GetUUID().AsString()}, {"entries", entries}});
+        total_entries += entries;
+    }
+    // a friend is only usable if it has exactly one entry per input entry
+    info["complete"] = info["entries"].get<Long64_t>() == total_entries;
+    if (!info["complete"].get<bool>()) {
+        cerr << "[AnalyzerCore::writeFriendInfo] Warning: " << friend_name << " has " << info["entries"].get<Long64_t>() << " entries for " << total_entries
+             << " input entries, it cannot be attached with AddFriend. Was FillFriend skipped for some events?" << endl;
+    }
+    cout << "[AnalyzerCore::writeFriendInfo] Writing " << friend_name << " to " << friend_file->GetName() << endl;
+    friend_file->cd();
+    tree->Write();
+    TNamed friend_info("SKNanoFriendInfo", info.dump().c_str());
+    friend_file->WriteTObject(&friend_info);
+    // the friend tree is owned by the friend file and is not written to the output file
+    treemap.erase(string(friend_name));
+    friend_file->Close();
+    delete friend_file;
+    friend_file = nullptr;
+    friend_name = "";
+    friend_jet_jessf = nullptr;
+    friend_jet_smearfactor = nullptr;
+    friend_muon_roccor = nullptr;
+    friend_muon_roccorerr = nullptr;
+}
+
+void AnalyzerCore::SetVariation(const TString &syst, const RVec<TString> &tags) {
+    objects_variation = syst;
+    objects_varied.clear();
+    objects_varied_tags.clear();
+    for (const auto &tag: tags) objects_varied_tags.insert(string(tag));
+    // which objects a variation reaches only depends on the definitions, keep it between events
+    objects_current_isvaried = &objects_isvaried[string(syst)];
+}
+
+void AnalyzerCore::ResetObjects() {
+    objects_nominal.clear();
+    objects_varied.clear();
+    objects_running.clear();
+}
+
+bool AnalyzerCore::isVariedObject(const string &name) {
+    if (objects_varied_tags.empty()) return false;
+    auto it = objects_current_isvaried->find(name);
+    if (it != objects_current_isvaried->end()) return it->second;
+    bool varied = objects_varied_tags.count(name) > 0;
+    auto step = objectsteps.find(name);
+    if (!varied && step != objectsteps.end()) {
+        for (const auto &input: step->second.inputs) {
+            if (isVariedObject(input)) {
+                varied = true;
+                break;
+            }
+        }
+    }
+    (*objects_current_isvaried)[name] = varied;
+    return varied;
+}
+
+const any& AnalyzerCore::getObject(const string &name) {
+    if (!objects_running.empty()) {
+        const auto &inputs = objects_running.back()->inputs;
+        if (find(inputs.begin(), inputs.end(), name) == inputs.end()) {
+            throw runtime_error("[AnalyzerCore::GetObject] " + name + " is read by a producer that does not declare it as an input");
+        }
+    }
+    const bool varied = isVariedObject(name);
+    auto &objects = varied ? objects_varied : objects_nominal;
+    auto it = objects.find(name);
+    if (it != objects.end()) return it->second;
+
+    auto step = objectsteps.find(name);
+    if (step == objectsteps.end()) {
+        throw runtime_error("[AnalyzerCore::GetObject] " + name + " is neither defined nor set for this event");
+    }
+    objects_running.push_back(&step->second);
+    any object = step->second.producer(varied ? objects_variation : TString("Central"));
+    objects_running.pop_back();
+    return objects[name] = std::move(object);
+}
+
+void AnalyzerCore::SetSkimOutput(const TString &outpath, const RVec<TString> &keeps, const RVec<TString> &drops, bool perInput) {
+    skim_outpath = outpath;
+    skim_keeps = keeps;
+    skim_drops = drops;
+    skim_perInput = perInput;
+    skim_entries.clear();
+}
+
+void AnalyzerCore::WriteSkim() {
+    if (skim_outpath == "") return;
+
+    // selected entries are collected in reading order, group them by input file
+    TObjArray *inputs = fChain->GetListOfFiles();
+    vector<vector<Long64_t>> entries_per_input(inputs->GetEntries());
+    for (const auto &entry: skim_entries) entries_per_input[entry.first].push_back(entry.second);
+
+    TFile *this_outfile = nullptr;
+    TTree *this_outtree = nullptr;
+    Long64_t n_selected = 0, n_fastcloned = 0;
+    for (int i = 0; i < inputs->GetEntries(); i++) {
+        const auto &entries = entries_per_input[i];
+        if (entries.empty() && (skim_perInput || i < inputs->GetEntries() - 1 || this_outfile)) continue;
+
+        const TString inpath = inputs->At(i)->GetTitle();
+        unique_ptr<TFile> infile(TFile::Open(inpath, "READ"));
+        if (!infile || infile->IsZombie()) {
+            throw runtime_error("[AnalyzerCore::WriteSkim] Cannot open input " + string(inpath));
+        }
+        TTree *intree = infile->Get<TTree>(fChain->GetName());
+        if (!intree) {
+            throw runtime_error("[AnalyzerCore::WriteSkim] Tree " + string(fChain->GetName()) + " not found in " + string(inpath));
+        }
+        intree->SetBranchStatus("*", 1);
+        for (const auto &drop : skim_drops) intree->SetBranchStatus(drop, 0);
+        for (const auto &keep : skim_keeps) intree->SetBranchStatus(keep, 1);
+
+        if (!this_outfile) {
+            TString outpath = skim_outpath;
+            if (skim_perInput) outpath.ReplaceAll(".root", TString::Format("_%d.root", i));
+            this_outfile = new TFile(outpath, "RECREATE");
+            if (outfileCompression >= 0) this_outfile->SetCompressionSettings(outfileCompression);
+            this_outfile->cd();
+            this_outtree = intree->CloneTree(0);
+            if (skim_autoflush != 0) this_outtree->SetAutoFlush(skim_autoflush);
+        }
+        else {
+            intree->CopyAddresses(this_outtree);
+        }
+
+        if (Long64_t(entries.size()) == intree->GetEntries()) {
+            // every entry is selected, copy the baskets without decompressing them
+            this_outtree->CopyEntries(intree, -1, "fast");
+            n_fastcloned += entries.size();
+        }
+        else {
+            // IMT compresses the baskets in parallel, it is only enabled while copying and the previous state is restored
+            // (an already enabled pool, e.g. of the RDataFrame backend, is used as it is)
+            const bool enable_imt = skim_nthreads > 0 && !ROOT::IsImplicitMTEnabled();
+            if (enable_imt) ROOT::EnableImplicitMT(skim_nthreads);
+            for (const auto &entry: entries) {
+                intree->GetEntry(entry);
+                this_outtree->Fill();
+            }
+            // the last baskets are written here, still with IMT
+            this_outtree->FlushBaskets();
+            if (enable_imt) ROOT::DisableImplicitMT();
+        }
+        n_selected += entries.size();
+        intree->CopyAddresses(this_outtree, true);
+
+        if (skim_perInput) {
+            this_outfile->cd();
+            this_outtree->Write("", TObject::kOverwrite);
+            delete this_outfile;
+            this_outfile = nullptr;
+            this_outtree = nullptr;
+        }
+    }
+    if (this_outfile) {
+        this_outfile->cd();
+        this_outtree->Write("", TObject::kOverwrite);
+        delete this_outfile;
+    }
+    cout << "[AnalyzerCore::WriteSkim] Wrote " << n_selected << " entries (" << n_fastcloned << " fast-cloned) from "
+         << inputs->GetEntries() << " inputs to " << skim_outpath << endl;
+    skim_entries.clear();
+}
+
+void AnalyzerCore::SetTreeBasketSize(const TString &treename, int basketsize) {
+    if (isNTupleOutput(treename)) {
+        cout << "[AnalyzerCore::SetTreeBasketSize] " << treename << " is not a TTree, ignored" << endl;
+        return;
+    }
+    GetTree(treename)->SetBasketSize("*", basketsize);
+}
+
+void AnalyzerCore::SetTreeAutoFlush(const TString &treename, Long64_t autoflush) {
+    if (isNTupleOutput(treename)) {
+        cout << "[AnalyzerCore::SetTreeAutoFlush] " << treename << " is not a TTree, ignored" << endl;
+        return;
+    }
+    GetTree(treename)->SetAutoFlush(autoflush);
+}
+
 template void AnalyzerCore::SetBranch_Vector<int>(const TString &, const TString &, std::vector<int> &);
 template void AnalyzerCore::SetBranch_Vector<float>(const TString &, const TString &, std::vector<float> &);
 template void AnalyzerCore::SetBranch_Vector<double>(const TString &, const TString &, std::vector<double> &);
@@ -1934,11 +2891,24 @@ template void AnalyzerCore::SetBranch_Vector<bool>(const TString &, const TStrin
 
 void AnalyzerCore::FillTrees(const TString &treename) {
     if (treename == "") {
+        // the event cache and the friend tree are filled only by FillEventCache and FillFriend
+        auto isOwnedTree = [this](const string &name) {
+            return (eventcache_name != "" && name == eventcache_name.Data()) || (friend_name != "" && name == friend_name.Data());
+        };
         for (const auto &pair : treemap) {
             const string &treename = pair.first;
+            if (isOwnedTree(treename)) continue;
             TTree *tree = pair.second;
             tree->Fill();
         }
+        for (const auto &pair : ntuplemodels) {
+            if (isOwnedTree(pair.first)) continue;
+            fillNTuple(pair.first);
+        }
+        for (auto &pair : column_resetters) {
+            if (isOwnedTree(pair.first)) continue;
+            for (auto &reset : pair.second) reset();
+        }
         this_floats.clear();
         this_ints.clear();
         this_bools.clear();
@@ -1950,10 +2920,14 @@ void AnalyzerCore::FillTrees(const TString &treename) {
         std::string treeNameStr(treename.Data());
 
         auto it = treemap.find(treeNameStr);
-        if (it != treemap.end()) {
+        if (it != treemap.end() || ntuplemodels.count(treeNameStr)) {
             // Tree with the given name exists, fill it
-            TTree *tree = it->second;
-            tree->Fill();
+            if (it != treemap.end()) it->second->Fill();
+            else fillNTuple(treeNameStr);
+            auto resetters = column_resetters.find(treeNameStr);
+            if (resetters != column_resetters.end()) {
+                for (auto &reset : resetters->second) reset();
+            }
             this_floats.clear();
             this_ints.clear();
             this_bools.clear();
@@ -1968,64 +2942,139 @@ void AnalyzerCore::FillTrees(const TString &treename) {
 }
 
 
-void AnalyzerCore::WriteHist() {
-    cout << "[AnalyzerCore::WriteHist] Writing histograms to " << outfile->GetName() << endl;
-    std::vector<std::pair<std::string, TH1 *>> sorted_histograms1d(histmap1d.begin(), histmap1d.end());
-    std::vector<std::pair<std::string, TH2 *>> sorted_histograms2d(histmap2d.begin(), histmap2d.end());
-    std::vector<std::pair<std::string, TH3 *>> sorted_histograms3d(histmap3d.begin(), histmap3d.end());
-    std::sort(sorted_histograms1d.begin(), sorted_histograms1d.end(),
-              [](const std::pair<std::string, TH1 *> &a, const std::pair<std::string, TH1 *> &b)
-              {
-                  return a.first < b.first;
-              });
-    std::sort(sorted_histograms2d.begin(), sorted_histograms2d.end(),
-              [](const std::pair<std::string, TH2 *> &a, const std::pair<std::string, TH2 *> &b)
-              {
-                  return a.first < b.first;
-              });
-    std::sort(sorted_histograms3d.begin(), sorted_histograms3d.end(),
-              [](const std::pair<std::string, TH3 *> &a, const std::pair<std::string, TH3 *> &b)
-              {
-                  return a.first < b.first;
-              });
-    for (const auto &pair: sorted_histograms1d) {
-        const string &histname = pair.first;
-        TH1 *hist = pair.second;
-        cout << "[AnalyzerCore::WriteHist] Writing 1D histogram: " << histname << endl;
-        // Split the directory and name
-        // e.g. "dir1/dir2/histname" -> "dir1/dir2", "histname"
-        // e.g. "histname" -> "", "histname"
-        size_t last_slash = histname.find_last_of('/');
-        string this_prefix, this_name;
-        last_slash == string::npos ? this_prefix = "" : this_prefix = histname.substr(0, last_slash);
-        last_slash == string::npos ? this_name = histname : this_name = histname.substr(last_slash + 1);
+void AnalyzerCore::SetOutfileCompression(const TString &algorithm, int level) {
+    TString algo = algorithm;
+    algo.ToUpper();
+    ROOT::RCompressionSetting::EAlgorithm::EValues this_algo;
+    if (algo == "ZLIB") this_algo = ROOT::RCompressionSetting::EAlgorithm::kZLIB;
+    else if (algo == "LZMA") this_algo = ROOT::RCompressionSetting::EAlgorithm::kLZMA;
+    else if (algo == "LZ4") this_algo = ROOT::RCompressionSetting::EAlgorithm::kLZ4;
+    else if (algo == "ZSTD") this_algo = ROOT::RCompressionSetting::EAlgorithm::kZSTD;
+    else throw runtime_error("[AnalyzerCore::SetOutfileCompression] Unknown compression algorithm " + string(algorithm));
+    outfileCompression = ROOT::CompressionSettings(this_algo, level);
+    if (outfile) outfile->SetCompressionSettings(outfileCompression);
+}
+
+TDirectory* AnalyzerCore::getOutputDirectory(const string &prefix) {
+    auto it = outdirmap.find(prefix);
+    if (it != outdirmap.end()) return it->second;
+    TDirectory *this_dir = prefix.empty() ? outfile : outfile->mkdir(prefix.c_str(), "", true);
+    outdirmap[prefix] = this_dir;
+    return this_dir;
+}
+
+void AnalyzerCore::FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column, const string &weight, int n_bin, float x_min, float x_max) {
+    const string histkey = string(histname);
+    ROOT::RDF::TH1DModel model(histkey.c_str(), "", n_bin, x_min, x_max);
+    dfhists1d.emplace_back(histkey, weight.empty() ? df.Histo1D(model, column) : df.Histo1D(model, column, weight));
+}
+
+void AnalyzerCore::FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column, const string &weight, const RVec<float> &xbins) {
+    const string histkey = string(histname);
+    const vector<double> edges(xbins.begin(), xbins.end());
+    ROOT::RDF::TH1DModel model(histkey.c_str(), "", edges.size()-1, edges.data());
+    dfhists1d.emplace_back(histkey, weight.empty() ? df.Histo1D(model, column) : df.Histo1D(model, column, weight));
+}
+
+void AnalyzerCore::FillHist(ROOT::RDF::RNode df, const TString &histname, const string &column_x, const string &column_y, const string &weight,
+                            int n_binx, float x_min, float x_max,
+                            int n_biny, float y_min, float y_max) {
+    const string histkey = string(histname);
+    ROOT::RDF::TH2DModel model(histkey.c_str(), "", n_binx, x_min, x_max, n_biny, y_min, y_max);
+    dfhists2d.emplace_back(histkey, weight.empty() ? df.Histo2D(model, column_x, column_y) : df.Histo2D(model, column_x, column_y, weight));
+}
+
+ROOT::RDF::RNode AnalyzerCore::DefineAllMuons(ROOT::RDF::RNode df, const string &name) {
+    return DefineFromEntry<RVec<Muon>>(df, name, [this]() { return GetAllMuons(); });
+}
+
+ROOT::RDF::RNode AnalyzerCore::DefineAllElectrons(ROOT::RDF::RNode df, const string &name) {
+    return DefineFromEntry<RVec<Electron>>(df, name, [this]() { return GetAllElectrons(); });
+}
+
+ROOT::RDF::RNode AnalyzerCore::DefineAllJets(ROOT::RDF::RNode df, const string &name) {
+    return DefineFromEntry<RVec<Jet>>(df, name, [this]() { return GetAllJets(); });
+}
 
-        TDirectory *this_dir = outfile->GetDirectory(this_prefix.c_str());
-        if (!this_dir) outfile->mkdir(this_prefix.c_str());
-        outfile->cd(this_prefix.c_str());
-        hist->Write(this_name.c_str());
+ROOT::RDF::RNode AnalyzerCore::DefineSelectedMuons(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax) {
+    return df.Define(name, [this, ID, ptmin, absetamax](const RVec<Muon> &muons) { return SelectMuons(muons, ID, ptmin, absetamax); }, {input});
+}
+
+ROOT::RDF::RNode AnalyzerCore::DefineSelectedElectrons(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax) {
+    return df.Define(name, [this, ID, ptmin, absetamax](const RVec<Electron> &electrons) { return SelectElectrons(electrons, ID, ptmin, absetamax); }, {input});
+}
+
+ROOT::RDF::RNode AnalyzerCore::DefineSelectedJets(ROOT::RDF::RNode df, const string &name, const string &input, const TString &ID, const float ptmin, const float absetamax) {
+    return df.Define(name, [this, ID, ptmin, absetamax](const RVec<Jet> &jets) { return SelectJets(jets, ID, ptmin, absetamax); }, {input});
+}
+
+void AnalyzerCore::runDataFrame() {
+    if (dfhists1d.empty() && dfhists2d.empty()) {
+        cout << "[AnalyzerCore::runDataFrame] Warning: no histograms booked on the data frame" << endl;
+        return;
     }
-    for (const auto &pair: sorted_histograms2d) {
-        const string &histname = pair.first;
-        cout << "[AnalyzerCore::WriteHist] Writing 2D histogram: " << histname << endl;
-        TH2 *hist = pair.second;
-        // Split the directory and name
-        // e.g. "dir1/dir2/histname" -> "dir1/dir2", "histname"
-        // e.g. "histname" -> "", "histname"
-        size_t last_slash = histname.find_last_of('/');
-        string this_prefix, this_name;
-        last_slash == string::npos ? this_prefix = "" : this_prefix = histname.substr(0, last_slash);
-        last_slash == string::npos ? this_name = histname : this_name = histname.substr(last_slash + 1);
+    vector<ROOT::RDF::RResultHandle> handles;
+    for (auto &pair: dfhists1d) handles.emplace_back(pair.second);
+    for (auto &pair: dfhists2d) handles.emplace_back(pair.second);
+    ROOT::RDF::RunGraphs(handles);
+    cout << "[AnalyzerCore::runDataFrame] Processed " << fDataFrame->GetNRuns() << " event loop(s) for " << handles.size() << " histograms" << endl;
 
-        TDirectory *this_dir = outfile->GetDirectory(this_prefix.c_str());
-        if (!this_dir) outfile->mkdir(this_prefix.c_str());
-        outfile->cd(this_prefix.c_str());
-        hist->Write(this_name.c_str());
+    // merge into the imperative storage, histograms booked twice under the same name are added
+    for (auto &[histkey, result]: dfhists1d) {
+        auto it = histmap1d.find(histkey);
+        if (it != histmap1d.end()) {
+            it->second->Add(result.GetPtr());
+            continue;
+        }
+        TH1 *this_hist = static_cast<TH1*>(result->Clone(histkey.c_str()));
+        this_hist->SetDirectory(nullptr);
+        histmap1d[histkey] = this_hist;
+    }
+    for (auto &[histkey, result]: dfhists2d) {
+        auto it = histmap2d.find(histkey);
+        if (it != histmap2d.end()) {
+            it->second->Add(result.GetPtr());
+            continue;
+        }
+        TH2 *this_hist = static_cast<TH2*>(result->Clone(histkey.c_str()));
+        this_hist->SetDirectory(nullptr);
+        histmap2d[histkey] = this_hist;
     }
-    for (const auto &pair: sorted_histograms3d) {
-        const string &histname = pair.first;
-        cout << "[AnalyzerCore::WriteHist] Writing 3D histogram: " << histname << endl;
-        TH3 *hist = pair.second;
+    dfhists1d.clear();
+    dfhists2d.clear();
+}
+
+void AnalyzerCore::WriteHist() {
+    FlushHistBuffer();
+    if (HasFlag("printHistMemory")) PrintHistMemoryReport();
+    cout << "[AnalyzerCore::WriteHist] Writing histograms to " << outfile->GetName() << endl;
+    // Write all histograms in a single pass sorted by path,
+    // each output directory is created once and cached in outdirmap
+    // sparse histograms are written as dense TH2D/TH3D, each one is projected right before it is written and deleted after,
+    // so at most one dense copy is in memory at a time
+    std::vector<std::tuple<std::string, TH1 *, THnSparse *>> sorted_histograms;
+    sorted_histograms.reserve(histmap1d.size() + histmap2d.size() + histmap3d.size() + sparsemap.size());
+    for (const auto &pair: histmap1d) sorted_histograms.emplace_back(pair.first, pair.second, nullptr);
+    for (const auto &pair: histmap2d) sorted_histograms.emplace_back(pair.first, pair.second, nullptr);
+    for (const auto &pair: histmap3d) sorted_histograms.emplace_back(pair.first, pair.second, nullptr);
+    for (const auto &pair: sparsemap) sorted_histograms.emplace_back(pair.first, nullptr, pair.second);
+    std::sort(sorted_histograms.begin(), sorted_histograms.end(),
+              [](const std::tuple<std::string, TH1 *, THnSparse *> &a, const std::tuple<std::string, TH1 *, THnSparse *> &b)
+              {
+                  return std::get<0>(a) < std::get<0>(b);
+              });
+    int n_hists[3] = {0, 0, 0};
+    for (const auto &[histname, this_hist, sparse]: sorted_histograms) {
+        TH1 *hist = this_hist;
+        if (sparse) {
+            if (sparse->GetNdimensions() == 2) hist = sparse->Projection(1, 0, "E");
+            else hist = sparse->Projection(0, 1, 2, "E");
+            hist->SetDirectory(nullptr);
+            hist->SetTitle("");
+        }
+        const int dim = hist->GetDimension();
+        n_hists[dim - 1]++;
+        if (!writeHistSummaryOnly) cout << "[AnalyzerCore::WriteHist] Writing " << dim << "D histogram: " << histname << endl;
         // Split the directory and name
         // e.g. "dir1/dir2/histname" -> "dir1/dir2", "histname"
         // e.g. "histname" -> "", "histname"
@@ -2034,29 +3083,61 @@ void AnalyzerCore::WriteHist() {
         last_slash == string::npos ? this_prefix = "" : this_prefix = histname.substr(0, last_slash);
         last_slash == string::npos ? this_name = histname : this_name = histname.substr(last_slash + 1);
 
-        TDirectory *this_dir = outfile->GetDirectory(this_prefix.c_str());
-        if (!this_dir) outfile->mkdir(this_prefix.c_str());
-        outfile->cd(this_prefix.c_str());
-        hist->Write(this_name.c_str());
+        getOutputDirectory(this_prefix)->WriteTObject(hist, this_name.c_str());
+        if (sparse) delete hist;
     }
+    writeFriendInfo();
+    int n_trees = 0;
     for (const auto &pair: treemap) {
         const string &treename = pair.first;
-        cout << "[AnalyzerCore::WriteHist] Writing tree: " << treename << endl;
+        if (!writeHistSummaryOnly) cout << "[AnalyzerCore::WriteHist] Writing tree: " << treename << endl;
         TTree *tree = pair.second;
+        n_trees++;
 
         size_t last_slash = treename.find_last_of('/');
         string this_prefix, this_name;
         last_slash == string::npos ? this_prefix = "" : this_prefix = treename.substr(0, last_slash);
         last_slash == string::npos ? this_name = treename : this_name = treename.substr(last_slash + 1);
 
-        TDirectory *this_dir = outfile->GetDirectory(this_prefix.c_str());
-        if (!this_dir) outfile->mkdir(this_prefix.c_str());
-        outfile->cd(this_prefix.c_str());
+        getOutputDirectory(this_prefix)->cd();
         TTree* temptree = tree->CloneTree(-1);//this is because the tree contains lot of empty disabled branch. I don't know better way to handle this, so just keep memory-consuming way for now.
         temptree->Write();
         delete temptree;
         delete tree;
     }
+    // writers of ntuples that were never filled are created here, so every declared ntuple exists in the output
+    string parquet_trees = "";
+    for (const auto &pair: ntuplemodels) {
+        const string &treename = pair.first;
+        if (!writeHistSummaryOnly) cout << "[AnalyzerCore::WriteHist] Writing " << treebackends[treename] << " ntuple: " << treename << endl;
+        n_trees++;
+        if (!ntuplewriters.count(treename)) {
+            RNTupleAPI::RNTupleWriteOptions options;
+            if (outfileCompression >= 0) options.SetCompression(outfileCompression);
+            ntuplewriters.emplace(treename, RNTupleAPI::RNTupleWriter::Append(std::move(ntuplemodels[treename]), treename, *outfile, options));
+        }
+        if (treebackends[treename] == "Parquet") parquet_trees += (parquet_trees.empty() ? "" : ",") + treename;
+    }
+    ntupleentries.clear();
+    ntuplewriters.clear();  // commits the ntuples
+    ntuplemodels.clear();
+    ntuplecolumns.clear();
+    if (!parquet_trees.empty()) {
+        TNamed parquet_list("SKNanoParquetTrees", parquet_trees.c_str());
+        outfile->WriteTObject(&parquet_list);
+    }
+    writeEventCacheInfo();
+    column_resetters.clear();
+    columnmap.clear();
+    if (writeHistSummaryOnly) {
+        cout << "[AnalyzerCore::WriteHist] Wrote " << n_hists[0] << " 1D, " << n_hists[1] << " 2D, " << n_hists[2] << " 3D histograms and "
+             << n_trees << " trees in " << outdirmap.size() << " directories" << endl;
+    }
     cout << "[AnalyzerCore::WriteHist] Writing histograms done" << endl;
+    outdirmap.clear();
+    WriteSkim();
+    const bool remove_outfile = skim_outpath != "" && skim_perInput && outfile->GetNkeys() == 0;
+    const TString outfile_path = outfile->GetName();
     outfile->Close();
+    if (remove_outfile) gSystem->Unlink(outfile_path);
 }
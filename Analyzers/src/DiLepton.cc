@@ -19,6 +19,8 @@ void DiLepton::initializeAnalyzer() {
     } else {
         systHelper = std::make_unique<SystematicHelper>(SKNANO_HOME + "/AnalyzerTools/DiLeptonSystematic.yaml", MCSample, DataEra);
     }
+
+    defineObjectPipeline();
 }
 
 void DiLepton::executeEvent() {
@@ -41,10 +43,17 @@ void DiLepton::executeEvent() {
     RVec<Gen> genParts = !IsDATA ? GetAllGens() : RVec<Gen>();
     RVec<GenJet> genJets = !IsDATA ? GetAllGenJets() : RVec<GenJet>();
 
+    // Raw inputs of the object pipeline, see defineObjectPipeline
+    SetObject("event", ev);
+    SetObject("rawMuons", std::move(rawMuons));
+    SetObject("rawElectrons", std::move(rawElectrons));
+    SetObject("rawJets", std::move(rawJets));
+    SetObject("genJets", std::move(genJets));
+
     // Use SystematicHelper for systematic variations
     if (!IsDATA && run_syst && systHelper) {
         // Step 1: Process Central objects and weight-only systematics
-        RecoObjects centralObjects = defineObjects(ev, rawMuons, rawElectrons, rawJets, genJets, "Central");
+        RecoObjects centralObjects = defineObjects("Central");
         fillCutflow(CutStage::LeptonSelection, Channel::NONE, initialWeight, "Central");
         
         Channel selectedChannel = selectEvent(ev, centralObjects, "Central");
@@ -66,7 +75,7 @@ void DiLepton::executeEvent() {
                 if (systName == "Central" || !systHelper->findSystematic(syst.syst_name)->evtLoopAgain) continue;
                 
                 // Define objects with systematic variation
-                RecoObjects recoObjects = defineObjects(ev, rawMuons, rawElectrons, rawJets, genJets, systName);
+                RecoObjects recoObjects = defineObjects(systName);
                 Channel systChannel = selectEvent(ev, recoObjects, systName);
                 
                 if (systChannel != Channel::NONE) {
@@ -77,7 +86,7 @@ void DiLepton::executeEvent() {
         }
     } else {
         // Process only Central for DATA or when systematics are off
-        RecoObjects recoObjects = defineObjects(ev, rawMuons, rawElectrons, rawJets, genJets, "Central");
+        RecoObjects recoObjects = defineObjects("Central");
         fillCutflow(CutStage::LeptonSelection, Channel::NONE, initialWeight, "Central");
         
         Channel selectedChannel = selectEvent(ev, recoObjects, "Central");
@@ -90,105 +99,110 @@ void DiLepton::executeEvent() {
     }
 }
 
-DiLepton::RecoObjects DiLepton::defineObjects(Event& ev, 
-                                             const RVec<Muon>& rawMuons, 
-                                             const RVec<Electron>& rawElectrons, 
-                                             const RVec<Jet>& rawJets,
-                                             const RVec<GenJet>& genJets, 
-                                             const TString& syst) {
-
-    // Create copies of the raw objects
-    RVec<Muon> allMuons = rawMuons;
-    RVec<Electron> allElectrons = rawElectrons;
-    RVec<Jet> allJets = rawJets;
-    
-    // Determine systematic variation type and direction
-    MyCorrection::variation systVar = MyCorrection::variation::nom;
-    TString systSource = "";
-    
-    // Apply scale variations based on systematic name
-    if (syst.Contains("ElectronEn")) {
-        TString variation = syst.Contains("Up") ? "up" : "down";
-        allElectrons = ScaleElectrons(ev, allElectrons, variation);
-    } else if (syst.Contains("ElectronRes")) {
-        TString variation = syst.Contains("Up") ? "up" : "down";
-        allElectrons = SmearElectrons(allElectrons, variation);
-    } else if (syst.Contains("MuonEn")) {
-        TString variation = syst.Contains("Up") ? "up" : "down";
-        allMuons = ScaleMuons(allMuons, variation);
-    } else if (syst.Contains("JetEn")) {
-        TString variation = syst.Contains("Up") ? "up" : "down";
-        systVar = syst.Contains("Up") ? MyCorrection::variation::up : MyCorrection::variation::down;
-        systSource = "total"; // Use default JES source for simple JetEn systematics
-        allJets = ScaleJets(allJets, variation, systSource);
-    } else if (syst.Contains("JetRes")) {
-        TString variation = syst.Contains("Up") ? "up" : "down";
-        allJets = SmearJets(allJets, genJets, variation);
-    } else {
-        // No scale variation
-    }
-    
-    // Get MET from event and re-apply Type-I correction and XY correction
-    Particle METv_default;
-    if (syst.Contains("UnclusteredEn")) {
-        Event::MET_Syst variation = syst.Contains("Up") ? Event::MET_Syst::UE_UP : Event::MET_Syst::UE_DOWN;
-        METv_default = ev.GetMETVector(Event::MET_Type::PUPPI, variation);
-    } else {
-        METv_default = ev.GetMETVector(Event::MET_Type::PUPPI);
-    }
-    Particle METv = ApplyTypeICorrection(METv_default, allJets, allElectrons, allMuons);
+void DiLepton::defineObjectPipeline() {
+    // Scaled and sorted collections, each one only depends on the variations of its own object type
+    DefineObject<RVec<Muon>>("allMuons", {"rawMuons", "MuonEn"}, [this](const TString &syst) {
+        RVec<Muon> allMuons = GetObject<RVec<Muon>>("rawMuons");
+        if (syst.Contains("MuonEn")) allMuons = ScaleMuons(allMuons, syst.Contains("Up") ? "up" : "down");
+        sort(allMuons.begin(), allMuons.end(), [](const Muon& a, const Muon& b) { return a.Pt() > b.Pt(); });
+        return allMuons;
+    });
+    DefineObject<RVec<Electron>>("allElectrons", {"event", "rawElectrons", "ElectronEn", "ElectronRes"}, [this](const TString &syst) {
+        RVec<Electron> allElectrons = GetObject<RVec<Electron>>("rawElectrons");
+        if (syst.Contains("ElectronEn")) allElectrons = ScaleElectrons(GetObject<Event>("event"), allElectrons, syst.Contains("Up") ? "up" : "down");
+        else if (syst.Contains("ElectronRes")) allElectrons = SmearElectrons(allElectrons, syst.Contains("Up") ? "up" : "down");
+        sort(allElectrons.begin(), allElectrons.end(), [](const Electron& a, const Electron& b) { return a.Pt() > b.Pt(); });
+        return allElectrons;
+    });
+    DefineObject<RVec<Jet>>("allJets", {"rawJets", "genJets", "JetEn", "JetRes"}, [this](const TString &syst) {
+        RVec<Jet> allJets = GetObject<RVec<Jet>>("rawJets");
+        // Use default JES source for simple JetEn systematics
+        if (syst.Contains("JetEn")) allJets = ScaleJets(allJets, syst.Contains("Up") ? "up" : "down", "total");
+        else if (syst.Contains("JetRes")) allJets = SmearJets(allJets, GetObject<RVec<GenJet>>("genJets"), syst.Contains("Up") ? "up" : "down");
+        sort(allJets.begin(), allJets.end(), [](const Jet& a, const Jet& b) { return a.Pt() > b.Pt(); });
+        return allJets;
+    });
+
+    // Get MET from event and re-apply Type-I correction
+    DefineObject<Particle>("METv_default", {"event", "UnclusteredEn"}, [this](const TString &syst) {
+        const Event &ev = GetObject<Event>("event");
+        if (syst.Contains("UnclusteredEn")) return ev.GetMETVector(Event::MET_Type::PUPPI, syst.Contains("Up") ? Event::MET_Syst::UE_UP : Event::MET_Syst::UE_DOWN);
+        return ev.GetMETVector(Event::MET_Type::PUPPI);
+    });
     // XY correction is not recommended for PUPPI MET
-    
     // Example for using CHS MET
     // UE variation should be done inside of ApplyTypeICorrection
     // Particle METv_default = ev.GetMETVector(Event::MET_Type::CHS);
-    // Particle METv = ApplyTypeICorrection(METv_default, allJets, allElectrons, allMuons);
     // Particle METv = ApplyTypeICorrection(METv_default, allJets, allElectrons, allMuons, MyCorrection::variation::up); // unclustered up
-    // Particle METv = ApplyTypeICorrection(METv_default, allJets, allElectrons, allMuons, MyCorrection::variation::down); // unclustered down
     // METv = myCorr->METXYCorrection(METv, ev.run(), ev.nPV(), MyCorrection::XYCorrection_MetType::Type1CHSMET);
-
-    // Sort objects in pt order
-    sort(allMuons.begin(), allMuons.end(), [](const Muon& a, const Muon& b) { return a.Pt() > b.Pt(); });
-    sort(allElectrons.begin(), allElectrons.end(), [](const Electron& a, const Electron& b) { return a.Pt() > b.Pt(); });
-    sort(allJets.begin(), allJets.end(), [](const Jet& a, const Jet& b) { return a.Pt() > b.Pt(); });
-
-    RVec<Muon> looseMuons = SelectMuons(allMuons, MuonIDs->GetID("loose"), 10., 2.4);
-    RVec<Muon> tightMuons = SelectMuons(looseMuons, MuonIDs->GetID("tight"), 10., 2.4);
-    RVec<Electron> looseElectrons = SelectElectrons(allElectrons, ElectronIDs->GetID("loose"), 15., 2.5);
-    RVec<Electron> tightElectrons = SelectElectrons(looseElectrons, ElectronIDs->GetID("tight"), 15., 2.5);
-    
-    const float max_jeteta = DataEra.Contains("2016") ? 2.4 : 2.5;
-    RVec<Jet> tightJets = SelectJets(allJets, "tight", 20., max_jeteta);
-    if (Run == 2) tightJets = SelectJets(tightJets, "loosePuId", 20., max_jeteta);
-    RVec<Jet> tightJets_vetoLep = JetsVetoLeptonInside(tightJets, looseElectrons, looseMuons, 0.4);
-
-    // For Run2, apply jet-by-jet veto map
-    if (Run == 2 && !RunNoVetoMap) {
-        RVec<Jet> tightJets_vetoLep_vetoMap;
-        for (const auto &jet : tightJets_vetoLep) {
-            if (PassVetoMap(jet, looseMuons, "jetvetomap")) tightJets_vetoLep_vetoMap.push_back(jet);
+    DefineObject<Particle>("METv", {"METv_default", "allJets", "allElectrons", "allMuons"}, [this](const TString &syst) {
+        return ApplyTypeICorrection(GetObject<Particle>("METv_default"), GetObject<RVec<Jet>>("allJets"), GetObject<RVec<Electron>>("allElectrons"), GetObject<RVec<Muon>>("allMuons"));
+    });
+
+    DefineObject<RVec<Muon>>("looseMuons", {"allMuons"}, [this](const TString &syst) {
+        return SelectMuons(GetObject<RVec<Muon>>("allMuons"), MuonIDs->GetID("loose"), 10., 2.4);
+    });
+    DefineObject<RVec<Muon>>("tightMuons", {"looseMuons"}, [this](const TString &syst) {
+        return SelectMuons(GetObject<RVec<Muon>>("looseMuons"), MuonIDs->GetID("tight"), 10., 2.4);
+    });
+    DefineObject<RVec<Electron>>("looseElectrons", {"allElectrons"}, [this](const TString &syst) {
+        return SelectElectrons(GetObject<RVec<Electron>>("allElectrons"), ElectronIDs->GetID("loose"), 15., 2.5);
+    });
+    DefineObject<RVec<Electron>>("tightElectrons", {"looseElectrons"}, [this](const TString &syst) {
+        return SelectElectrons(GetObject<RVec<Electron>>("looseElectrons"), ElectronIDs->GetID("tight"), 15., 2.5);
+    });
+
+    DefineObject<RVec<Jet>>("tightJets", {"allJets"}, [this](const TString &syst) {
+        const float max_jeteta = DataEra.Contains("2016") ? 2.4 : 2.5;
+        RVec<Jet> tightJets = SelectJets(GetObject<RVec<Jet>>("allJets"), "tight", 20., max_jeteta);
+        if (Run == 2) tightJets = SelectJets(tightJets, "loosePuId", 20., max_jeteta);
+        return tightJets;
+    });
+    DefineObject<RVec<Jet>>("tightJets_vetoLep", {"tightJets", "looseElectrons", "looseMuons"}, [this](const TString &syst) {
+        const RVec<Muon> &looseMuons = GetObject<RVec<Muon>>("looseMuons");
+        RVec<Jet> tightJets_vetoLep = JetsVetoLeptonInside(GetObject<RVec<Jet>>("tightJets"), GetObject<RVec<Electron>>("looseElectrons"), looseMuons, 0.4);
+
+        // For Run2, apply jet-by-jet veto map
+        if (Run == 2 && !RunNoVetoMap) {
+            RVec<Jet> tightJets_vetoLep_vetoMap;
+            for (const auto &jet : tightJets_vetoLep) {
+                if (PassVetoMap(jet, looseMuons, "jetvetomap")) tightJets_vetoLep_vetoMap.push_back(jet);
+            }
+            tightJets_vetoLep = tightJets_vetoLep_vetoMap;
         }
-        tightJets_vetoLep = tightJets_vetoLep_vetoMap;
-    }
+        return tightJets_vetoLep;
+    });
+    DefineObject<RVec<Jet>>("bjets", {"tightJets_vetoLep"}, [this](const TString &syst) {
+        RVec<Jet> bjets;
+        float wp = myCorr->GetBTaggingWP(JetTagging::JetFlavTagger::DeepJet, JetTagging::JetFlavTaggerWP::Medium);
+        for (const auto& jet : GetObject<RVec<Jet>>("tightJets_vetoLep")) {
+            float btagScore = jet.GetBTaggerResult(JetTagging::JetFlavTagger::DeepJet);
+            if (btagScore > wp) bjets.emplace_back(jet);
+        }
+        return bjets;
+    });
+}
 
-    RVec<Jet> bjets;
-    float wp = myCorr->GetBTaggingWP(JetTagging::JetFlavTagger::DeepJet, JetTagging::JetFlavTaggerWP::Medium);
-    for (auto& jet : tightJets_vetoLep) {
-        float btagScore = jet.GetBTaggerResult(JetTagging::JetFlavTagger::DeepJet);
-        if (btagScore > wp) bjets.emplace_back(jet);
+DiLepton::RecoObjects DiLepton::defineObjects(const TString& syst) {
+    // Only the objects downstream of the varied object type are recomputed,
+    // the others are taken from the Central pass of this event
+    RVec<TString> variedTags;
+    for (const auto &tag : {"ElectronEn", "ElectronRes", "MuonEn", "JetEn", "JetRes", "UnclusteredEn"}) {
+        if (syst.Contains(tag)) variedTags.push_back(tag);
     }
+    SetVariation(syst, variedTags);
 
     RecoObjects objects;
-    objects.looseMuons = looseMuons;
-    objects.tightMuons = tightMuons;
-    objects.looseElectrons = looseElectrons;
-    objects.tightElectrons = tightElectrons;
-    objects.tightJets = tightJets;
-    objects.tightJets_vetoLep = tightJets_vetoLep;
-    objects.bjets = bjets;
-    objects.genJets = genJets;
-    objects.METv_default = METv_default;
-    objects.METv = METv;
+    objects.looseMuons = GetObject<RVec<Muon>>("looseMuons");
+    objects.tightMuons = GetObject<RVec<Muon>>("tightMuons");
+    objects.looseElectrons = GetObject<RVec<Electron>>("looseElectrons");
+    objects.tightElectrons = GetObject<RVec<Electron>>("tightElectrons");
+    objects.tightJets = GetObject<RVec<Jet>>("tightJets");
+    objects.tightJets_vetoLep = GetObject<RVec<Jet>>("tightJets_vetoLep");
+    objects.bjets = GetObject<RVec<Jet>>("bjets");
+    objects.genJets = GetObject<RVec<GenJet>>("genJets");
+    objects.METv_default = GetObject<Particle>("METv_default");
+    objects.METv = GetObject<Particle>("METv");
 
     return objects;
 }
@@ -275,23 +289,26 @@ void DiLepton::processWeightOnlySystematics(const DiLepton::Channel& channel,
         }
     }
 
-    // Process each weight-only systematic (Up and Down variations)
+    // Collect all variations (Up, Down and the not implemented check) and fill them in one pass
+    RVec<WeightInfo> variationWeights;
+    RVec<TString> variationNames;
+    const WeightInfo centralWeights = getWeights(channel, event, recoObjects, genParts, "Central");
     for (const std::string& systName : channelFilteredSystematics) {
         // Up variation
         TString systNameUp = systName + "_Up";
-        WeightInfo weightsUp = getWeights(channel, event, recoObjects, genParts, systNameUp);
-        fillObjects(channel, recoObjects, weightsUp, systNameUp);
+        variationWeights.push_back(getWeights(channel, event, recoObjects, genParts, systNameUp));
+        variationNames.push_back(systNameUp);
         
         // Down variation
         TString systNameDown = systName + "_Down";
-        WeightInfo weightsDown = getWeights(channel, event, recoObjects, genParts, systNameDown);
-        fillObjects(channel, recoObjects, weightsDown, systNameDown);
+        variationWeights.push_back(getWeights(channel, event, recoObjects, genParts, systNameDown));
+        variationNames.push_back(systNameDown);
 
         // Check not implemented case
-        TString systNameNotImplemented = systName + "_NotImplemented";
-        WeightInfo centralWeights = getWeights(channel, event, recoObjects, genParts, "Central");
-        fillObjects(channel, recoObjects, centralWeights, systNameNotImplemented);
+        variationWeights.push_back(centralWeights);
+        variationNames.push_back(systName + "_NotImplemented");
     }
+    fillObjects(channel, recoObjects, variationWeights, variationNames);
 }
 
 DiLepton::WeightInfo DiLepton::getWeights(const DiLepton::Channel& channel,
@@ -412,6 +429,11 @@ DiLepton::WeightInfo DiLepton::getWeights(const DiLepton::Channel& channel,
 
 void DiLepton::fillObjects(const DiLepton::Channel& channel, const RecoObjects& recoObjects, 
                           const WeightInfo& weights, const TString& syst) {
+    fillObjects(channel, recoObjects, RVec<WeightInfo>{weights}, RVec<TString>{syst});
+}
+
+void DiLepton::fillObjects(const DiLepton::Channel& channel, const RecoObjects& recoObjects, 
+                          const RVec<WeightInfo>& weights, const RVec<TString>& systs) {
     const RVec<Muon>& muons = recoObjects.tightMuons;
     const RVec<Electron>& electrons = recoObjects.tightElectrons;
     const RVec<Jet>& jets = recoObjects.tightJets_vetoLep;
@@ -420,90 +442,101 @@ void DiLepton::fillObjects(const DiLepton::Channel& channel, const RecoObjects&
     const Particle& METv = recoObjects.METv;
 
     TString channelStr = channelToString(channel);
-    float weight = 1.;
+    // The objects are the same for all weight variations, every observable below is
+    // computed once and filled for all systematics in systs with a single FillHist call
+    const int systset = BookSystSet(systs);
+    RVec<float> weightValues(systs.size(), 1.);
 
     if (!IsDATA) {
-        weight = weights.genWeight * weights.prefireWeight * weights.pileupWeight * 
-                weights.topPtWeight * weights.muonRecoSF * weights.muonIDSF * 
-                weights.eleRecoSF * weights.eleIDSF * weights.trigSF * 
-                weights.pileupIDSF * weights.btagSF;
-
-        if (syst.Contains("NotImplemented")) {
-            if (syst.Contains("L1Prefire")) weight /= weights.prefireWeight;
-            if (syst.Contains("PileupReweight")) weight /= weights.pileupWeight;
-            if (syst.Contains("TopPtReweight")) weight /= weights.topPtWeight;
-            if (syst.Contains("PileupJetIDSF")) weight /= weights.pileupIDSF;
-            if (syst.Contains("MuonIDSF")) weight /= (weights.muonIDSF*weights.trigSF);
-            if (syst.Contains("ElectronIDSF")) weight /= (weights.eleIDSF*weights.trigSF);
-            if (syst.Contains("DblMuTrigSF")) weight /= weights.trigSF;
-            if (syst.Contains("EMuTrigSF")) weight /= weights.trigSF;
+        for (size_t i = 0; i < systs.size(); i++) {
+            const WeightInfo& w = weights.at(i);
+            const TString& syst = systs.at(i);
+            float weight = w.genWeight * w.prefireWeight * w.pileupWeight * 
+                           w.topPtWeight * w.muonRecoSF * w.muonIDSF * 
+                           w.eleRecoSF * w.eleIDSF * w.trigSF * 
+                           w.pileupIDSF * w.btagSF;
+
+            if (syst.Contains("NotImplemented")) {
+                if (syst.Contains("L1Prefire")) weight /= w.prefireWeight;
+                if (syst.Contains("PileupReweight")) weight /= w.pileupWeight;
+                if (syst.Contains("TopPtReweight")) weight /= w.topPtWeight;
+                if (syst.Contains("PileupJetIDSF")) weight /= w.pileupIDSF;
+                if (syst.Contains("MuonIDSF")) weight /= (w.muonIDSF*w.trigSF);
+                if (syst.Contains("ElectronIDSF")) weight /= (w.eleIDSF*w.trigSF);
+                if (syst.Contains("DblMuTrigSF")) weight /= w.trigSF;
+                if (syst.Contains("EMuTrigSF")) weight /= w.trigSF;
+            }
+            weightValues[i] = weight;
+
+            // one value per systematic, filled through the handles of the systematic set
+            auto fillWeight = [&](const TString &name, float value, int n_bin, float x_min, float x_max) {
+                FillHist(GetSystSetHandles(channelStr + "/{syst}/weights/" + name, systset, n_bin, x_min, x_max)[i], value, 1.);
+            };
+            fillWeight("genWeight", w.genWeight, 200, -10000, 10000.);
+            fillWeight("prefireWeight", w.prefireWeight, 100, -5., 5.);
+            fillWeight("pileupWeight", w.pileupWeight, 100, -5., 5.);
+            fillWeight("topPtWeight", w.topPtWeight, 100, -5., 5.);
+            fillWeight("muonRecoSF", w.muonRecoSF, 100, -5., 5.);
+            fillWeight("muonIDSF", w.muonIDSF, 100, -5., 5.);
+            fillWeight("eleRecoSF", w.eleRecoSF, 100, -5., 5.);
+            fillWeight("eleIDSF", w.eleIDSF, 100, -5., 5.);
+            fillWeight("trigSF", w.trigSF, 100, -5., 5.);
+            fillWeight("pileupIDSF", w.pileupIDSF, 100, -5., 5.);
+            fillWeight("btagSF", w.btagSF, 100, -5., 5.);
         }
-
-
-        FillHist(Form("%s/%s/weights/genWeight", channelStr.Data(), syst.Data()), weights.genWeight, 1., 200, -10000, 10000.);
-        FillHist(Form("%s/%s/weights/prefireWeight", channelStr.Data(), syst.Data()), weights.prefireWeight, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/pileupWeight", channelStr.Data(), syst.Data()), weights.pileupWeight, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/topPtWeight", channelStr.Data(), syst.Data()), weights.topPtWeight, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/muonRecoSF", channelStr.Data(), syst.Data()), weights.muonRecoSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/muonIDSF", channelStr.Data(), syst.Data()), weights.muonIDSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/eleRecoSF", channelStr.Data(), syst.Data()), weights.eleRecoSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/eleIDSF", channelStr.Data(), syst.Data()), weights.eleIDSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/trigSF", channelStr.Data(), syst.Data()), weights.trigSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/pileupIDSF", channelStr.Data(), syst.Data()), weights.pileupIDSF, 1., 100, -5., 5.);
-        FillHist(Form("%s/%s/weights/btagSF", channelStr.Data(), syst.Data()), weights.btagSF, 1., 100, -5., 5.);
     }
 
     // Fill muon histograms
     for (size_t idx = 0; idx < muons.size(); ++idx) {
         const Muon& mu = muons.at(idx);
-        FillHist(Form("%s/%s/muons/%zu/pt", channelStr.Data(), syst.Data(), idx+1), mu.Pt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/muons/%zu/eta", channelStr.Data(), syst.Data(), idx+1), mu.Eta(), weight, 48, -2.4, 2.4);
-        FillHist(Form("%s/%s/muons/%zu/phi", channelStr.Data(), syst.Data(), idx+1), mu.Phi(), weight, 64, -3.2, 3.2);
-        FillHist(Form("%s/%s/muons/%zu/mass", channelStr.Data(), syst.Data(), idx+1), mu.M(), weight, 10, 0., 1.);
+        FillHist(Form("%s/{syst}/muons/%zu/pt", channelStr.Data(), idx+1), systset, mu.Pt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/muons/%zu/eta", channelStr.Data(), idx+1), systset, mu.Eta(), weightValues, 48, -2.4, 2.4);
+        FillHist(Form("%s/{syst}/muons/%zu/phi", channelStr.Data(), idx+1), systset, mu.Phi(), weightValues, 64, -3.2, 3.2);
+        FillHist(Form("%s/{syst}/muons/%zu/mass", channelStr.Data(), idx+1), systset, mu.M(), weightValues, 10, 0., 1.);
     }
 
     // Fill electron histograms
     for (size_t idx = 0; idx < electrons.size(); ++idx) {
         const Electron& ele = electrons.at(idx);
-        FillHist(Form("%s/%s/electrons/%zu/pt", channelStr.Data(), syst.Data(), idx+1), ele.Pt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/electrons/%zu/eta", channelStr.Data(), syst.Data(), idx+1), ele.Eta(), weight, 50, -2.5, 2.5);
-        FillHist(Form("%s/%s/electrons/%zu/phi", channelStr.Data(), syst.Data(), idx+1), ele.Phi(), weight, 64, -3.2, 3.2);
-        FillHist(Form("%s/%s/electrons/%zu/mass", channelStr.Data(), syst.Data(), idx+1), ele.M(), weight, 100, 0., 1.);
+        FillHist(Form("%s/{syst}/electrons/%zu/pt", channelStr.Data(), idx+1), systset, ele.Pt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/electrons/%zu/eta", channelStr.Data(), idx+1), systset, ele.Eta(), weightValues, 50, -2.5, 2.5);
+        FillHist(Form("%s/{syst}/electrons/%zu/phi", channelStr.Data(), idx+1), systset, ele.Phi(), weightValues, 64, -3.2, 3.2);
+        FillHist(Form("%s/{syst}/electrons/%zu/mass", channelStr.Data(), idx+1), systset, ele.M(), weightValues, 100, 0., 1.);
     }
 
     // Fill jet histograms
     for (size_t idx = 0; idx < jets.size(); ++idx) {
         const Jet& jet = jets.at(idx);
-        FillHist(Form("%s/%s/jets/%zu/pt", channelStr.Data(), syst.Data(), idx+1), jet.Pt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/jets/%zu/rawPt", channelStr.Data(), syst.Data(), idx+1), jet.GetRawPt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/jets/%zu/originalPt", channelStr.Data(), syst.Data(), idx+1), jet.GetOriginalPt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/jets/%zu/eta", channelStr.Data(), syst.Data(), idx+1), jet.Eta(), weight, 48, -2.4, 2.4);
-        FillHist(Form("%s/%s/jets/%zu/phi", channelStr.Data(), syst.Data(), idx+1), jet.Phi(), weight, 64, -3.2, 3.2);
-        FillHist(Form("%s/%s/jets/%zu/mass", channelStr.Data(), syst.Data(), idx+1), jet.M(), weight, 100, 0., 100.);
+        FillHist(Form("%s/{syst}/jets/%zu/pt", channelStr.Data(), idx+1), systset, jet.Pt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/jets/%zu/rawPt", channelStr.Data(), idx+1), systset, jet.GetRawPt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/jets/%zu/originalPt", channelStr.Data(), idx+1), systset, jet.GetOriginalPt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/jets/%zu/eta", channelStr.Data(), idx+1), systset, jet.Eta(), weightValues, 48, -2.4, 2.4);
+        FillHist(Form("%s/{syst}/jets/%zu/phi", channelStr.Data(), idx+1), systset, jet.Phi(), weightValues, 64, -3.2, 3.2);
+        FillHist(Form("%s/{syst}/jets/%zu/mass", channelStr.Data(), idx+1), systset, jet.M(), weightValues, 100, 0., 100.);
     }
 
     // Fill bjet histograms
     for (size_t idx = 0; idx < bjets.size(); ++idx) {
         const Jet& bjet = bjets.at(idx);
-        FillHist(Form("%s/%s/bjets/%zu/pt", channelStr.Data(), syst.Data(), idx+1), bjet.Pt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/bjets/%zu/eta", channelStr.Data(), syst.Data(), idx+1), bjet.Eta(), weight, 48, -2.4, 2.4);
-        FillHist(Form("%s/%s/bjets/%zu/phi", channelStr.Data(), syst.Data(), idx+1), bjet.Phi(), weight, 64, -3.2, 3.2);
-        FillHist(Form("%s/%s/bjets/%zu/mass", channelStr.Data(), syst.Data(), idx+1), bjet.M(), weight, 100, 0., 100.);
+        FillHist(Form("%s/{syst}/bjets/%zu/pt", channelStr.Data(), idx+1), systset, bjet.Pt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/bjets/%zu/eta", channelStr.Data(), idx+1), systset, bjet.Eta(), weightValues, 48, -2.4, 2.4);
+        FillHist(Form("%s/{syst}/bjets/%zu/phi", channelStr.Data(), idx+1), systset, bjet.Phi(), weightValues, 64, -3.2, 3.2);
+        FillHist(Form("%s/{syst}/bjets/%zu/mass", channelStr.Data(), idx+1), systset, bjet.M(), weightValues, 100, 0., 100.);
     }
 
-    FillHist(Form("%s/%s/jets/size", channelStr.Data(), syst.Data()), jets.size(), weight, 20, 0., 20.);
-    FillHist(Form("%s/%s/bjets/size", channelStr.Data(), syst.Data()), bjets.size(), weight, 15, 0., 15.);
-    FillHist(Form("%s/%s/METv/pt", channelStr.Data(), syst.Data()), METv.Pt(), weight, 300, 0., 300.);
-    FillHist(Form("%s/%s/METv/phi", channelStr.Data(), syst.Data()), METv.Phi(), weight, 64, -3.2, 3.2);
-    FillHist(Form("%s/%s/METv_default/pt", channelStr.Data(), syst.Data()), METv_default.Pt(), weight, 300, 0., 300.);
-    FillHist(Form("%s/%s/METv_default/phi", channelStr.Data(), syst.Data()), METv_default.Phi(), weight, 64, -3.2, 3.2);
+    FillHist(Form("%s/{syst}/jets/size", channelStr.Data()), systset, jets.size(), weightValues, 20, 0., 20.);
+    FillHist(Form("%s/{syst}/bjets/size", channelStr.Data()), systset, bjets.size(), weightValues, 15, 0., 15.);
+    FillHist(Form("%s/{syst}/METv/pt", channelStr.Data()), systset, METv.Pt(), weightValues, 300, 0., 300.);
+    FillHist(Form("%s/{syst}/METv/phi", channelStr.Data()), systset, METv.Phi(), weightValues, 64, -3.2, 3.2);
+    FillHist(Form("%s/{syst}/METv_default/pt", channelStr.Data()), systset, METv_default.Pt(), weightValues, 300, 0., 300.);
+    FillHist(Form("%s/{syst}/METv_default/phi", channelStr.Data()), systset, METv_default.Phi(), weightValues, 64, -3.2, 3.2);
 
     if (channel == Channel::DIMU) {
         Particle pair = muons.at(0) + muons.at(1);
-        FillHist(Form("%s/%s/pair/pt", channelStr.Data(), syst.Data()), pair.Pt(), weight, 300, 0., 300.);
-        FillHist(Form("%s/%s/pair/eta", channelStr.Data(), syst.Data()), pair.Eta(), weight, 100, -5., 5.);
-        FillHist(Form("%s/%s/pair/phi", channelStr.Data(), syst.Data()), pair.Phi(), weight, 64, -3.2, 3.2);
-        FillHist(Form("%s/%s/pair/mass", channelStr.Data(), syst.Data()), pair.M(), weight, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/pair/pt", channelStr.Data()), systset, pair.Pt(), weightValues, 300, 0., 300.);
+        FillHist(Form("%s/{syst}/pair/eta", channelStr.Data()), systset, pair.Eta(), weightValues, 100, -5., 5.);
+        FillHist(Form("%s/{syst}/pair/phi", channelStr.Data()), systset, pair.Phi(), weightValues, 64, -3.2, 3.2);
+        FillHist(Form("%s/{syst}/pair/mass", channelStr.Data()), systset, pair.M(), weightValues, 300, 0., 300.);
     }
 }
 
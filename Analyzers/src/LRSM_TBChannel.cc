@@ -28,6 +28,7 @@ void LRSM_TBChannel::initializeAnalyzer() {
     // Your data has HighPtId=1, so use POG_TRACKER_HIGH_PT instead of POG_GLOBAL_HIGH_PT
     MuonIDs.push_back(Muon::MuonID::POG_GLOBAL_HIGH_PT);  // This matches your data (HighPtId=2)
     MuonIDs.push_back(Muon::MuonID::POG_TKISO_TIGHT);      // TkIsoId=2
+    MuonIDSFKeys = {"NUM_HighPtID_DEN_TrackerMuons"};
     
     // Alternative: Use standard IDs if high-pT selection isn't critical
     // MuonIDs.push_back(Muon::MuonID::POG_TIGHT);
@@ -73,36 +74,9 @@ void LRSM_TBChannel::initializeAnalyzer() {
     cout << "[LRSM_TBChannel::initializeAnalyzer] TriggerSafePtCut = " << TriggerSafePtCut << endl;
     
     // Initialize corrections
-    if (IsDATA){
-        if (DataEra == "2022") {
-            corr_C = new MyCorrection("2022", "C", MCSample, true);
-            corr_D = new MyCorrection("2022", "D", MCSample, true);
-            corr_sm = new MyCorrection("2022", "SingleMuon", MCSample, true);
+    // one instance covers all periods of the era, period-dependent corrections are picked by run number
+    myCorr = new MyCorrection(DataEra, DataPeriod, IsDATA ? DataStream : MCSample, IsDATA);
 
-            
-        } else if (DataEra == "2022EE") {
-            corr_E = new MyCorrection("2022EE", "E", MCSample, true);
-            corr_F = new MyCorrection("2022EE", "F", MCSample, true);
-            corr_G = new MyCorrection("2022EE", "G", MCSample, true);
-        }
-        
-    } else{
-        if (DataEra == "2022") {
-            corr_C = new MyCorrection("2022", "C", MCSample, false);
-            corr_D = new MyCorrection("2022", "D", MCSample, false);
-            corr_sm = new MyCorrection("2022", "SingleMuon", MCSample, false);
-        } else if (DataEra == "2022EE") {
-            corr_E = new MyCorrection("2022EE", "E", MCSample, false);
-            corr_F = new MyCorrection("2022EE", "F", MCSample, false);
-            corr_G = new MyCorrection("2022EE", "G", MCSample, false);
-        }
-    }
-
-    
-
-
-
-    
     // Initialize systematic helper
     string SKNANO_HOME = getenv("SKNANO_HOME");
     if (IsDATA) {
@@ -257,17 +231,12 @@ void LRSM_TBChannel::executeEventFromParameter() {
 
     // correction 
 
-    float corr1_1  = corr_C -> GetMuonScaleSF(muon1, variation::this_syst, muon1.Pt());
-    float corr1_2 = corr_C -> GetMuonScaleSF(muon2, variation::this_syst, muon2.Pt());
-
-    float coor_2_1  = coor_C -> GetMuonIDSF( , muon1, variation::this_syst);
-    float coor_2_2  = coor_C -> GetMuonIDSF( , muon2, variation::this_syst);
-
-
-
+    MyCorrection::variation var = MyCorrection::variation::nom;
+    if (this_syst.Contains("_Up")) var = MyCorrection::variation::up;
+    else if (this_syst.Contains("_Down")) var = MyCorrection::variation::down;
 
-    float corr2  = corr_C -> GetMuonIDSF(MuonIDSFKeys[0], muon, variation::nom);
-    float corr3  = corr_C -> GetMuonRECOSF(muon, variation::nom);
+    float corr1_1 = myCorr->GetMuonScaleSF(muon1, var, muon1.Pt());
+    float corr1_2 = myCorr->GetMuonScaleSF(muon2, var, muon2.Pt());
 
     // Event weight calculation
     
@@ -277,6 +246,8 @@ void LRSM_TBChannel::executeEventFromParameter() {
         weight *= ev.GetTriggerLumi("Full");
         //cout << "[LRSM_TBChannel::executeEventFromParameter] Trigger lumi : " << ev.GetTriggerLumi("Full") << endl;
         //cout << "[LRSM_TBChannel::executeEventFromParameter] Event weight: " << weight << endl;
+        weight *= myCorr->GetMuonIDSF(MuonIDSFKeys[0], muon_overlap_cleaned, var);
+        weight *= myCorr->GetMuonRECOSF(muon_overlap_cleaned, var);
         
         FillHist(this_syst + "/xsec" + this_syst, xsec , 1, 100 , 0 , 1000 );
         FillHist(this_syst + "/Bjetnum", bjets.size(), weight, 10, 0., 10.);
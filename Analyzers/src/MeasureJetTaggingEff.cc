@@ -43,8 +43,9 @@ void MeasureJetTaggingEff::initializeAnalyzer()
 
 
 
-    vec_etabins = {0.0, 0.8, 1.6, 2., 2.5};
-    vec_ptbins = {20., 25., 30., 50., 70., 100., 140., 200., 300., 600., 1000.}; // PT bins used in POG SF measurements
+    // binning is shared with MyCorrection::GetBTaggingSFVariations
+    vec_etabins = JetTagging::GetTaggingEffEtaBins();
+    vec_ptbins = JetTagging::GetTaggingEffPtBins();
     // for average users, this binning will be sufficient.
     // but eta-dependence of efficiency can be larger for |eta|>~2, where track & muon detector information of jet constituents starts to get lost, which is critical in tagging.
     // precision analysis with high-eta b may use finer binnings there, but beware of small number of b-jets in high-eta, high-pt bins if you use ttbar sample; proper optimization of bin size should be studied.
@@ -53,6 +54,27 @@ void MeasureJetTaggingEff::initializeAnalyzer()
     NEtaBin = vec_etabins.size() - 1;
     NPtBin = vec_ptbins.size() - 1;
 
+    // WP cuts are looked up once instead of for every jet
+    auto isWPAvailable = [&](const std::string flav, const JetTagging::JetFlavTaggerWP wp, const int run){
+        if(wp != JetTagging::JetFlavTaggerWP::VeryTight && wp != JetTagging::JetFlavTaggerWP::SuperTight) return true;
+        if(flav == "c") return false;
+        if(run == 2) return false;
+        return true;
+    };
+    BTaggingCuts.clear();
+    CTaggingCuts.clear();
+    for(const auto &this_tagger: Taggers){
+        RVec<float> this_bcuts;
+        RVec<pair<float, float>> this_ccuts;
+        for(const auto &this_wp: WPs){
+            // negative cut marks a WP which is not available
+            this_bcuts.push_back(isWPAvailable("b", this_wp, Run) ? myCorr->GetBTaggingWP(this_tagger, this_wp) : -1.);
+            this_ccuts.push_back(isWPAvailable("c", this_wp, Run) ? myCorr->GetCTaggingWP(this_tagger, this_wp) : make_pair(-1.f, -1.f));
+        }
+        BTaggingCuts.push_back(this_bcuts);
+        CTaggingCuts.push_back(this_ccuts);
+    }
+
     etabins = new float[NEtaBin + 1];
     for (int i = 0; i < NEtaBin + 1; i++)
         etabins[i] = vec_etabins.at(i);
@@ -87,12 +109,6 @@ void MeasureJetTaggingEff::executeEvent()
     weight *= w_Gen * w_Norm * w_PU;
     // tagging performance depends on PU, so it is better reweight to proper PU profile
 
-    auto isWPAvailable= [&](const std::string flav, const std::string tagger, const JetTagging::JetFlavTaggerWP wp, const int run){ 
-        if(wp != JetTagging::JetFlavTaggerWP::VeryTight && wp != JetTagging::JetFlavTaggerWP::SuperTight) return true;
-        if(flav == "c") return false;
-        if(run == 2) return false;
-        return true;
-    };
     //==== code to measure btag efficiencies in TT MC
     //==== Reference : https://github.com/rappoccio/usercode/blob/Dev_53x/EDSHyFT/plugins/BTaggingEffAnalyzer.cc
     for (unsigned int ij = 0; ij < jets.size(); ij++)
@@ -117,19 +133,17 @@ void MeasureJetTaggingEff::executeEvent()
             //============ b-tagging
             for(unsigned int i_wp=0; i_wp < WPs.size(); i_wp++){
                 JetTagging::JetFlavTaggerWP this_wp = WPs.at(i_wp);
-                if (!isWPAvailable("b", JetTagging::GetTaggerCorrectionLibStr(this_tagger).Data(), this_wp, Run)) continue;
-                myCorr->SetTaggingParam(this_tagger, this_wp);
-                float this_bTaggingCut = myCorr->GetBTaggingWP();
+                float this_bTaggingCut = BTaggingCuts.at(i_tag).at(i_wp);
+                if (this_bTaggingCut < 0.) continue;
                 if (jets.at(ij).GetBTaggerResult(this_tagger) > this_bTaggingCut)
                     FillHist(string("tagging#b") + "##era#" + DataEra.Data() + "##tagger#" + JetTagging::GetTaggerCorrectionLibStr(this_tagger).Data() + "##working_point#" + JetTagging::GetTaggerCorrectionWPStr(this_wp).Data() + "##flavor#" + string(flav) + "##systematic#central##num", this_Eta, this_Pt, weight, NEtaBin, etabins, NPtBin, ptbins);
             }
             //============ c-tagging
             for(unsigned int i_wp=0; i_wp < WPs.size(); i_wp++){
                 JetTagging::JetFlavTaggerWP this_wp = WPs.at(i_wp);
-                if (!isWPAvailable("c", JetTagging::GetTaggerCorrectionLibStr(this_tagger).Data(), this_wp, Run)) continue;
-                myCorr->SetTaggingParam(this_tagger, this_wp);
-                float this_CvBCut = myCorr->GetCTaggingWP().first;
-                float this_CvLCut = myCorr->GetCTaggingWP().second;
+                float this_CvBCut = CTaggingCuts.at(i_tag).at(i_wp).first;
+                float this_CvLCut = CTaggingCuts.at(i_tag).at(i_wp).second;
+                if (this_CvBCut < 0. || this_CvLCut < 0.) continue;
                 if (jets.at(ij).GetCTaggerResult(this_tagger).first > this_CvBCut && jets.at(ij).GetCTaggerResult(this_tagger).second > this_CvLCut)
                     FillHist(string("tagging#c") + "##era#" + DataEra.Data() + "##tagger#" + JetTagging::GetTaggerCorrectionLibStr(this_tagger).Data() + "##working_point#" + JetTagging::GetTaggerCorrectionWPStr(this_wp).Data() + "##flavor#" + string(flav) + "##systematic#central##num", this_Eta, this_Pt, weight, NEtaBin, etabins, NPtBin, ptbins);
             }
@@ -5,6 +5,9 @@ using json = nlohmann::json;
 SKNanoLoader::SKNanoLoader() {
     MaxEvent = -1;
     NSkipEvent = 0;
+    BatchSize = 0;
+    UseDataFrame = false;
+    NThreads = 1;
     LogEvery = 1000;
     IsDATA = false;
     DataStream = "";
@@ -25,11 +28,107 @@ SKNanoLoader::~SKNanoLoader() {
     delete fChain;
 }
 
+void SKNanoLoader::SyncRunIICounts() {
+    // make sure Run2 and Run3 variables are in sync
+    if (Run == 2) {
+        nLHEPart = static_cast<Int_t>(nLHEPart_RunII);
+        nGenPart = static_cast<Int_t>(nGenPart_RunII);
+        nGenJet = static_cast<Int_t>(nGenJet_RunII);
+        nGenJetAK8 = static_cast<Int_t>(nGenJetAK8_RunII);
+        nGenIsolatedPhoton = static_cast<Int_t>(nGenIsolatedPhoton_RunII);
+        nGenDressedLepton = static_cast<Int_t>(nGenDressedLepton_RunII);
+        nGenVisTau = static_cast<Int_t>(nGenVisTau_RunII);
+        nMuon = static_cast<Int_t>(nMuon_RunII);
+        nElectron = static_cast<Int_t>(nElectron_RunII);
+        nTau = static_cast<Int_t>(nTau_RunII);
+        nPhoton = static_cast<Int_t>(nPhoton_RunII);
+        nJet = static_cast<Int_t>(nJet_RunII);
+        nFatJet = static_cast<Int_t>(nFatJet_RunII);
+        nTrigObj = static_cast<Int_t>(nTrigObj_RunII);
+    }
+}
+
+ROOT::RDF::RNode SKNanoLoader::GetDataFrame() {
+    if (!fDataFrame) throw runtime_error("[SKNanoLoader::GetDataFrame] RDataFrame is not built, set UseDataFrame before Init");
+    ROOT::RDF::RNode df = *fDataFrame;
+    if (!isDataFrameRanged()) return df;
+    // Range is not available with implicit multithreading, processing all entries instead would silently change the result
+    if (ROOT::IsImplicitMTEnabled()) throw runtime_error("[SKNanoLoader::GetDataFrame] MaxEvent and NSkipEvent cannot be used with implicit multithreading, set NThreads = 1");
+    return df.Range(NSkipEvent, MaxEvent > 0 ? MaxEvent : 0);
+}
+
+bool SKNanoLoader::isDataFrameRanged() const {
+    // the job templates always set MaxEvent, a MaxEvent covering the whole chain is no limit
+    return NSkipEvent > 0 || (MaxEvent > 0 && MaxEvent < fChain->GetEntries());
+}
+
+void SKNanoLoader::AddFriend(const TString &path, const TString &treename) {
+    unique_ptr<TFile> file(TFile::Open(path));
+    if (!file || file->IsZombie()) throw runtime_error("[SKNanoLoader::AddFriend] Cannot open " + string(path));
+    TNamed *friend_info = file->Get<TNamed>("SKNanoFriendInfo");
+    if (!friend_info) throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " has no SKNanoFriendInfo, was it written with EnableFriendOutput?");
+    const json info = json::parse(friend_info->GetTitle());
+    if (info["tree"] != string(treename)) throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " holds the friend tree " + info["tree"].get<string>() + ", not " + string(treename));
+    if (!info["complete"].get<bool>()) throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " does not cover every input entry, was the augment run limited by MaxEvent or NSkipEvent?");
+    TTree *tree = file->Get<TTree>(treename);
+    if (!tree) throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " has no tree " + string(treename));
+
+    // the friend is keyed by entry, so the inputs have to be the same files in the same order
+    const auto &inputs = info["inputs"];
+    TObjArray *elements = fChain->GetListOfFiles();
+    if (elements->GetEntries() != static_cast<int>(inputs.size())) {
+        throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " was produced from " + to_string(inputs.size()) + " input files, this job has " + to_string(elements->GetEntries()));
+    }
+    Long64_t total_entries = 0;
+    for (int i = 0; i < elements->GetEntries(); i++) {
+        const TString filename = elements->At(i)->GetTitle();
+        unique_ptr<TFile> input(TFile::Open(filename));
+        if (!input || input->IsZombie()) throw runtime_error("[SKNanoLoader::AddFriend] Cannot open input " + string(filename));
+        TTree *input_tree = input->Get<TTree>(fChain->GetName());
+        const string uuid = input->GetUUID().AsString();
+        const Long64_t entries = input_tree ? input_tree->GetEntries() : 0;
+        if (uuid != inputs[i]["uuid"] || entries != inputs[i]["entries"].get<Long64_t>()) {
+            throw runtime_error("[SKNanoLoader::AddFriend] Input " + to_string(i) + " " + string(filename) + " (" + uuid + ", " + to_string(entries) + " entries) is not "
+                                + inputs[i]["file"].get<string>() + " (" + inputs[i]["uuid"].get<string>() + ", " + to_string(inputs[i]["entries"].get<Long64_t>()) + " entries) the friend was produced from");
+        }
+        total_entries += entries;
+    }
+    if (tree->GetEntries() != total_entries) {
+        throw runtime_error("[SKNanoLoader::AddFriend] " + string(path) + " has " + to_string(tree->GetEntries()) + " entries, the inputs have " + to_string(total_entries));
+    }
+    const int ncolumns = tree->GetNbranches();
+    for (const auto *branch: *tree->GetListOfBranches()) FriendColumns.push_back(branch->GetName());
+    file->Close();
+    fChain->AddFriend(treename, path);
+    cout << "[SKNanoLoader::AddFriend] Attached " << treename << " from " << path << " with " << ncolumns << " columns" << endl;
+}
+
+void SKNanoLoader::LoadEntry(long entry) {
+    if (entry == fLoadedEntry) return;
+    if (fChain->GetEntry(entry) < 0) {
+        cerr << "[SKNanoLoader::LoadEntry] Error reading event " << entry << endl;
+        exit(1);
+    }
+    fLoadedEntry = entry;
+    SyncRunIICounts();
+    beginEvent();
+}
+
 void SKNanoLoader::Loop() {
+    if (UseDataFrame) {
+        auto startTime = std::chrono::steady_clock::now();
+        cout << "[SKNanoLoader::Loop] RDataFrame Event Loop Started with " << (ROOT::IsImplicitMTEnabled() ? ROOT::GetThreadPoolSize() : 1) << " threads" << endl;
+        runDataFrame();
+        std::chrono::duration<double> elapsedTime = std::chrono::steady_clock::now() - startTime;
+        cout << "[SKNanoLoader::Loop] RDataFrame Event Loop Finished in " << std::fixed << std::setprecision(2) << elapsedTime.count() << "s" << endl;
+        return;
+    }
     long nentries = fChain->GetEntries();
     if (MaxEvent > 0) nentries = std::min(nentries, MaxEvent);
     auto startTime = std::chrono::steady_clock::now();
     cout << "[SKNanoLoader::Loop] Event Loop Started" << endl;
+    if (BatchSize > 0) cout << "[SKNanoLoader::Loop] Batch mode with " << BatchSize << " events per batch" << endl;
+    long nbatch = 0;
 
     for (long jentry = 0; jentry < nentries; jentry++) {
         if (jentry < NSkipEvent) continue;
@@ -50,26 +149,23 @@ void SKNanoLoader::Loop() {
             exit(1);
         }
 
-        // make sure Run2 and Run3 variables are in sync
-        if (Run == 2) {
-            nLHEPart = static_cast<Int_t>(nLHEPart_RunII);
-            nGenPart = static_cast<Int_t>(nGenPart_RunII);
-            nGenJet = static_cast<Int_t>(nGenJet_RunII);
-            nGenJetAK8 = static_cast<Int_t>(nGenJetAK8_RunII);
-            nGenIsolatedPhoton = static_cast<Int_t>(nGenIsolatedPhoton_RunII);
-            nGenDressedLepton = static_cast<Int_t>(nGenDressedLepton_RunII);
-            nGenVisTau = static_cast<Int_t>(nGenVisTau_RunII);
-            nMuon = static_cast<Int_t>(nMuon_RunII);
-            nElectron = static_cast<Int_t>(nElectron_RunII);
-            nTau = static_cast<Int_t>(nTau_RunII);
-            nPhoton = static_cast<Int_t>(nPhoton_RunII);
-            nJet = static_cast<Int_t>(nJet_RunII);
-            nFatJet = static_cast<Int_t>(nFatJet_RunII);
-            nTrigObj = static_cast<Int_t>(nTrigObj_RunII);
+        SyncRunIICounts();
+        beginEvent();
+        if (BatchSize > 0) {
+            collectBatchEntry();
+            if (++nbatch == BatchSize) {
+                executeBatch();
+                clearBatch();
+                nbatch = 0;
+            }
+            continue;
         }
-        
         executeEvent();
     }
+    if (nbatch > 0) {
+        executeBatch();
+        clearBatch();
+    }
     cout << "[SKNanoLoader::Loop] Event Loop Finished"<< endl;
 }
 
@@ -1198,4 +1294,36 @@ void SKNanoLoader::Init() {
         }
     }
     else cerr << "[SKNanoLoader::Init] Cannot open " << json_path << endl;
+
+    // precomputed corrections from a friend tree, see AddFriend
+    if (HasFriendColumn("Jet_JESSF") && HasFriendColumn("Jet_smearFactor")) {
+        SafeSetBranchAddress("Jet_JESSF", &Friend_Jet_JESSF);
+        SafeSetBranchAddress("Jet_smearFactor", &Friend_Jet_smearFactor);
+        FriendJetCorrections = true;
+        cout << "[SKNanoLoader::Init] Jet corrections are read from the friend tree" << endl;
+    }
+    if (HasFriendColumn("Muon_roccor") && HasFriendColumn("Muon_roccorErr")) {
+        SafeSetBranchAddress("Muon_roccor", &Friend_Muon_roccor);
+        SafeSetBranchAddress("Muon_roccorErr", &Friend_Muon_roccorErr);
+        FriendMuonCorrections = true;
+        cout << "[SKNanoLoader::Init] Muon corrections are read from the friend tree" << endl;
+    }
+
+    if (UseDataFrame) {
+        if (NThreads != 1 && isDataFrameRanged()) throw runtime_error("[SKNanoLoader::Init] MaxEvent and NSkipEvent cannot be used with implicit multithreading, set NThreads = 1");
+        if (NThreads != 1) ROOT::EnableImplicitMT(NThreads > 0 ? NThreads : 0);
+        // The data frame reads a copy of fChain with the same files and friends. It cannot read fChain itself:
+        // the branches disabled above would be read as zeros and its readers would share the branch addresses of LoadEntry.
+        fDataFrameChain = make_unique<TChain>(fChain->GetName());
+        for (const auto *element: *fChain->GetListOfFiles()) fDataFrameChain->Add(element->GetTitle());
+        if (fChain->GetListOfFriends()) {
+            for (const auto *obj: *fChain->GetListOfFriends()) {
+                const TFriendElement *element = static_cast<const TFriendElement*>(obj);
+                fDataFrameChain->AddFriend(element->GetTreeName(), element->GetTitle());
+            }
+        }
+        fDataFrame = make_unique<ROOT::RDataFrame>(*fDataFrameChain);
+        cout << "[SKNanoLoader::Init] RDataFrame backend over " << fDataFrameChain->GetListOfFiles()->GetEntries() << " files and "
+             << (fChain->GetListOfFriends() ? fChain->GetListOfFriends()->GetEntries() : 0) << " friends" << endl;
+    }
 }
@@ -0,0 +1,28 @@
+#include "Skim_DiLepton.h"
+
+Skim_DiLepton::Skim_DiLepton() {}
+Skim_DiLepton::~Skim_DiLepton() {}
+
+void Skim_DiLepton::initializeAnalyzer() {
+    // one skimmed tree per input file next to the job output, e.g. tree_3.root -> tree_3_0.root, tree_3_1.root, ...
+    // the job output itself is removed by WriteHist since nothing else is written to it
+    SetSkimOutput(GetOutfile()->GetName());
+}
+
+void Skim_DiLepton::executeEvent() {
+    // the raw NanoAOD branches are enough for a loose preselection, no corrections are needed
+    int nLeptons = 0;
+    for (int i = 0; i < nMuon; i++) {
+        if (!Muon_looseId[i]) continue;
+        if (Muon_pt[i] < 10. || fabs(Muon_eta[i]) > 2.4) continue;
+        nLeptons++;
+    }
+    for (int i = 0; i < nElectron; i++) {
+        const int cutBased = (Run == 2) ? Electron_cutBased_RunII[i] : static_cast<int>(Electron_cutBased[i]);
+        if (cutBased < 1) continue; // veto ID
+        if (Electron_pt[i] < 10. || fabs(Electron_eta[i]) > 2.5) continue;
+        nLeptons++;
+    }
+    if (nLeptons < 2) return;
+    SelectSkimEntry();
+}
@@ -105,6 +105,10 @@ public:
     void SetJetIdx(short jetIdx) { j_jetIdx = jetIdx; }
     inline short JetIdx() const { return j_jetIdx; }
 
+    // index in the NanoAOD Electron collection, keys the random streams of the smearing
+    void SetOriginalIndex(int idx) { j_originalIndex = idx; }
+    inline int OriginalIndex() const { return j_originalIndex; }
+
     void SetRho(float rho) { j_rho = rho; }
     inline float rho() const { return j_rho; }
 
@@ -180,7 +184,8 @@ private:
     short j_genPartIdx;
     unsigned char j_genPartFlav;
     short j_jetIdx;
-    ClassDef(Electron, 1);
+    int j_originalIndex;
+    ClassDef(Electron, 2);
 };
 
 #endif
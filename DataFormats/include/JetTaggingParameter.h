@@ -2,6 +2,7 @@
 #define JetTaggingParameter_h
 
 #include <iostream>
+#include <vector>
 #include <TString.h>
 
 using namespace std;
@@ -73,6 +74,17 @@ namespace JetTagging
         }
     };
 
+    // |eta| and pt binning of the tagging efficiency maps measured by MeasureJetTaggingEff
+    // MyCorrection tabulates the efficiencies on the same binning for the fixedWP SF engine
+    inline const vector<float> &GetTaggingEffEtaBins() {
+        static const vector<float> bins = {0.0, 0.8, 1.6, 2., 2.5};
+        return bins;
+    };
+    inline const vector<float> &GetTaggingEffPtBins() {
+        static const vector<float> bins = {20., 25., 30., 50., 70., 100., 140., 200., 300., 600., 1000.}; // PT bins used in POG SF measurements
+        return bins;
+    };
+
     inline TString GetTaggerCorrectionLibStr(JetFlavTagger tagger)
     {
         switch (tagger)
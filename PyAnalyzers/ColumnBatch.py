@@ -0,0 +1,84 @@
+## Columnar batch mode for python analyzers
+## With BatchSize > 0, AnalyzerCore collects the columns declared with SetBatchColumns / SetBatchObjects
+## for BatchSize events and calls executeBatch once per batch instead of executeEvent per event.
+## readBatch turns the collected C++ buffers into numpy arrays, jagged columns become a Jagged.
+## Usage in a python analyzer:
+##   self.BatchSize = 10000
+##   self.SetBatchColumns(RVec(TString)(["genWeight", "Pileup_nTrueInt", "Muon_tightId"]))
+##   self.SetBatchObjects("Muon", RVec(TString)(["POGTight", "POGLoose"]))
+##   def executeBatch(self):
+##       batch = readBatch(self)
+##       muons = batch["Muon"]                   # dict of Jagged: pt, eta, phi, mass, charge, idbits
+##       tight = muons["idbits"].values.astype(np.int64) & 1 > 0
+##       leading = muons["pt"][tight].leading(0)
+##       fillHist(self, "muons/1/pt", leading, batch["genWeight"], 300, 0., 300.)
+import numpy as np
+
+class Jagged:
+    # values of all objects in the batch, the objects of event i are values[offsets[i]:offsets[i+1]]
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def eventIndex(self):
+        # event index of every object, to broadcast event-level columns to objects
+        return np.repeat(np.arange(len(self.offsets)-1), self.counts)
+
+    @property
+    def localIndex(self):
+        # index of every object inside its event
+        return np.arange(len(self.values)) - np.repeat(self.offsets[:-1], self.counts)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, mask):
+        # object-level boolean mask, keeps the event structure
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != self.values.shape:
+            raise ValueError(f"[Jagged::__getitem__] mask has shape {mask.shape}, expected {self.values.shape}")
+        kept = np.bincount(self.eventIndex[mask], minlength=len(self))
+        return Jagged(self.values[mask], np.concatenate(([0], np.cumsum(kept))))
+
+    def sum(self):
+        return np.bincount(self.eventIndex, weights=self.values, minlength=len(self))
+
+    def any(self):
+        return np.bincount(self.eventIndex, weights=(self.values != 0), minlength=len(self)) > 0
+
+    def leading(self, n, fill=np.nan):
+        # value of the n-th object of every event, fill when the event has fewer objects
+        out = np.full(len(self), fill, dtype=np.float64)
+        has = self.counts > n
+        out[has] = self.values[self.offsets[:-1][has] + n]
+        return out
+
+def readBatch(analyzer):
+    # copies the collected columns, the C++ buffers are reused for the next batch
+    nevents = analyzer.GetBatchNEvents()
+    batch = {"nEvents": nevents}
+    for column in map(str, analyzer.GetBatchColumnNames()):
+        values = np.array(analyzer.GetBatchValues(column))
+        offsets = np.array(analyzer.GetBatchOffsets(column), dtype=np.int64)
+        array = Jagged(values, offsets) if len(offsets) else values
+        collection, dot, field = column.partition(".")
+        if dot:
+            batch.setdefault(collection, {})[field] = array
+        else:
+            batch[column] = array
+    return batch
+
+def fillHist(analyzer, histname, values, weights, nbins, xmin, xmax):
+    # fill a whole array into a booked histogram, NaN entries (e.g. from Jagged.leading) are skipped
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), values.shape)
+    keep = ~np.isnan(values)
+    values = np.ascontiguousarray(values[keep])
+    weights = np.ascontiguousarray(weights[keep])
+    handle = analyzer.BookHist(histname, nbins, xmin, xmax)
+    analyzer.FillHistN(handle, len(values), values, weights)
@@ -4,6 +4,8 @@ from ROOT import DiLeptonBase
 from ROOT import MyCorrection; myVar = MyCorrection.variation
 from ROOT import JetTagging
 from ROOT import Event, Muon, Electron, Jet
+from HistBuffer import HistBuffer
+from ObjectPipeline import ObjectPipeline
 
 class DiLepton(DiLeptonBase):
     def __init__(self):
@@ -44,6 +46,12 @@ class DiLepton(DiLeptonBase):
                 #self.weightVariations.append(("PileupJetIDSFUp", "PileupJetIDSFDown"))
         self.systematics = self.weightVariations + self.scaleVariations
 
+        # histograms are filled in bulk, see HistBuffer.py
+        self.histBuffer = HistBuffer(self)
+
+        self.objectPipeline = ObjectPipeline()
+        self.defineObjectPipeline()
+
     def executeEvent(self):
         ev = self.GetEvent()
         rawJets = self.GetAllJets()
@@ -51,98 +59,100 @@ class DiLepton(DiLeptonBase):
         
         rawMuons = self.GetAllMuons()
         rawElectrons = self.GetAllElectrons()
-        METv = ev.GetMETVector(Event.MET_Type.PUPPI)
         genParts = self.GetAllGens() if not self.IsDATA else None
         genJets = self.GetAllGenJets() if not self.IsDATA else None
+        self.objectPipeline.reset(ev=ev, rawMuons=rawMuons, rawElectrons=rawElectrons, rawJets=rawJets, genJets=genJets)
 
         def processEvent(syst, apply_weight_variation=False):
-            recoObjects = self.defineObjects(ev, rawMuons, rawElectrons, rawJets, genJets, METv, syst)
+            recoObjects = self.defineObjects(syst)
             channel = self.selectEvent(ev, recoObjects)
             if not channel: return
     
             if apply_weight_variation:
                 assert syst == "Central", "Only Central weight variation is allowed"
-                weights = self.getWeights(channel, ev, recoObjects, genParts)
-                self.fillObjects(channel, recoObjects, weights)
+                # all weight variations share the objects, fill them in one pass
+                weights = [self.getWeights(channel, ev, recoObjects, genParts)]
+                systs = ["Central"]
                 for systSet in self.weightVariations[1:]:
-                    syst_up, syst_down = systSet
-                    weights_up = self.getWeights(channel, ev, recoObjects, genParts, syst_up)
-                    weights_down = self.getWeights(channel, ev, recoObjects, genParts, syst_down)
-                    self.fillObjects(channel, recoObjects, weights_up, syst_up)
-                    self.fillObjects(channel, recoObjects, weights_down, syst_down)
+                    for syst_var in systSet:
+                        weights.append(self.getWeights(channel, ev, recoObjects, genParts, syst_var))
+                        systs.append(syst_var)
+                self.fillObjects(channel, recoObjects, weights, tuple(systs))
             else:
                 weights = self.getWeights(channel, ev, recoObjects, genParts, syst)
-                self.fillObjects(channel, recoObjects, weights, syst)
+                self.fillObjects(channel, recoObjects, [weights], (syst,))
         
         processEvent("Central", apply_weight_variation=True)
         for scaleSet in self.scaleVariations:
             scale_up, scale_down = scaleSet
             processEvent(scale_up, apply_weight_variation=False)
             processEvent(scale_down, apply_weight_variation=False)
-    
-    
-    def defineObjects(self, ev, rawMuons, rawElectrons, rawJets, genJets, METv, syst="Central"):
-        # Create copies of the raw objects
-        allMuons = RVec(Muon)(rawMuons)
-        allElectrons = RVec(Electron)(rawElectrons)
-        allJets = RVec(Jet)(rawJets)
-        self.myCorr.METXYCorrection(METv, ev.run(), ev.nPV(), MyCorrection.XYCorrection_MetType.Type1PuppiMET)
+        self.histBuffer.endEvent()
 
-        # Apply scale variations
-        if syst == "ElectronEnUp":
-            allElectrons = self.ScaleElectrons(ev, allElectrons, "up")
-        elif syst == "ElectronEnDown":
-            allElectrons = self.ScaleElectrons(ev, allElectrons, "down")
-        elif syst == "ElectronResUp":
-            allElectrons = self.SmearElectrons(allElectrons, "up")
-        elif syst == "ElectronResDown":
-            allElectrons = self.SmearElectrons(allElectrons, "down")
-        elif syst == "MuonEnUp":
-            allMuons = self.ScaleMuons(allMuons, "up")
-        elif syst == "MuonEnDown":
-            allMuons = self.ScaleMuons(allMuons, "down")
-        elif syst == "JetEnUp":
-            allJets = self.ScaleJets(allJets, "up")
-        elif syst == "JetEnDown":
-            allJets = self.ScaleJets(allJets, "down")
-        elif syst == "JetResUp":
-            allJets = self.SmearJets(allJets, genJets, "up")
-        elif syst == "JetResDown":
-            allJets = self.SmearJets(allJets, genJets, "down")
-        else:
-            assert self.checkValidSyst(syst), f"Invalid systematics: {syst}"
+    def WriteHist(self):
+        self.histBuffer.flush()
+        super().WriteHist()
+    
+    def defineObjectPipeline(self):
+        # each object only depends on the variations of its own object type, see ObjectPipeline.py
+        pipeline = self.objectPipeline
+        scaleVariation = lambda syst: "up" if syst.endswith("Up") else "down"
 
-        # sort objects in pt order
-        allMuons = Reverse(Sort(allMuons))
-        allElectrons = Reverse(Sort(allElectrons))
-        allJets = Reverse(Sort(allJets))
+        def allMuons(syst, rawMuons):
+            if syst.startswith("MuonEn"): rawMuons = self.ScaleMuons(rawMuons, scaleVariation(syst))
+            return Reverse(Sort(rawMuons))
+        def allElectrons(syst, ev, rawElectrons):
+            if syst.startswith("ElectronEn"): rawElectrons = self.ScaleElectrons(ev, rawElectrons, scaleVariation(syst))
+            elif syst.startswith("ElectronRes"): rawElectrons = self.SmearElectrons(rawElectrons, scaleVariation(syst))
+            return Reverse(Sort(rawElectrons))
+        def allJets(syst, rawJets, genJets):
+            if syst.startswith("JetEn"): rawJets = self.ScaleJets(rawJets, scaleVariation(syst))
+            elif syst.startswith("JetRes"): rawJets = self.SmearJets(rawJets, genJets, scaleVariation(syst))
+            return Reverse(Sort(rawJets))
+        def METv(syst, ev):
+            METv = ev.GetMETVector(Event.MET_Type.PUPPI)
+            self.myCorr.METXYCorrection(METv, ev.run(), ev.nPV(), MyCorrection.XYCorrection_MetType.Type1PuppiMET)
+            return METv
+        pipeline.define("allMuons", ["rawMuons"], allMuons, tags=["MuonEn"])
+        pipeline.define("allElectrons", ["ev", "rawElectrons"], allElectrons, tags=["ElectronEn", "ElectronRes"])
+        pipeline.define("allJets", ["rawJets", "genJets"], allJets, tags=["JetEn", "JetRes"])
+        pipeline.define("METv", ["ev"], METv)
 
-        looseMuons = self.SelectMuons(allMuons, self.MuonIDs.GetID("loose"), 10., 2.4)
-        tightMuons = self.SelectMuons(looseMuons, self.MuonIDs.GetID("tight"), 10., 2.4)
-        looseElectrons = self.SelectElectrons(allElectrons, self.ElectronIDs.GetID("loose"), 15., 2.5)
-        tightElectrons = self.SelectElectrons(looseElectrons, self.ElectronIDs.GetID("tight"), 15., 2.5)
+        pipeline.define("looseMuons", ["allMuons"],
+                        lambda syst, allMuons: self.SelectMuons(allMuons, self.MuonIDs.GetID("loose"), 10., 2.4))
+        pipeline.define("tightMuons", ["looseMuons"],
+                        lambda syst, looseMuons: self.SelectMuons(looseMuons, self.MuonIDs.GetID("tight"), 10., 2.4))
+        pipeline.define("looseElectrons", ["allElectrons"],
+                        lambda syst, allElectrons: self.SelectElectrons(allElectrons, self.ElectronIDs.GetID("loose"), 15., 2.5))
+        pipeline.define("tightElectrons", ["looseElectrons"],
+                        lambda syst, looseElectrons: self.SelectElectrons(looseElectrons, self.ElectronIDs.GetID("tight"), 15., 2.5))
         max_jeteta = 2.4 if self.DataEra.Contains("2016") else 2.5
-        tightJets = self.SelectJets(allJets, "tight", 20., max_jeteta)
-        tightJets_vetoLep = self.JetsVetoLeptonInside(tightJets, looseElectrons, looseMuons, 0.4)
-        if self.Run == 2:
-            tightJets_vetoLep = self.SelectJets(tightJets_vetoLep, "loosePuId", 20., max_jeteta)
-        bjets = RVec(Jet)()
-        wp = self.myCorr.GetBTaggingWP(JetTagging.JetFlavTagger.DeepJet, JetTagging.JetFlavTaggerWP.Medium)
-        for jet in tightJets_vetoLep:
-            btagScore = jet.GetBTaggerResult(JetTagging.JetFlavTagger.DeepJet)
-            if btagScore > wp: bjets.emplace_back(jet)
+        pipeline.define("tightJets", ["allJets"],
+                        lambda syst, allJets: self.SelectJets(allJets, "tight", 20., max_jeteta))
 
-        return {
-            "looseMuons": looseMuons,
-            "tightMuons": tightMuons,
-            "looseElectrons": looseElectrons,
-            "tightElectrons": tightElectrons,
-            "tightJets": tightJets,
-            "tightJets_vetoLep": tightJets_vetoLep,
-            "bjets": bjets,
-            "genJets": genJets,
-            "METv": METv
-        }
+        def tightJets_vetoLep(syst, tightJets, looseElectrons, looseMuons):
+            tightJets_vetoLep = self.JetsVetoLeptonInside(tightJets, looseElectrons, looseMuons, 0.4)
+            if self.Run == 2:
+                tightJets_vetoLep = self.SelectJets(tightJets_vetoLep, "loosePuId", 20., max_jeteta)
+            return tightJets_vetoLep
+        def bjets(syst, tightJets_vetoLep):
+            bjets = RVec(Jet)()
+            wp = self.myCorr.GetBTaggingWP(JetTagging.JetFlavTagger.DeepJet, JetTagging.JetFlavTaggerWP.Medium)
+            for jet in tightJets_vetoLep:
+                btagScore = jet.GetBTaggerResult(JetTagging.JetFlavTagger.DeepJet)
+                if btagScore > wp: bjets.emplace_back(jet)
+            return bjets
+        pipeline.define("tightJets_vetoLep", ["tightJets", "looseElectrons", "looseMuons"], tightJets_vetoLep)
+        pipeline.define("bjets", ["tightJets_vetoLep"], bjets)
+
+    def defineObjects(self, syst="Central"):
+        assert self.checkValidSyst(syst), f"Invalid systematics: {syst}"
+        # only the objects downstream of the varied object type are recomputed
+        tags = [tag for tag in ("ElectronEn", "ElectronRes", "MuonEn", "JetEn", "JetRes") if syst.startswith(tag)]
+        pipeline = self.objectPipeline
+        pipeline.setVariation(syst, tags)
+        return {name: pipeline.get(name) for name in ("looseMuons", "tightMuons", "looseElectrons", "tightElectrons",
+                                                       "tightJets", "tightJets_vetoLep", "bjets", "genJets", "METv")}
     
     def selectEvent(self, ev, recoObjects):
         looseMuons = recoObjects["looseMuons"]
@@ -297,73 +307,75 @@ class DiLepton(DiLeptonBase):
             "btagSF": btagSF
         }
     
-    def fillObjects(self, channel, recoObjects, weights, syst="Central"):
+    def fillObjects(self, channel, recoObjects, weights, systs=("Central",)):
+        # weights holds one weight dictionary per systematic in systs
         muons = recoObjects["tightMuons"]
         electrons = recoObjects["tightElectrons"]
         jets = recoObjects["tightJets_vetoLep"]
         bjets = recoObjects["bjets"]
         METv = recoObjects["METv"]
         genJets = recoObjects["genJets"]
-        weight = 1.
+        weightValues = [1.]*len(systs)
 
         if not self.IsDATA:
-            genWeight = weights["genWeight"]
-            prefireWeight = weights["prefireWeight"]
-            pileupWeight = weights["pileupWeight"]
-            topPtWeight = weights["topPtWeight"]
-            muonRecoSF = weights["muonRecoSF"]
-            muonIDSF = weights["muonIDSF"]
-            eleRecoSF = weights["eleRecoSF"]
-            eleIDSF = weights["eleIDSF"]
-            trigSF = weights["trigSF"]
-            pileupIDSF = weights["pileupIDSF"]
-            btagSF = weights["btagSF"]
-            weight = genWeight*prefireWeight*pileupWeight*topPtWeight*muonRecoSF*muonIDSF*eleRecoSF*eleIDSF*trigSF*pileupIDSF*btagSF
+            for i, (syst, w) in enumerate(zip(systs, weights)):
+                genWeight = w["genWeight"]
+                prefireWeight = w["prefireWeight"]
+                pileupWeight = w["pileupWeight"]
+                topPtWeight = w["topPtWeight"]
+                muonRecoSF = w["muonRecoSF"]
+                muonIDSF = w["muonIDSF"]
+                eleRecoSF = w["eleRecoSF"]
+                eleIDSF = w["eleIDSF"]
+                trigSF = w["trigSF"]
+                pileupIDSF = w["pileupIDSF"]
+                btagSF = w["btagSF"]
+                weightValues[i] = genWeight*prefireWeight*pileupWeight*topPtWeight*muonRecoSF*muonIDSF*eleRecoSF*eleIDSF*trigSF*pileupIDSF*btagSF
 
-            self.FillHist(f"{channel}/{syst}/weights/genWeight", genWeight, 1., 200, -10000, 10000.)
-            self.FillHist(f"{channel}/{syst}/weights/prefireWeight", prefireWeight, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/pileupWeight", pileupWeight, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/topPtWeight", topPtWeight, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/muonRecoSF", muonRecoSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/muonIDSF", muonIDSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/eleRecoSF", eleRecoSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/eleIDSF", eleIDSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/trigSF", trigSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/pileupIDSF", pileupIDSF, 1., 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/weights/btagSF", btagSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "genWeight"), genWeight, 1., 200, -10000, 10000.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "prefireWeight"), prefireWeight, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "pileupWeight"), pileupWeight, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "topPtWeight"), topPtWeight, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "muonRecoSF"), muonRecoSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "muonIDSF"), muonIDSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "eleRecoSF"), eleRecoSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "eleIDSF"), eleIDSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "trigSF"), trigSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "pileupIDSF"), pileupIDSF, 1., 100, -5., 5.)
+                self.histBuffer.fillSyst((channel,), systs, i, ("weights", "btagSF"), btagSF, 1., 100, -5., 5.)
         
         for idx, mu in enumerate(muons, start=1):
-            self.FillHist(f"{channel}/{syst}/muons/{idx}/pt", mu.Pt(), weight, 300, 0., 300.)
-            self.FillHist(f"{channel}/{syst}/muons/{idx}/eta", mu.Eta(), weight, 48, -2.4, 2.4)
-            self.FillHist(f"{channel}/{syst}/muons/{idx}/phi", mu.Phi(), weight, 64, -3.2, 3.2)
-            self.FillHist(f"{channel}/{syst}/muons/{idx}/mass", mu.M(), weight, 10, 0., 1.)
+            self.histBuffer.fillWeights((channel,), systs, ("muons", idx, "pt"), mu.Pt(), weightValues, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("muons", idx, "eta"), mu.Eta(), weightValues, 48, -2.4, 2.4)
+            self.histBuffer.fillWeights((channel,), systs, ("muons", idx, "phi"), mu.Phi(), weightValues, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("muons", idx, "mass"), mu.M(), weightValues, 10, 0., 1.)
         for idx, ele in enumerate(electrons, start=1):
-            self.FillHist(f"{channel}/{syst}/electrons/{idx}/pt", ele.Pt(), weight, 300, 0., 300.)
-            self.FillHist(f"{channel}/{syst}/electrons/{idx}/eta", ele.Eta(), weight, 50, -2.5, 2.5)
-            self.FillHist(f"{channel}/{syst}/electrons/{idx}/phi", ele.Phi(), weight, 64, -3.2, 3.2)
-            self.FillHist(f"{channel}/{syst}/electrons/{idx}/mass", ele.M(), weight, 100, 0., 1.)
+            self.histBuffer.fillWeights((channel,), systs, ("electrons", idx, "pt"), ele.Pt(), weightValues, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("electrons", idx, "eta"), ele.Eta(), weightValues, 50, -2.5, 2.5)
+            self.histBuffer.fillWeights((channel,), systs, ("electrons", idx, "phi"), ele.Phi(), weightValues, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("electrons", idx, "mass"), ele.M(), weightValues, 100, 0., 1.)
 
         for idx, jet in enumerate(jets, start=1):
-            self.FillHist(f"{channel}/{syst}/jets/{idx}/pt", jet.Pt(), weight, 300, 0., 300.)
-            self.FillHist(f"{channel}/{syst}/jets/{idx}/eta", jet.Eta(), weight, 48, -2.4, 2.4)
-            self.FillHist(f"{channel}/{syst}/jets/{idx}/phi", jet.Phi(), weight, 64, -3.2, 3.2)
-            self.FillHist(f"{channel}/{syst}/jets/{idx}/mass", jet.M(), weight, 100, 0., 100.)
+            self.histBuffer.fillWeights((channel,), systs, ("jets", idx, "pt"), jet.Pt(), weightValues, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("jets", idx, "eta"), jet.Eta(), weightValues, 48, -2.4, 2.4)
+            self.histBuffer.fillWeights((channel,), systs, ("jets", idx, "phi"), jet.Phi(), weightValues, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("jets", idx, "mass"), jet.M(), weightValues, 100, 0., 100.)
         for idx, bjet in enumerate(bjets, start=1):
-            self.FillHist(f"{channel}/{syst}/bjets/{idx}/pt", bjet.Pt(), weight, 300, 0., 300.)
-            self.FillHist(f"{channel}/{syst}/bjets/{idx}/eta", bjet.Eta(), weight, 48, -2.4, 2.4)
-            self.FillHist(f"{channel}/{syst}/bjets/{idx}/phi", bjet.Phi(), weight, 64, -3.2, 3.2)
-            self.FillHist(f"{channel}/{syst}/bjets/{idx}/mass", bjet.M(), weight, 100, 0., 100.)
-        self.FillHist(f"{channel}/{syst}/jets/size", jets.size(), weight, 20, 0., 20.)
-        self.FillHist(f"{channel}/{syst}/bjets/size", bjets.size(), weight, 15, 0., 15.)
-        self.FillHist(f"{channel}/{syst}/METv/pt", METv.Pt(), weight, 300, 0., 300.)
-        self.FillHist(f"{channel}/{syst}/METv/phi", METv.Phi(), weight, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("bjets", idx, "pt"), bjet.Pt(), weightValues, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("bjets", idx, "eta"), bjet.Eta(), weightValues, 48, -2.4, 2.4)
+            self.histBuffer.fillWeights((channel,), systs, ("bjets", idx, "phi"), bjet.Phi(), weightValues, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("bjets", idx, "mass"), bjet.M(), weightValues, 100, 0., 100.)
+        self.histBuffer.fillWeights((channel,), systs, ("jets", "size"), jets.size(), weightValues, 20, 0., 20.)
+        self.histBuffer.fillWeights((channel,), systs, ("bjets", "size"), bjets.size(), weightValues, 15, 0., 15.)
+        self.histBuffer.fillWeights((channel,), systs, ("METv", "pt"), METv.Pt(), weightValues, 300, 0., 300.)
+        self.histBuffer.fillWeights((channel,), systs, ("METv", "phi"), METv.Phi(), weightValues, 64, -3.2, 3.2)
         
         if "DiMu" in channel:
             pair = muons.at(0) + muons.at(1)
-            self.FillHist(f"{channel}/{syst}/pair/pt", pair.Pt(), weight, 300, 0., 300.)
-            self.FillHist(f"{channel}/{syst}/pair/eta", pair.Eta(), weight, 100, -5., 5.)
-            self.FillHist(f"{channel}/{syst}/pair/phi", pair.Phi(), weight, 64, -3.2, 3.2)
-            self.FillHist(f"{channel}/{syst}/pair/mass", pair.M(), weight, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("pair", "pt"), pair.Pt(), weightValues, 300, 0., 300.)
+            self.histBuffer.fillWeights((channel,), systs, ("pair", "eta"), pair.Eta(), weightValues, 100, -5., 5.)
+            self.histBuffer.fillWeights((channel,), systs, ("pair", "phi"), pair.Phi(), weightValues, 64, -3.2, 3.2)
+            self.histBuffer.fillWeights((channel,), systs, ("pair", "mass"), pair.M(), weightValues, 300, 0., 300.)
 
 if __name__ == "__main__":
     module = DiLepton()
@@ -0,0 +1,44 @@
+## Dimuon validation on the RDataFrame backend
+## Run with SKNano.py --python --rdf, the histograms are booked on the data frame in initializePyAnalyzer
+## and filled by AnalyzerCore::runDataFrame in a single pass instead of executeEvent.
+## With --ncpu > 1 only the NanoAOD columns are used, which is thread-safe.
+## With --ncpu 1 the corrected muons of GetAllMuons (Rochester, or the friend tree of --friend) are added through DefineAllMuons.
+import ROOT
+from ROOT import AnalyzerCore
+
+class DiMuonDataFrame(AnalyzerCore):
+    def __init__(self):
+        super().__init__()
+
+    def initializePyAnalyzer(self):
+        self.initializeAnalyzer()
+        if not self.UseDataFrame:
+            raise RuntimeError("[DiMuonDataFrame::initializePyAnalyzer] DiMuonDataFrame runs on the RDataFrame backend only, use --rdf")
+
+        df = self.GetDataFrame()
+        if self.IsDATA:
+            df = df.Define("weight", "1.f")
+        else:
+            df = df.Define("weight", f"(genWeight > 0 ? 1.f : (genWeight < 0 ? -1.f : 0.f)) * {self.xsec / self.sumSign}f")
+        df = df.Define("goodMuon", "Muon_tightId && Muon_pt > 10.f && abs(Muon_eta) < 2.4f && Muon_pfRelIso04_all < 0.15f")
+        df = df.Filter("Sum(goodMuon) == 2 && Sum(Muon_charge[goodMuon]) == 0", "OS dimuon")
+        df = df.Define("mll", "ROOT::VecOps::InvariantMass(Muon_pt[goodMuon], Muon_eta[goodMuon], Muon_phi[goodMuon], Muon_mass[goodMuon])")
+        df = df.Define("pt1", "Muon_pt[goodMuon][0]").Define("pt2", "Muon_pt[goodMuon][1]")
+        df = df.Define("eta1", "Muon_eta[goodMuon][0]").Define("eta2", "Muon_eta[goodMuon][1]")
+
+        node = ROOT.RDF.AsRNode(df)
+        self.FillHist(node, "DiMu/Raw/mll", "mll", "weight", 200, 50., 250.)
+        self.FillHist(node, "DiMu/Raw/pt1", "pt1", "weight", 300, 0., 300.)
+        self.FillHist(node, "DiMu/Raw/pt2", "pt2", "weight", 300, 0., 300.)
+        self.FillHist(node, "DiMu/Raw/eta1", "eta1", "weight", 48, -2.4, 2.4)
+        self.FillHist(node, "DiMu/Raw/eta2", "eta2", "weight", 48, -2.4, 2.4)
+        self.FillHist(node, "DiMu/Raw/pt1_pt2", "pt1", "pt2", "weight", 60, 0., 300., 60, 0., 300.)
+
+        # the imperative getters read the branch buffers of the current entry, so they need a single-threaded data frame
+        if ROOT.IsImplicitMTEnabled():
+            return
+        node = self.DefineAllMuons(node, "AllMuons")
+        node = self.DefineSelectedMuons(node, "TightMuons", "AllMuons", "POGTight", 10., 2.4)
+        node = ROOT.RDF.AsRNode(node.Filter("TightMuons.size() == 2 && TightMuons[0].Charge() + TightMuons[1].Charge() == 0", "OS corrected dimuon")
+                                    .Define("mll_corrected", "(TightMuons[0] + TightMuons[1]).M()"))
+        self.FillHist(node, "DiMu/Corrected/mll", "mll_corrected", "weight", 200, 50., 250.)
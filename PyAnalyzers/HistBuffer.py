@@ -0,0 +1,81 @@
+## Buffered histogram filling for python analyzers
+## Every self.FillHist(f"...", ...) call formats a string, crosses the cppyy boundary and does a map lookup.
+## HistBuffer keeps a python dict from a hashable key to a booked histogram handle,
+## collects (handle, value, weight) in python lists and hands them to AnalyzerCore
+## in one FillHistBuffered call every flushEvery events, where they are filled with TH1::FillN.
+## fillWeights is the multi-weight variant for weight-only systematics: one value, one weight per systematic,
+## with the handles of all systematics looked up once per key, fillSyst fills a single systematic of such a key.
+## The handles come from AnalyzerCore::GetSystSetHandles, so with the useSystAxis flag the systematics are filled
+## into the bins of one systematic axis histogram.
+import numpy as np
+from ROOT import TString
+from ROOT.VecOps import RVec
+
+class HistBuffer:
+    def __init__(self, analyzer, flushEvery=1000):
+        self.analyzer = analyzer
+        self.flushEvery = flushEvery
+        self.nEvents = 0
+        self.handles = {}
+        self.bufHandles = []
+        self.bufValues = []
+        self.bufWeights = []
+        # buffering is done here, do not flush the C++ side on its own
+        self.analyzer.SetHistFlushInterval(0)
+
+    def book(self, key, nbins, xmin, xmax):
+        handle = self.handles.get(key)
+        if handle is None:
+            histname = key if isinstance(key, str) else "/".join(str(k) for k in key)
+            handle = self.analyzer.BookHist(histname, nbins, xmin, xmax)
+            self.handles[key] = handle
+        return handle
+
+    def fill(self, key, value, weight, nbins, xmin, xmax):
+        handle = self.handles.get(key)
+        if handle is None:
+            handle = self.book(key, nbins, xmin, xmax)
+        self.bufHandles.append(handle)
+        self.bufValues.append(value)
+        self.bufWeights.append(weight)
+
+    def systHandles(self, prefix, systs, suffix, nbins, xmin, xmax):
+        # handles of prefix + (syst,) + suffix for all systs, systs has to be a tuple
+        key = (prefix, systs, suffix)
+        handles = self.handles.get(key)
+        if handles is None:
+            pattern = "/".join(str(k) for k in prefix + ("{syst}",) + suffix)
+            systset = self.analyzer.BookSystSet(RVec(TString)(list(systs)))
+            handles = list(self.analyzer.GetSystSetHandles(pattern, systset, nbins, xmin, xmax))
+            self.handles[key] = handles
+        return handles
+
+    def fillWeights(self, prefix, systs, suffix, value, weights, nbins, xmin, xmax):
+        # one value with one weight per systematic
+        handles = self.systHandles(prefix, systs, suffix, nbins, xmin, xmax)
+        self.bufHandles.extend(handles)
+        self.bufValues.extend([value]*len(handles))
+        self.bufWeights.extend(weights)
+
+    def fillSyst(self, prefix, systs, isyst, suffix, value, weight, nbins, xmin, xmax):
+        # single fill of the systematic systs[isyst]
+        self.bufHandles.append(self.systHandles(prefix, systs, suffix, nbins, xmin, xmax)[isyst])
+        self.bufValues.append(value)
+        self.bufWeights.append(weight)
+
+    def endEvent(self):
+        self.nEvents += 1
+        if self.nEvents % self.flushEvery == 0:
+            self.flush()
+
+    def flush(self):
+        n = len(self.bufHandles)
+        if n == 0: return
+        handles = np.asarray(self.bufHandles, dtype=np.int32)
+        values = np.asarray(self.bufValues, dtype=np.float64)
+        weights = np.asarray(self.bufWeights, dtype=np.float64)
+        self.analyzer.FillHistBuffered(n, handles, values, weights)
+        self.analyzer.FlushHistBuffer()
+        self.bufHandles.clear()
+        self.bufValues.clear()
+        self.bufWeights.clear()
@@ -0,0 +1,49 @@
+## Dependency-aware object definitions for python analyzers, the python counterpart of AnalyzerCore::DefineObject
+## Each object is defined once with the objects it is computed from and the variation tags it reacts to.
+## For a variation only the objects downstream of its tags are recomputed,
+## all the others are taken from the nominal pass of the same event.
+## A producer is called as producer(syst, *inputs), so it can only see the inputs it declares.
+class ObjectPipeline:
+    def __init__(self):
+        self.steps = {}
+        self.nominal = {}
+        self.varied = {}
+        self.tags = set()
+        self.variation = "Central"
+        # which objects a variation reaches only depends on the definitions, kept between events
+        self.isVaried = {}
+
+    def define(self, name, inputs, producer, tags=()):
+        self.steps[name] = (tuple(inputs), producer, frozenset(tags))
+        self.isVaried = {}
+
+    def reset(self, **objects):
+        # start a new event with its raw inputs
+        self.nominal = dict(objects)
+        self.varied = {}
+        self.setVariation("Central")
+
+    def setVariation(self, syst, tags=()):
+        self.variation = syst
+        self.tags = set(tags)
+        self.varied = {}
+
+    def variedObject(self, name):
+        if not self.tags:
+            return False
+        memo = self.isVaried.setdefault(self.variation, {})
+        if name not in memo:
+            step = self.steps.get(name)
+            memo[name] = step is not None and (not self.tags.isdisjoint(step[2]) or any(self.variedObject(i) for i in step[0]))
+        return memo[name]
+
+    def get(self, name):
+        varied = self.variedObject(name)
+        objects = self.varied if varied else self.nominal
+        if name in objects:
+            return objects[name]
+        if name not in self.steps:
+            raise KeyError(f"[ObjectPipeline::get] {name} is neither defined nor set for this event")
+        inputs, producer, _ = self.steps[name]
+        objects[name] = producer(self.variation if varied else "Central", *(self.get(i) for i in inputs))
+        return objects[name]
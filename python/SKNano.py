@@ -185,10 +185,40 @@ def setParser():
     parser.add_argument('--batchname', dest='BatchName', default="")
     parser.add_argument('--skimming_mode', action='store_true', default=False, help="Enable this option when anlyzer is skimmer.")
     parser.add_argument('--no_exec', action='store_true', default=False, help="only produce working area, not submitting to the condor pool")
+    parser.add_argument('--compression', dest='Compression', default="", help="Output compression as ALGORITHM:LEVEL, e.g. ZSTD:5, LZ4:4, LZMA:9. Default: ROOT default")
+    parser.add_argument('--merger', dest='Merger', default="hadd", choices=["stream", "hadd"], help="hadd: hadd after all jobs finished, stream: merge job outputs incrementally while the jobs run (mergeHists.py) with --ncpu workers")
+    parser.add_argument('--merge_fanin', dest='MergeFanin', default=8, type=int, help="Number of files merged at once by the streaming merger")
+    parser.add_argument('--merge_timeout', dest='MergeTimeout', default=172800, type=int, help="Seconds the streaming merger waits for all job outputs")
+    parser.add_argument('--quiet_writehist', action='store_true', default=False, help="Print only a summary line in WriteHist instead of one line per histogram")
+    parser.add_argument('--rdf', dest='RDataFrame', action='store_true', default=False, help="Run the analyzer on the RDataFrame backend with --ncpu threads, the analyzer has to book its histograms on GetDataFrame()")
+    parser.add_argument('--friend', dest='Friend', default="", help="Master directory of an earlier run that wrote friend trees with EnableFriendOutput, job i attaches <dir>/<era>/<sample>/output/friend_i.root. Use the same -n to get the same input files per job")
+    parser.add_argument('--profile-startup', dest='ProfileStartup', action='store_true', default=False, help="Python jobs print how long the interpreter, ROOT, dictionaries, Init, initializePyAnalyzer and loading all MyCorrection payloads took before the event loop")
     
     #Note: this option will change the behavior of the script. output directory will be changed to Your GV0, hadd will be disabled, and will create the info json of skimmed tree   
     return parser
 
+def getOutputOptions(argparse, python=False):
+    lines = []
+    if argparse.Compression:
+        try:
+            algorithm, level = argparse.Compression.split(":")
+            level = int(level)
+        except ValueError:
+            raise ValueError(f"Invalid compression setting {argparse.Compression}, expected ALGORITHM:LEVEL e.g. ZSTD:5")
+        if algorithm.upper() not in ["ZLIB", "LZMA", "LZ4", "ZSTD"]:
+            raise ValueError(f"Unknown compression algorithm {algorithm}, choose from ZLIB, LZMA, LZ4, ZSTD")
+        lines.append(f'module.SetOutfileCompression("{algorithm.upper()}", {level})')
+    if argparse.quiet_writehist:
+        lines.append("module.SetWriteHistSummaryOnly(True)" if python else "module.SetWriteHistSummaryOnly(true)")
+    if argparse.RDataFrame:
+        if argparse.ncpu != 1 and argparse.Reduction != 1:
+            raise ValueError("--reduction limits the events with MaxEvent, which needs --ncpu 1 with --rdf")
+        lines.append("module.UseDataFrame = True" if python else "module.UseDataFrame = true")
+        lines.append(f"module.NThreads = {argparse.ncpu}")
+    if python:
+        return "\n".join([f"    {line}" for line in lines])
+    return "\n".join([f"    {line};" for line in lines])
+
 def getMasterDirectoryName(timeStamp, Analyzer, Userflags):
     MasterDirectoryName = f"{timeStamp}_{Analyzer}"
     if len(Userflags) > 0:
@@ -267,6 +297,12 @@ def jobProducer(era, sample, argparse, masterJobDirectory, userflags, isample, t
 
     for i in tqdm(range(totalNumberOfJobs), position=1, leave=False, desc=f"Creating Jobs for {sample}, ({isample}/{totsamples})", smoothing=1.):
         output = out_base.replace('.root',f'_{i}.root')
+        # friend of the same job in the earlier run, AddFriend checks that it was made from the same input files
+        friend = ""
+        if argparse.Friend:
+            friend = os.path.join(os.path.abspath(argparse.Friend), os.path.relpath(working_dir, masterJobDirectory), "output", f"friend_{i}.root")
+            if not os.path.exists(friend):
+                raise FileNotFoundError(f"Friend file {friend} for job {i+1} not found")
         # Read the template file
         if argparse.python:
             template_path = os.path.join(SKNANO_HOME, "templates", "job.py")
@@ -303,13 +339,16 @@ def jobProducer(era, sample, argparse, masterJobDirectory, userflags, isample, t
             # Handle sample paths
             samplepaths_str = "\n".join([f'    module.AddFile("{path}")' for path in samplePaths[i]])
             job_content = job_content.replace("[SAMPLEPATHS]", samplepaths_str)
+            job_content = job_content.replace("[FRIEND]", f'    module.AddFriend("{friend}")' if friend else "")
 
             # Handle reduction/max events
             maxevent_str = f'    module.MaxEvent = max(1, int(module.fChain.GetEntries()/{int(reduction)}))'
             job_content = job_content.replace("[MAXEVENT]", maxevent_str)
 
-            # Set output path
+            # Set output path and options
             job_content = job_content.replace("[output]", output)
+            job_content = job_content.replace("[OUTPUTOPTIONS]", getOutputOptions(argparse, python=True))
+            job_content = job_content.replace("[PROFILESTARTUP]", str(argparse.ProfileStartup))
             job_filename = os.path.join(working_dir, f"job_{i+1}.py")
             with open(job_filename, 'w') as f:
                 f.write(job_content)
@@ -349,13 +388,15 @@ def jobProducer(era, sample, argparse, masterJobDirectory, userflags, isample, t
             # Handle sample paths
             samplepaths_str = "\n".join([f'\tmodule.AddFile("{path}");' for path in samplePaths[i]])
             job_content = job_content.replace("[SAMPLEPATHS]", samplepaths_str)
+            job_content = job_content.replace("[FRIEND]", f'\tmodule.AddFriend("{friend}");' if friend else "")
 
             # Handle reduction/max events
             maxevent_str = f'\tmodule.MaxEvent = std::max(1, static_cast<int>(module.fChain->GetEntries()/{int(reduction)}));'
             job_content = job_content.replace("[MAXEVENT]", maxevent_str)
 
-            # Set output path
+            # Set output path and options
             job_content = job_content.replace("[output]", output)
+            job_content = job_content.replace("[OUTPUTOPTIONS]", getOutputOptions(argparse, python=False))
             job_filename = os.path.join(working_dir, f"job_{i+1}.cc")
             with open(job_filename, 'w') as f:
                 f.write(job_content)
@@ -419,7 +460,7 @@ def makeMainAnalyzerJobs(working_dir,abs_MasterDirectoryName,totalNumberOfJobs,
     
     return job_dict
 
-def makeHaddJobs(working_dir,argparser,sample):
+def makeHaddJobs(working_dir,argparser,sample,totalNumberOfJobs):
     AnalyzerName = argparser.Analyzer
     if len(userflags) > 0:
         AnalyzerName += f"/{'_'.join(userflags)}"
@@ -428,11 +469,18 @@ def makeHaddJobs(working_dir,argparser,sample):
     if not os.path.exists(os.path.dirname(hadd_target)):
         os.makedirs(os.path.dirname(hadd_target))
 
-    template_path = os.path.join(SKNANO_HOME, "templates", "hadd.sh")
+    merge_template = "merge.sh" if argparser.Merger == "stream" else "hadd.sh"
+    template_path = os.path.join(SKNANO_HOME, "templates", merge_template)
     with open(template_path, 'r') as f:
         hadd_content = f.read()
     hadd_content = hadd_content.replace("[WORKDIR]", working_dir)
     hadd_content = hadd_content.replace("[TARGET]", hadd_target)
+    hadd_content = hadd_content.replace("[SKNANO_PYTHON]", os.environ['SKNANO_PYTHON'])
+    hadd_content = hadd_content.replace("[NJOBS]", str(totalNumberOfJobs))
+    hadd_content = hadd_content.replace("[FANIN]", str(argparser.MergeFanin))
+    hadd_content = hadd_content.replace("[TIMEOUT]", str(argparser.MergeTimeout))
+    hadd_content = hadd_content.replace("[WORKERS]", str(argparser.ncpu))
+    hadd_content = hadd_content.replace("[MERGEOPTIONS]", f"--compression {argparser.Compression}" if argparser.Compression else "")
     with open(os.path.join(working_dir,"hadd.sh"),'w') as f:
         f.write(hadd_content)
         
@@ -441,7 +489,8 @@ def makeHaddJobs(working_dir,argparser,sample):
     job_dict['JobBatchName'] = f"Hadd_{working_dir.split('/')[-1]}_{working_dir.split('/')[-2]}"
     job_dict['output'] = os.path.join(working_dir,"hadd.out")
     job_dict['error'] = os.path.join(working_dir,"hadd.err")
-    job_dict['request_cpus'] = 8
+    # the streaming merger runs for as long as the analyzer jobs, so it only asks for the cores it uses
+    job_dict['request_cpus'] = argparser.ncpu if argparser.Merger == "stream" else 8
     job_dict['request_memory'] = 8192
 
     return job_dict
@@ -571,10 +620,17 @@ def getFinalDag(hadd_layer_dicts,skim_postproc_layers,master_dir,argparser):
                 submit_description = analyzer_dict['submit_description'],
                 vars = analyzer_dict['vars']
             )
-            hadd_layer = analyzer_layer.child_layer(
-                name = hadd_dict['name'],
-                submit_description = hadd_dict['submit_description']
-            )
+            if argparser.Merger == "stream":
+                # the streaming merger watches the output directory and runs alongside the analyzer jobs
+                hadd_layer = dag.layer(
+                    name = hadd_dict['name'],
+                    submit_description = hadd_dict['submit_description']
+                )
+            else:
+                hadd_layer = analyzer_layer.child_layer(
+                    name = hadd_dict['name'],
+                    submit_description = hadd_dict['submit_description']
+                )
             hadd_layers.append(hadd_layer)
     
 
@@ -640,7 +696,7 @@ if __name__ == '__main__':
             if SKIMMING_MODE:
                 postproc_sub_dict = makeSkimPostProcsJobs(working_dir,sample,args,era)
             else:
-                hadd_sub_dict = makeHaddJobs(working_dir,args,sample)
+                hadd_sub_dict = makeHaddJobs(working_dir,args,sample,totalNumberofJobs)
             
             if SKIMMING_MODE:
                 dag_list.append({'era':era,'sample':sample,'analyzer_sub_dict':analyzer_sub_dict,'hadd_sub_dict':postproc_sub_dict,'totalNumberofJobs':totalNumberofJobs,'working_dir':working_dir,'batchname':f"{args.Analyzer}_{era}_{sample}"})
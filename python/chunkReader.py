@@ -0,0 +1,20 @@
+#Sequential chunked reading of a TTree or RNTuple into numpy arrays, used by mergeHists.py and reHist.py
+#Every chunk is read by a data frame limited to its own entry range, so the input is read once from the first to the last entry.
+#RDataFrame.Range(begin, end) instead runs the event loop from the first entry for every chunk.
+import ROOT
+
+def countEntries(treename, paths):
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    return ROOT.RDataFrame(treename, paths).Count().GetValue()
+
+def iterateChunks(treename, paths, columns, chunkSize, nEntries=None):
+    # yields (begin, arrays) with arrays the AsNumpy dictionary of entries [begin, begin+chunkSize)
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if nEntries is None:
+        nEntries = countEntries(treename, paths)
+    for begin in range(0, nEntries, chunkSize):
+        end = min(begin+chunkSize, nEntries)
+        spec = ROOT.RDF.Experimental.RDatasetSpec()
+        spec.AddSample(ROOT.RDF.Experimental.RSample("chunk", treename, paths))
+        spec.WithGlobalRange((begin, end))
+        yield begin, ROOT.RDataFrame(spec).AsNumpy(columns)
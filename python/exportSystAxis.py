@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import ROOT
+#This script converts histograms stored with a systematic axis (useSystAxis flag) back to the legacy layout
+#A systematic axis histogram is a TH2 whose title holds the legacy path template, e.g. "EMu/{syst}/jets/1/pt",
+#and whose y axis bins are labelled by the systematics. Each y bin is written as a 1D histogram to the legacy path
+#All other objects are copied as they are, so the output can be used directly by plotter.py
+ROOT.gROOT.SetBatch(True)
+ROOT.TH1.AddDirectory(False)
+
+def getDirectory(outfile, path):
+    if path == "":
+        return outfile
+    directory = outfile.GetDirectory(path)
+    if not directory:
+        outfile.mkdir(path, "", True)
+        directory = outfile.GetDirectory(path)
+    return directory
+
+def isSystAxisHist(obj):
+    return obj.InheritsFrom("TH2") and not obj.InheritsFrom("TH3") and "{syst}" in obj.GetTitle()
+
+def writeObject(outfile, path, obj):
+    prefix, _, name = path.rpartition("/")
+    getDirectory(outfile, prefix).WriteTObject(obj, name)
+
+def exportDirectory(indir, outfile, prefix=""):
+    nexported = 0
+    for key in indir.GetListOfKeys():
+        path = f"{prefix}/{key.GetName()}" if prefix else key.GetName()
+        if key.IsFolder() and not key.GetClassName().startswith("TTree"):
+            nexported += exportDirectory(key.ReadObj(), outfile, path)
+            continue
+        obj = key.ReadObj()
+        if isSystAxisHist(obj):
+            template = obj.GetTitle()
+            yaxis = obj.GetYaxis()
+            for ybin in range(1, yaxis.GetNbins()+1):
+                syst = yaxis.GetBinLabel(ybin)
+                proj = obj.ProjectionX(f"{obj.GetName()}_{syst}", ybin, ybin, "e")
+                proj.SetTitle("")
+                writeObject(outfile, template.replace("{syst}", syst), proj)
+                nexported += 1
+        elif obj.InheritsFrom("TTree"):
+            getDirectory(outfile, prefix).cd()
+            obj.CloneTree(-1, "fast").Write(key.GetName())
+        else:
+            writeObject(outfile, path, obj)
+    return nexported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export systematic axis histograms to the one-histogram-per-systematic layout")
+    parser.add_argument('input', help='Input ROOT file written with the useSystAxis flag')
+    parser.add_argument('output', help='Output ROOT file in the legacy layout')
+    args = parser.parse_args()
+
+    infile = ROOT.TFile.Open(args.input)
+    if not infile or infile.IsZombie():
+        raise FileNotFoundError(f"Cannot open {args.input}")
+    outfile = ROOT.TFile(args.output, "RECREATE")
+    nexported = exportDirectory(infile, outfile)
+    outfile.Close()
+    infile.Close()
+    print(f"Exported {nexported} histograms from {args.input} to {args.output}")
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import json
+import glob
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+#Streaming tree-reduction merge of analyzer outputs, replaces hadd -f -j 8 in the DAG
+#In watch mode, job outputs are merged in groups of fan-in files as soon as they are complete,
+#partial results are merged again in the same way, so the final merge only touches a few files.
+#Files holding only histograms are merged in memory (TH1::Add), anything else goes through TFileMerger.
+#With --groups, several outputs (e.g. samples into per-process totals) are merged in one call.
+#RNTuples are merged by TFileMerger, those listed in the SKNanoParquetTrees object of the output
+#are converted to <output>_<tree>.parquet after the final merge (requires pyarrow).
+
+def getCompressionSettings(compression):
+    import ROOT
+    if not compression:
+        return None
+    algorithm, level = compression.split(":")
+    algorithms = {"ZLIB": ROOT.RCompressionSetting.EAlgorithm.kZLIB,
+                  "LZMA": ROOT.RCompressionSetting.EAlgorithm.kLZMA,
+                  "LZ4": ROOT.RCompressionSetting.EAlgorithm.kLZ4,
+                  "ZSTD": ROOT.RCompressionSetting.EAlgorithm.kZSTD}
+    if algorithm.upper() not in algorithms:
+        raise ValueError(f"Unknown compression algorithm {algorithm}, choose from {', '.join(algorithms)}")
+    return ROOT.CompressionSettings(algorithms[algorithm.upper()], int(level))
+
+def walkKeys(directory, prefix=""):
+    for key in directory.GetListOfKeys():
+        path = f"{prefix}/{key.GetName()}" if prefix else key.GetName()
+        if key.IsFolder() and not key.GetClassName().startswith("TTree"):
+            yield from walkKeys(key.ReadObj(), path)
+        else:
+            yield path, key
+
+def isHistogramOnly(paths):
+    import ROOT
+    for path in paths:
+        f = ROOT.TFile.Open(path)
+        try:
+            for _, key in walkKeys(f):
+                cl = ROOT.TClass.GetClass(key.GetClassName())
+                if not cl or not cl.InheritsFrom("TH1"):
+                    return False
+        finally:
+            f.Close()
+    return True
+
+def mergeHistograms(inputs, output, compression):
+    import ROOT
+    ROOT.TH1.AddDirectory(False)
+    hists = {}
+    for path in inputs:
+        f = ROOT.TFile.Open(path)
+        # only the highest cycle of each key is merged, as hadd does
+        latest = {}
+        for histpath, key in walkKeys(f):
+            if histpath not in latest or key.GetCycle() > latest[histpath].GetCycle():
+                latest[histpath] = key
+        for histpath, key in latest.items():
+            obj = key.ReadObj()
+            if histpath in hists:
+                hists[histpath].Add(obj)
+            else:
+                obj.SetDirectory(ROOT.nullptr)
+                hists[histpath] = obj
+        f.Close()
+
+    outfile = ROOT.TFile(output, "RECREATE")
+    if compression is not None:
+        outfile.SetCompressionSettings(compression)
+    directories = {"": outfile}
+    for histpath in sorted(hists):
+        prefix, _, name = histpath.rpartition("/")
+        if prefix not in directories:
+            directories[prefix] = outfile.mkdir(prefix, "", True)
+        directories[prefix].WriteTObject(hists[histpath], name)
+    outfile.Close()
+
+def mergeGeneric(inputs, output, compression):
+    import ROOT
+    merger = ROOT.TFileMerger(False, False)
+    merger.SetPrintLevel(0)
+    if compression is not None:
+        merger.OutputFile(output, "RECREATE", compression)
+    else:
+        merger.OutputFile(output, "RECREATE")
+    for path in inputs:
+        if not merger.AddFile(path, False):
+            raise RuntimeError(f"Cannot add {path} to the merger")
+    if not merger.Merge():
+        raise RuntimeError(f"Failed to merge into {output}")
+
+def mergeFiles(inputs, output, compression="", histOnly=None):
+    # runs in the worker processes
+    import ROOT
+    ROOT.gROOT.SetBatch(True)
+    compressionSettings = getCompressionSettings(compression)
+    if histOnly is None:
+        histOnly = isHistogramOnly(inputs)
+    tmpOutput = output + ".tmp"
+    if histOnly:
+        mergeHistograms(inputs, tmpOutput, compressionSettings)
+    else:
+        mergeGeneric(inputs, tmpOutput, compressionSettings)
+    os.replace(tmpOutput, output)
+    return output
+
+def exportParquet(path, chunkSize=100000):
+    import ROOT
+    import numpy as np
+    from chunkReader import iterateChunks
+    f = ROOT.TFile.Open(path, "READ")
+    marker = f.Get("SKNanoParquetTrees")
+    treenames = str(marker.GetTitle()).split(",") if marker else []
+    f.Close()
+    if not treenames:
+        return []
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(f"{path} has Parquet outputs {', '.join(treenames)}, install pyarrow to convert them")
+
+    outputs = []
+    for treename in treenames:
+        output = path.replace(".root", f"_{treename}.parquet")
+        rdf = ROOT.RDataFrame(treename, path)
+        nEntries = rdf.Count().GetValue()
+        columns = [str(c) for c in rdf.GetColumnNames()]
+        writer = None
+        # one row group per chunk, so the whole ntuple is never held in memory
+        for _, arrays in iterateChunks(treename, path, columns, chunkSize, nEntries):
+            table = {}
+            for column in columns:
+                array = arrays[column]
+                if array.dtype == object:
+                    values = [np.asarray(v) for v in array]
+                    table[column] = pa.array(values, type=pa.list_(pa.from_numpy_dtype(values[0].dtype)))
+                else:
+                    table[column] = pa.array(array)
+            table = pa.table(table)
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            continue
+        writer.close()
+        outputs.append(output)
+        print(f"[mergeHists] Converted {treename} with {nEntries} entries to {output}")
+    return outputs
+
+def isComplete(path, settle):
+    # the analyzer opens its output at the start of the job, so the file exists long before it is closed.
+    # run.sh writes the exit code of the job to <output>.status once the output is closed,
+    # a failed job raises instead of leaving the merger waiting for the timeout
+    statusPath = os.path.splitext(path)[0] + ".status"
+    try:
+        with open(statusPath) as f:
+            status = f.read().strip()
+        if time.time() - os.path.getmtime(path) < settle:
+            return False
+    except FileNotFoundError:
+        return False
+    if status != "0":
+        raise RuntimeError(f"The job writing {path} failed with exit code {status}")
+    import ROOT
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal
+    f = ROOT.TFile.Open(path, "READ")
+    ROOT.gErrorIgnoreLevel = ROOT.kPrint
+    if not f or f.IsZombie():
+        return False
+    # a closed output without keys (nothing filled) is complete as well
+    complete = not f.TestBit(ROOT.TFile.kRecovered)
+    f.Close()
+    return complete
+
+class TreeMerger:
+    def __init__(self, output, fanin, workers, compression, histOnly, verbose=True):
+        self.output = output
+        self.fanin = max(fanin, 2)
+        self.workers = workers
+        self.compression = compression
+        self.histOnly = histOnly
+        self.verbose = verbose
+        self.workdir = os.path.dirname(os.path.abspath(output))
+        self.tag = os.path.basename(output).replace(".root", "")
+        self.levels = {}
+        self.running = {}
+        self.partials = set()
+        self.nPartials = 0
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def log(self, message):
+        if self.verbose:
+            print(f"[mergeHists] {message}", flush=True)
+
+    def add(self, paths):
+        self.levels.setdefault(0, []).extend(paths)
+
+    def submit(self, level, group, output=None):
+        if output is None:
+            output = os.path.join(self.workdir, f".{self.tag}_merge_L{level+1}_{self.nPartials}.root")
+            self.nPartials += 1
+            self.partials.add(output)
+        future = self.executor.submit(mergeFiles, group, output, self.compression, self.histOnly)
+        self.running[future] = (level + 1, group, output)
+        self.log(f"Merging {len(group)} files at level {level} into {os.path.basename(output)}")
+
+    def schedule(self):
+        for level in sorted(self.levels):
+            files = self.levels[level]
+            while len(files) >= self.fanin:
+                group, files[:] = files[:self.fanin], files[self.fanin:]
+                self.submit(level, group)
+
+    def collect(self, timeout=None):
+        if not self.running:
+            return
+        done, _ = wait(list(self.running), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            level, group, output = self.running.pop(future)
+            future.result()
+            for path in group:
+                if path in self.partials:
+                    os.remove(path)
+                    self.partials.discard(path)
+            if output != self.output:
+                self.levels.setdefault(level, []).append(output)
+
+    def finish(self):
+        while self.running:
+            self.collect()
+            self.schedule()
+        remaining = [path for level in sorted(self.levels) for path in self.levels[level]]
+        self.levels = {}
+        # reduce whatever is left to at most fan-in files, then do the final merge
+        while len(remaining) > self.fanin:
+            groups = [remaining[i:i+self.fanin] for i in range(0, len(remaining), self.fanin)]
+            remaining = []
+            for group in groups:
+                if len(group) == 1:
+                    remaining.extend(group)
+                else:
+                    self.submit(-1, group)
+            while self.running:
+                self.collect()
+                remaining.extend(self.levels.pop(0, []))
+        if len(remaining) == 1 and remaining[0] in self.partials:
+            os.replace(remaining[0], self.output)
+            self.partials.discard(remaining[0])
+        else:
+            self.submit(-1, remaining, self.output)
+            while self.running:
+                self.collect()
+        self.executor.shutdown()
+
+def mergeList(inputs, output, args):
+    histOnly = True if args.histonly else None
+    merger = TreeMerger(output, args.fanin, args.workers, args.compression, histOnly)
+    merger.add(inputs)
+    merger.schedule()
+    merger.finish()
+
+def mergeWatch(args):
+    histOnly = True if args.histonly else None
+    merger = TreeMerger(args.output, args.fanin, args.workers, args.compression, histOnly)
+    seen = set()
+    start = time.time()
+    while len(seen) < args.expected:
+        if args.timeout > 0 and time.time() - start > args.timeout:
+            merger.executor.shutdown(cancel_futures=True)
+            raise TimeoutError(f"Only {len(seen)}/{args.expected} inputs appeared in {args.watch} within {args.timeout} seconds")
+        candidates = sorted(glob.glob(os.path.join(args.watch, args.pattern)))
+        try:
+            ready = [path for path in candidates if path not in seen and isComplete(path, args.settle)]
+        except RuntimeError:
+            merger.executor.shutdown(cancel_futures=True)
+            raise
+        if ready:
+            seen.update(ready)
+            merger.log(f"{len(seen)}/{args.expected} inputs ready")
+            merger.add(ready)
+            merger.schedule()
+        merger.collect(timeout=args.poll)
+        if not merger.running and not ready:
+            time.sleep(args.poll)
+    merger.finish()
+    return sorted(seen)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming tree-reduction merge of histogram outputs")
+    parser.add_argument('inputs', nargs='*', help='Input ROOT files')
+    parser.add_argument('-o', '--output', dest='output', default="", help='Output ROOT file')
+    parser.add_argument('--watch', dest='watch', default="", help='Directory to watch for job outputs')
+    parser.add_argument('--pattern', dest='pattern', default="hists_*.root", help='Glob pattern of the job outputs in the watched directory')
+    parser.add_argument('--expected', dest='expected', default=0, type=int, help='Number of job outputs to wait for in watch mode')
+    parser.add_argument('--groups', dest='groups', default="", help='JSON file of {output: [inputs]}, e.g. samples merged into per-process totals')
+    parser.add_argument('--fanin', dest='fanin', default=8, type=int, help='Number of files merged at once')
+    parser.add_argument('--workers', dest='workers', default=4, type=int, help='Number of parallel merge processes')
+    parser.add_argument('--compression', dest='compression', default="", help='Output compression as ALGORITHM:LEVEL, e.g. ZSTD:5')
+    parser.add_argument('--histonly', action='store_true', default=False, help='Skip the content check and always use the histogram fast path')
+    parser.add_argument('--poll', dest='poll', default=10., type=float, help='Polling interval in seconds in watch mode')
+    parser.add_argument('--settle', dest='settle', default=30., type=float, help='Seconds a file must be unmodified before it is merged in watch mode, its .status file has to report 0 as well')
+    parser.add_argument('--timeout', dest='timeout', default=0., type=float, help='Give up waiting for inputs after this many seconds, 0 for no limit')
+    parser.add_argument('--delete-inputs', dest='delete_inputs', action='store_true', default=False, help='Remove the inputs after a successful merge')
+    parser.add_argument('--no-parquet', dest='no_parquet', action='store_true', default=False, help='Do not convert the Parquet outputs after the merge')
+    parser.add_argument('--export-parquet', dest='export_parquet', action='store_true', default=False, help='Only convert the Parquet outputs of the already merged input files')
+    args = parser.parse_args()
+
+    if args.export_parquet:
+        if not args.inputs:
+            parser.error("--export-parquet needs the merged files as inputs")
+        for path in args.inputs:
+            exportParquet(path)
+        sys.exit(0)
+
+    if args.groups:
+        with open(args.groups) as f:
+            groups = json.load(f)
+        for output, inputs in groups.items():
+            mergeList(inputs, output, args)
+            print(f"[mergeHists] Merged {len(inputs)} files into {output}")
+        consumed = [path for inputs in groups.values() for path in inputs]
+        outputs = list(groups)
+    elif args.watch:
+        if not args.output or args.expected <= 0:
+            parser.error("--watch requires --output and --expected")
+        consumed = mergeWatch(args)
+        print(f"[mergeHists] Merged {len(consumed)} files into {args.output}")
+        outputs = [args.output]
+    else:
+        if not args.output or not args.inputs:
+            parser.error("give an --output and at least one input")
+        consumed = args.inputs
+        mergeList(consumed, args.output, args)
+        print(f"[mergeHists] Merged {len(consumed)} files into {args.output}")
+        outputs = [args.output]
+
+    if not args.no_parquet:
+        for output in outputs:
+            exportParquet(output)
+
+    if args.delete_inputs:
+        for path in consumed:
+            os.remove(path)
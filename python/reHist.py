@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import json
+import argparse
+import numpy as np
+import ROOT
+from chunkReader import countEntries, iterateChunks
+#This script makes histograms from the slim event cache written with AnalyzerCore::EnableEventCache
+#The cache holds the declared variables, the cut bits, the weights and the integer coded labels of every cached event.
+#Binnings, cuts and selections can be changed freely without rerunning the event loop.
+#Histograms are written to {label values}/{weight}/{variable}, e.g. EMu/Central/pt with --split channel
+#
+#Examples:
+#  python3 reHist.py DY.root -o DY_rebin.root --var pt:50:0:200 --var mll:60,80,100,120 --cuts PassMETFilter
+#  python3 reHist.py DY.root -o DY_onZ.root --define "dmll=abs(mll-91.2)" --var dmll:30:0:30 --select "nJets >= 2"
+ROOT.gROOT.SetBatch(True)
+ROOT.TH1.AddDirectory(False)
+
+def readCacheInfo(path):
+    f = ROOT.TFile.Open(path)
+    if not f or f.IsZombie():
+        raise FileNotFoundError(f"Cannot open {path}")
+    info = f.Get("SKNanoEventCache")
+    if not info:
+        raise ValueError(f"{path} has no SKNanoEventCache, was it written with EnableEventCache?")
+    info = json.loads(str(info.GetTitle()))
+    f.Close()
+    return info
+
+def parseBinning(spec):
+    # VAR:NBINS:LO:HI for uniform bins, VAR:E0,E1,...,EN for variable bins
+    name, _, binning = spec.partition(":")
+    if "," in binning:
+        edges = np.array([float(e) for e in binning.split(",")])
+    else:
+        nbins, lo, hi = binning.split(":")
+        edges = np.linspace(float(lo), float(hi), int(nbins)+1)
+    return name, edges
+
+def binIndices(values, edges):
+    # ROOT convention: 0 is the underflow, len(edges) is the overflow, the upper edge belongs to the overflow
+    return np.searchsorted(edges, values, side="right")
+
+class ReHistogrammer:
+    def __init__(self, info, variables, weights, split):
+        self.info = info
+        self.variables = variables
+        self.weights = weights
+        self.split = split
+        # combined label code of an event, the first label varies slowest
+        self.strides = []
+        stride = 1
+        for label in reversed(split):
+            self.strides.insert(0, stride)
+            stride *= len(info["labels"][label])
+        self.nCombinations = stride
+        self.sumw = {}
+        self.sumw2 = {}
+        self.entries = {}
+        for name, edges in variables:
+            nbins = len(edges) + 1
+            self.entries[name] = np.zeros(self.nCombinations*nbins)
+            for weight in weights:
+                self.sumw[(name, weight)] = np.zeros(self.nCombinations*nbins)
+                self.sumw2[(name, weight)] = np.zeros(self.nCombinations*nbins)
+
+    def fill(self, columns, mask):
+        combination = np.zeros(np.count_nonzero(mask), dtype=np.int64)
+        for label, stride in zip(self.split, self.strides):
+            combination += columns[label][mask].astype(np.int64) * stride
+        for name, edges in self.variables:
+            nbins = len(edges) + 1
+            flat = combination*nbins + binIndices(columns[name][mask], edges)
+            size = self.nCombinations*nbins
+            self.entries[name] += np.bincount(flat, minlength=size)
+            for weight in self.weights:
+                w = columns[f"weight_{weight}"][mask].astype(np.float64)
+                self.sumw[(name, weight)] += np.bincount(flat, weights=w, minlength=size)
+                self.sumw2[(name, weight)] += np.bincount(flat, weights=w*w, minlength=size)
+
+    def labelPath(self, combination):
+        values = []
+        for label, stride in zip(self.split, self.strides):
+            values.append(self.info["labels"][label][(combination // stride) % len(self.info["labels"][label])])
+        return "/".join(values)
+
+    def write(self, output):
+        outfile = ROOT.TFile(output, "RECREATE")
+        directories = {}
+        nhists = 0
+        for name, edges in self.variables:
+            nbins = len(edges) + 1
+            entries = self.entries[name].reshape(self.nCombinations, nbins)
+            for weight in self.weights:
+                sumw = self.sumw[(name, weight)].reshape(self.nCombinations, nbins)
+                sumw2 = self.sumw2[(name, weight)].reshape(self.nCombinations, nbins)
+                for combination in range(self.nCombinations):
+                    if entries[combination].sum() == 0:
+                        continue
+                    prefix = "/".join(p for p in (self.labelPath(combination), weight) if p)
+                    if prefix not in directories:
+                        directories[prefix] = outfile.mkdir(prefix, "", True)
+                    hist = ROOT.TH1D(name, "", len(edges)-1, edges)
+                    hist.Sumw2()
+                    hist.SetContent(np.ascontiguousarray(sumw[combination]))
+                    hist.SetError(np.sqrt(sumw2[combination]))
+                    hist.SetEntries(entries[combination].sum())
+                    directories[prefix].WriteTObject(hist, name)
+                    nhists += 1
+        outfile.Close()
+        return nhists
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make histograms from the slim event cache")
+    parser.add_argument('inputs', nargs='+', help='ROOT files with an event cache')
+    parser.add_argument('-o', '--output', dest='output', required=True, help='Output ROOT file')
+    parser.add_argument('--var', dest='var', action='append', default=[], help='VAR:NBINS:LO:HI or VAR:E0,E1,...,EN, can be repeated')
+    parser.add_argument('--define', dest='define', action='append', default=[], help='NAME=EXPR, new variable as a numpy expression of the cached columns')
+    parser.add_argument('--cuts', dest='cuts', default="", help='Comma separated cached cuts the events have to pass')
+    parser.add_argument('--select', dest='select', default="", help='Additional selection as a numpy expression of the cached columns')
+    parser.add_argument('--weights', dest='weights', default="", help='Comma separated weights to use, default is all cached weights')
+    parser.add_argument('--split', dest='split', default="", help='Comma separated labels to split the histograms by, default is all labels')
+    parser.add_argument('--chunk', dest='chunk', default=1000000, type=int, help='Number of events read at once')
+    args = parser.parse_args()
+
+    info = readCacheInfo(args.inputs[0])
+    variables = [parseBinning(spec) for spec in args.var]
+    if not variables:
+        parser.error("give at least one --var")
+    defines = [d.split("=", 1) for d in args.define]
+    weights = args.weights.split(",") if args.weights else info["weights"]
+    split = args.split.split(",") if args.split else list(info["labels"])
+    for weight in weights:
+        if weight not in info["weights"]:
+            parser.error(f"Weight {weight} is not cached, choose from {', '.join(info['weights'])}")
+    for label in split:
+        if label not in info["labels"]:
+            parser.error(f"Label {label} is not cached, choose from {', '.join(info['labels'])}")
+    cutMask = 0
+    for cut in (args.cuts.split(",") if args.cuts else []):
+        if cut not in info["cuts"]:
+            parser.error(f"Cut {cut} is not cached, choose from {', '.join(info['cuts'])}")
+        cutMask |= 1 << info["cuts"].index(cut)
+
+    columns = ["cutbits"] + split + [f"weight_{w}" for w in weights]
+    columns += [v for v in info["variables"] if v not in columns]
+    nEntries = countEntries(info["tree"], args.inputs)
+    histogrammer = ReHistogrammer(info, variables, weights, split)
+    for _, arrays in iterateChunks(info["tree"], args.inputs, columns, args.chunk, nEntries):
+        arrays = dict(arrays)
+        namespace = {"np": np, "abs": np.abs}
+        namespace.update(arrays)
+        for name, expr in defines:
+            arrays[name] = eval(expr, namespace)
+            namespace[name] = arrays[name]
+        for name, _ in variables:
+            if name not in arrays:
+                parser.error(f"Variable {name} is neither cached nor defined")
+        mask = (arrays["cutbits"].astype(np.uint64) & np.uint64(cutMask)) == np.uint64(cutMask)
+        if args.select:
+            mask &= np.asarray(eval(args.select, namespace), dtype=bool)
+        histogrammer.fill(arrays, mask)
+    nhists = histogrammer.write(args.output)
+    print(f"Made {nhists} histograms from {nEntries} cached events in {args.output}")
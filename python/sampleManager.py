@@ -227,7 +227,8 @@ def makeSkimTreeInfo(era,skimTreeFolder,skimTreeSuffix,skimTreeOrigPD):
             if file.endswith('.root'):
                 filePaths.append(os.path.join(root,file))
 
-    filePaths = sorted(filePaths,key=lambda x: int(x.split('tree_')[-1].split('.root')[0]))
+    # per-input skim outputs are named tree_<job>_<input>.root
+    filePaths = sorted(filePaths,key=lambda x: tuple(int(i) for i in x.split('tree_')[-1].split('.root')[0].split('_')))
     if isMC:
         skimPathInfoJson = os.path.join(skimJsonFolderPath,f'Skim_{skimTreeSuffix}_{skimTreeOrigPD}.json')
     else:
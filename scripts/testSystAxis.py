@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+import tempfile
+import ROOT
+from ROOT import TString
+from ROOT.VecOps import RVec
+#Checks the DiLepton output with and without the useSystAxis flag
+#DiLepton is run twice on the same input, the systematic axis output is split back with python/exportSystAxis.py
+#and every histogram has to match the legacy output bin by bin.
+#With --python the PyAnalyzers version is run, which fills through HistBuffer.
+#e.g. python3 scripts/testSystAxis.py --input NANOAOD_255.root --maxevent 2000
+ROOT.gROOT.SetBatch(True)
+ROOT.TH1.AddDirectory(False)
+sys.path.append(f"{os.environ['SKNANO_HOME']}/python")
+sys.path.append(f"{os.environ['SKNANO_HOME']}/PyAnalyzers")
+from exportSystAxis import exportDirectory, isSystAxisHist
+
+def runDiLepton(args, userflags, output):
+    if args.python:
+        from DiLepton import DiLepton
+    else:
+        from ROOT import DiLepton
+    module = DiLepton()
+    module.SetTreeName("Events")
+    module.LogEvery = 5000
+    module.IsDATA = False
+    module.MCSample = args.sample
+    module.xsec = 1.
+    module.sumW = 1.
+    module.sumSign = 1.
+    module.SetEra(args.era)
+    module.Userflags = RVec(TString)(userflags)
+    module.AddFile(args.input)
+    module.MaxEvent = args.maxevent if args.maxevent > 0 else int(module.fChain.GetEntries())
+    module.SetOutfilePath(output)
+    module.Init()
+    if args.python:
+        module.initializePyAnalyzer()
+    else:
+        module.initializeAnalyzer()
+    module.Loop()
+    module.WriteHist()
+
+def collectHists(directory, prefix="", hists=None):
+    # path -> histogram for every histogram in the file, trees are skipped
+    hists = {} if hists is None else hists
+    for key in directory.GetListOfKeys():
+        path = f"{prefix}/{key.GetName()}" if prefix else key.GetName()
+        if key.IsFolder() and not key.GetClassName().startswith("TTree"):
+            collectHists(key.ReadObj(), path, hists)
+        elif key.GetClassName().startswith("TH"):
+            hists[path] = key.ReadObj()
+    return hists
+
+def countSystAxisHists(directory):
+    n = 0
+    for key in directory.GetListOfKeys():
+        if key.IsFolder() and not key.GetClassName().startswith("TTree"):
+            n += countSystAxisHists(key.ReadObj())
+        elif key.GetClassName().startswith("TH2") and isSystAxisHist(key.ReadObj()):
+            n += 1
+    return n
+
+def compareHists(legacy, exported, tolerance):
+    # returns the list of mismatches as strings
+    mismatches = []
+    for path in sorted(set(legacy) | set(exported)):
+        if path not in exported:
+            mismatches.append(f"{path}: missing in the systematic axis output")
+            continue
+        if path not in legacy:
+            mismatches.append(f"{path}: missing in the legacy output")
+            continue
+        h_legacy, h_exported = legacy[path], exported[path]
+        if h_legacy.GetNcells() != h_exported.GetNcells():
+            mismatches.append(f"{path}: {h_legacy.GetNcells()} bins in the legacy output, {h_exported.GetNcells()} in the systematic axis output")
+            continue
+        # only the first differing bin of each histogram is reported
+        differs = lambda a, b: abs(a - b) > tolerance * max(abs(a), abs(b), 1.)
+        for i in range(h_legacy.GetNcells()):
+            if differs(h_legacy.GetBinContent(i), h_exported.GetBinContent(i)) or differs(h_legacy.GetBinError(i), h_exported.GetBinError(i)):
+                mismatches.append(f"{path}: bin {i} {h_legacy.GetBinContent(i)} +- {h_legacy.GetBinError(i)} != {h_exported.GetBinContent(i)} +- {h_exported.GetBinError(i)}")
+                break
+    return mismatches
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the DiLepton output with and without the useSystAxis flag")
+    parser.add_argument('--input', dest='input', required=True, help='NanoAOD input file')
+    parser.add_argument('--era', dest='era', default="2022")
+    parser.add_argument('--sample', dest='sample', default="TTLL_powheg")
+    parser.add_argument('--channel', dest='channel', default="RunEMu", help='RunEMu or RunDiMu')
+    parser.add_argument('--maxevent', dest='maxevent', default=-1, type=int)
+    parser.add_argument('--python', dest='python', action='store_true', default=False, help='Run PyAnalyzers/DiLepton.py')
+    parser.add_argument('--tolerance', dest='tolerance', default=1e-6, type=float)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy_path = os.path.join(tmpdir, "legacy.root")
+        systaxis_path = os.path.join(tmpdir, "systaxis.root")
+        exported_path = os.path.join(tmpdir, "exported.root")
+        runDiLepton(args, [args.channel, "RunSyst"], legacy_path)
+        runDiLepton(args, [args.channel, "RunSyst", "useSystAxis"], systaxis_path)
+
+        systaxis_file = ROOT.TFile.Open(systaxis_path)
+        nsystaxis = countSystAxisHists(systaxis_file)
+        exported_file = ROOT.TFile(exported_path, "RECREATE")
+        exportDirectory(systaxis_file, exported_file)
+        exported_file.Close()
+        systaxis_file.Close()
+
+        legacy_file = ROOT.TFile.Open(legacy_path)
+        exported_file = ROOT.TFile.Open(exported_path)
+        legacy = collectHists(legacy_file)
+        exported = collectHists(exported_file)
+        mismatches = compareHists(legacy, exported, args.tolerance)
+        legacy_file.Close()
+        exported_file.Close()
+
+    if nsystaxis == 0:
+        mismatches.append("no systematic axis histogram in the output with useSystAxis")
+    for mismatch in mismatches:
+        print(f"[testSystAxis] {mismatch}")
+    if mismatches:
+        print(f"[testSystAxis] FAILED: {len(mismatches)} mismatches in {len(legacy)} histograms")
+        sys.exit(1)
+    print(f"[testSystAxis] OK: {len(legacy)} histograms match, {nsystaxis} stored with a systematic axis")
@@ -123,6 +123,10 @@ export SKNANO_RUN2_NANOAODPATH="/gv0/DATA/SKNano/Run2NanoAODv9p1"
 
 export LD_LIBRARY_PATH=$LD_LIBRARY_PATH:$SKNANO_LIB
 export DYLD_LIBRARY_PATH=$DYLD_LIBRARY_PATH:$SKNANO_LIB
+# precompiled C++ modules of the SKNano libraries, see SKNANO_CXXMODULES in CMakeLists.txt
+if [ -f $SKNANO_INSTALLDIR/include/module.modulemap ]; then
+    export CLING_MODULEMAP_FILES=$SKNANO_INSTALLDIR/include/module.modulemap
+fi
 
 # setting LHAPDFs
 if [[ ! -d "external/lhapdf/$SYSTEM" ]]; then
@@ -6,5 +6,6 @@ micromamba activate Nano
 
 cd [WORKDIR]
 hadd -f -j 8 [TARGET] output/hists_*.root
+python3 [SKNANO_PYTHON]/mergeHists.py --export-parquet [TARGET]
 rm output/hists_*.root
 exit $?
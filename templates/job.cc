@@ -14,8 +14,10 @@ void [jobname]() {
     module.SetPeriod("[period]");
 [USERFLAGS]
 [SAMPLEPATHS]
+[FRIEND]
 [MAXEVENT]
     module.SetOutfilePath("[output]");
+[OUTPUTOPTIONS]
     module.Init();
     module.initializeAnalyzer();
     module.Loop();
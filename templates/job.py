@@ -1,12 +1,28 @@
-import os, sys
+import os, sys, time
+# startup profiling, the report is printed with --profile-startup
+startup = [("interpreter", float(os.getenv("SKNANO_JOB_START", time.time())), time.time())]
 sys.path.append(f"{os.getenv("SKNANO_HOME")}/PyAnalyzers")
+start = time.time()
+import ROOT
 from ROOT import TString
 from ROOT.VecOps import RVec
+startup.append(("ROOT", start, time.time()))
+start = time.time()
 from [Analyzer] import [Analyzer]
+startup.append(("dictionaries", start, time.time()))
+
+def printStartupProfile(startup):
+    total = sum(end-begin for _, begin, end in startup)
+    print("[job.py] Startup profile")
+    for step, begin, end in startup:
+        print(f"[job.py]   {step:<32} {end-begin:8.2f}s {100.*(end-begin)/total:6.1f}%")
+    print(f"[job.py]   {'total':<32} {total:8.2f}s")
 
 if __name__ == "__main__":
+    start = time.time()
     module = [Analyzer]()
     module.SetTreeName("Events")
+    startup.append(("dictionaries (analyzer instance)", start, time.time()))
     module.LogEvery = 5000
     module.IsDATA = False
     module.MCSample = "[sample]"
@@ -17,9 +33,22 @@ if __name__ == "__main__":
     module.SetPeriod("[period]")
 [USERFLAGS]
 [SAMPLEPATHS]
+[FRIEND]
 [MAXEVENT]
     module.SetOutfilePath("[output]")
+[OUTPUTOPTIONS]
+    start = time.time()
     module.Init()
+    startup.append(("Init", start, time.time()))
+    start = time.time()
     module.initializePyAnalyzer()
+    startup.append(("initializePyAnalyzer", start, time.time()))
+    if [PROFILESTARTUP]:
+        # correction payloads are loaded on first access, load all of them here so the cost is not hidden in the first events
+        if module.myCorr:
+            start = time.time()
+            module.myCorr.Preload(["all"])
+            startup.append(("MyCorrection load (all payloads)", start, time.time()))
+        printStartupProfile(startup)
     module.Loop()
     module.WriteHist()
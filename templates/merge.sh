@@ -0,0 +1,9 @@
+#!/bin/bash
+export PATH="/opt/conda/bin:${PATH}"
+export MAMBA_ROOT_PREFIX="/opt/conda"
+eval "$(micromamba shell hook -s bash)"
+micromamba activate Nano
+
+cd [WORKDIR]
+python3 [SKNANO_PYTHON]/mergeHists.py -o [TARGET] --watch output --pattern "hists_*.root" --expected [NJOBS] --fanin [FANIN] --workers [WORKERS] --timeout [TIMEOUT] --delete-inputs [MERGEOPTIONS]
+exit $?
@@ -24,8 +24,17 @@ export LD_LIBRARY_PATH=$LD_LIBRARY_PATH:$CORRECTION_LIB_DIR:[SKNANO_RUNLOG_LIB]
 
 export ROOT_HIST=0
 export ROOT_INCLUDE_PATH=[ROOT_INCLUDE_PATH]
+if [ -f [SKNANO_RUNLOG_LIB]/../include/module.modulemap ]; then
+    export CLING_MODULEMAP_FILES=[SKNANO_RUNLOG_LIB]/../include/module.modulemap
+fi
 
 cd [WORKDIR]
 
+export SKNANO_JOB_START=$(date +%s.%N)
 python job_$1.py
-exit $?
\ No newline at end of file
+status=$?
+# the streaming merger (mergeHists.py --watch) takes an output once its job reported 0 and stops when a job failed
+if [ -d output ]; then
+    echo $status > output/hists_$(($1-1)).status
+fi
+exit $status
\ No newline at end of file
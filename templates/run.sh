@@ -28,4 +28,9 @@ export ROOT_INCLUDE_PATH=[ROOT_INCLUDE_PATH]
 cd [WORKDIR]
 
 root -l -b -q job_$1.cc
-exit $?
+status=$?
+# the streaming merger (mergeHists.py --watch) takes an output once its job reported 0 and stops when a job failed
+if [ -d output ]; then
+    echo $status > output/hists_$(($1-1)).status
+fi
+exit $status